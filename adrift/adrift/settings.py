@@ -1,6 +1,5 @@
 import os
-from datetime import timedelta, datetime
-from logging.handlers import TimedRotatingFileHandler
+from datetime import timedelta
 
 """
 Django settings for adrift project.
@@ -58,7 +57,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'core.utils.GraphQLLoggingMiddleware'
+    'core.middlewares.GraphQLLoggingMiddleware'
 ]
 
 ROOT_URLCONF = 'adrift.urls'
@@ -95,9 +94,65 @@ DATABASES = {
         "PASSWORD": os.environ.get("SQL_PASSWORD", "password"),
         "HOST": os.environ.get("SQL_HOST", "localhost"),
         "PORT": os.environ.get("SQL_PORT", "5432"),
+        # seconds a connection is kept open for the next requests of the thread (0 = closed after
+        # every request), must be 0 with the pooled backend
+        "CONN_MAX_AGE": int(os.environ.get("SQL_CONN_MAX_AGE", 0)),
+        # persistent & pooled connections are checked before they are reused
+        "CONN_HEALTH_CHECKS": bool(int(os.environ.get("SQL_CONN_HEALTH_CHECKS", 1))),
+        # pgbouncer in transaction pooling mode may hand every transaction another server
+        # connection, so the server side cursors of .iterator() cannot be used
+        "DISABLE_SERVER_SIDE_CURSORS": bool(int(os.environ.get("SQL_PGBOUNCER", 0))),
+        "OPTIONS": {},
     }
 }
 
+# SQL_ENGINE=core.db.postgresql pools the connections of each process (see core.db.pool)
+if DATABASES["default"]["ENGINE"] == "core.db.postgresql":
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.environ.get("SQL_POOL_MIN_SIZE", 1)),
+        "max_size": int(os.environ.get("SQL_POOL_MAX_SIZE", 4)),
+        # seconds to wait for a connection when all of them are in use
+        "timeout": float(os.environ.get("SQL_POOL_TIMEOUT", 10)),
+        "max_idle": float(os.environ.get("SQL_POOL_MAX_IDLE", 600)),
+        "max_lifetime": float(os.environ.get("SQL_POOL_MAX_LIFETIME", 3600)),
+    }
+
+# read replicas of the primary, e.g. SQL_REPLICA_HOSTS="replica-1 replica-2", the reads of graphql
+# queries are routed to them (see core.db.routers), tests read from the primary instead
+for index, host in enumerate(os.environ.get("SQL_REPLICA_HOSTS", "").split()):
+    DATABASES[f"replica_{index}"] = {
+        **DATABASES["default"],
+        "HOST": host,
+        "OPTIONS": dict(DATABASES["default"]["OPTIONS"]),
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["core.db.routers.ReplicaRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# the cache shared by every process, e.g. REDIS_URL=redis://redis:6379/0, without it (e.g. in
+# tests) each process caches in memory on its own & GRAPHQL_JWT_CLAIMS can't be enabled
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+            "KEY_PREFIX": os.environ.get("CACHE_KEY_PREFIX", "adrift"),
+            "TIMEOUT": int(os.environ.get("CACHE_TIMEOUT", 300)),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "adrift",
+            "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("CACHE_MAX_ENTRIES", 10000))},
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -149,11 +204,12 @@ GRAPHENE = {
     'SCHEMA': 'api.graphql.schema.schema', # this file doesn't exist yet
     'MIDDLEWARE': [
         'graphql_jwt.middleware.JSONWebTokenMiddleware',
+        'core.middlewares.ResolverMetricsMiddleware',
     ],
 }
 
 AUTHENTICATION_BACKENDS = [
-    'graphql_auth.backends.GraphQLAuthBackend',
+    'core.auth.ClaimsJSONWebTokenBackend',
     'django.contrib.auth.backends.ModelBackend',
 ]
 
@@ -165,6 +221,7 @@ GRAPHQL_JWT = {
     'JWT_REFRESH_EXPIRATION_DELTA': timedelta(days=7),    
     'JWT_SECRET_KEY': os.environ.get('JWT_SECRET'),
     'JWT_ALGORITHM': 'HS256',
+    'JWT_PAYLOAD_HANDLER': 'core.auth.jwt_payload',
     "JWT_ALLOW_ANY_CLASSES": [
         "graphql_auth.relay.Register",
         "graphql_auth.relay.VerifyAccount",
@@ -178,6 +235,39 @@ GRAPHQL_JWT = {
     ],
 }
 
+# tuning for the shared graphql layer in `core`, see core/settings.py for every available key
+CORE = {
+    "COUNT_MAX": int(os.environ.get("GRAPHQL_COUNT_MAX", 0)) or None,
+    "COUNT_CACHE_TIMEOUT": int(os.environ.get("GRAPHQL_COUNT_CACHE_TIMEOUT", 5)),
+    "ROLE_CACHE_TIMEOUT": int(os.environ.get("GRAPHQL_ROLE_CACHE_TIMEOUT", 60)),
+    "JWT_CLAIMS": bool(int(os.environ.get("GRAPHQL_JWT_CLAIMS", 0))),
+    "LOG_BODY_SAMPLE_RATE": float(os.environ.get("GRAPHQL_LOG_BODY_SAMPLE_RATE", 0.01)),
+    "LOG_BODY_MAX_LENGTH": int(os.environ.get("GRAPHQL_LOG_BODY_MAX_LENGTH", 2048)),
+    "RESOLVER_LOG_SAMPLE_RATE": float(os.environ.get("GRAPHQL_RESOLVER_LOG_SAMPLE_RATE", 0)),
+    "PERSISTED_QUERIES": bool(int(os.environ.get("GRAPHQL_PERSISTED_QUERIES", 1))),
+    "DOCUMENT_CACHE_SIZE": int(os.environ.get("GRAPHQL_DOCUMENT_CACHE_SIZE", 1000)),
+    "PERSISTED_QUERY_CACHE_TIMEOUT": int(os.environ.get("GRAPHQL_PERSISTED_QUERY_CACHE_TIMEOUT", 60 * 60 * 24)),
+    "RESPONSE_CACHE": bool(int(os.environ.get("GRAPHQL_RESPONSE_CACHE", 0))),
+    "RESPONSE_CACHE_AUTHENTICATED": bool(int(os.environ.get("GRAPHQL_RESPONSE_CACHE_AUTHENTICATED", 0))),
+    "ASYNC_VIEW": bool(int(os.environ.get("GRAPHQL_ASYNC_VIEW", 0))),
+    "BATCH_MAX_OPERATIONS": int(os.environ.get("GRAPHQL_BATCH_MAX_OPERATIONS", 20)),
+    "BATCH_CONCURRENT": bool(int(os.environ.get("GRAPHQL_BATCH_CONCURRENT", 0))),
+    "QUERY_MAX_DEPTH": int(os.environ.get("GRAPHQL_QUERY_MAX_DEPTH", 10)) or None,
+    "QUERY_MAX_COST": int(os.environ.get("GRAPHQL_QUERY_MAX_COST", 5000)) or None,
+    "TRACING": bool(int(os.environ.get("GRAPHQL_TRACING", 0))),
+    "METRICS_TOKEN": os.environ.get("GRAPHQL_METRICS_TOKEN") or None,
+    "REPEATED_QUERY_THRESHOLD": int(os.environ.get("GRAPHQL_REPEATED_QUERY_THRESHOLD", 10)) or None,
+    "BULK_MUTATION_MAX_ITEMS": int(os.environ.get("GRAPHQL_BULK_MUTATION_MAX_ITEMS", 10000)),
+    "LOCAL_CACHE_SIZE": int(os.environ.get("GRAPHQL_LOCAL_CACHE_SIZE", 1000)),
+    "LOCAL_CACHE_TIMEOUT": int(os.environ.get("GRAPHQL_LOCAL_CACHE_TIMEOUT", 5)),
+    "MODEL_CACHE_TIMEOUT": int(os.environ.get("GRAPHQL_MODEL_CACHE_TIMEOUT", 300)),
+    "JSON_ENCODER": os.environ.get("GRAPHQL_JSON_ENCODER") or None,
+    "EXPORT_CHUNK_SIZE": int(os.environ.get("GRAPHQL_EXPORT_CHUNK_SIZE", 1000)),
+    "REPLICA_DATABASES": [alias for alias in DATABASES if alias != "default"],
+    "REPLICA_EJECT_TIMEOUT": int(os.environ.get("GRAPHQL_REPLICA_EJECT_TIMEOUT", 30)),
+    "READ_YOUR_WRITES_TIMEOUT": int(os.environ.get("GRAPHQL_READ_YOUR_WRITES_TIMEOUT", 5)),
+}
+
 GRAPHQL_AUTH = {
     "LOGIN_ALLOWED_FIELDS": ["username"],
 }
@@ -185,85 +275,36 @@ GRAPHQL_AUTH = {
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 
-class DateBasedFileHandler(TimedRotatingFileHandler):
-    def __init__(self, filename, *args, **kwargs):
-        self.log_file = filename
-        self.update_filename()
-        super().__init__(self.current_log_path, *args, **kwargs)
-
-    def update_filename(self):
-        current_date = datetime.now().strftime('%Y-%m-%d')
-        dated_dir = os.path.join("logs", current_date)
-        if not os.path.exists(dated_dir):
-            os.makedirs(dated_dir)
-        self.current_log_path = os.path.join(dated_dir, self.log_file)
-
-    def doRollover(self):
-        self.update_filename()
-        self.baseFilename = self.current_log_path
-        super().doRollover()
+SIMPLE_LOG_FORMAT = '%(asctime)s [%(module)s | %(levelname)s] %(message)s'
+VERBOSE_LOG_FORMAT = '%(asctime)s [%(module)s | %(levelname)s] %(message)s @ %(pathname)s : %(lineno)d : %(funcName)s'
 
+# a single queued handler per process, its writer thread routes the records by level to the
+# console & the dated files (logs/<YYYY-MM-DD>/<level>.log)
 LOGGING = {
     'version': 1,
     'disable_existing_loggers' : False,
     'loggers': {
         'general': {
-            'handlers': ['console', 'info', 'debug', 'warning', 'error', 'critical'],
+            'handlers': ['queued'],
             'level': 'DEBUG',
             "propagate": False,
         }
     },
     'handlers': {
-        'console': {
-            'class': 'logging.StreamHandler'
-        },
-        'info': {
-            'class': 'adrift.settings.DateBasedFileHandler',
-            'filename': "info.log",
-            'level': 'INFO',
-            'formatter': 'simple',
-            'when': 'midnight',
-            'interval': 1,
-        },
-        'debug': {
-            'class': 'adrift.settings.DateBasedFileHandler',
-            'filename': "debug.log",
-            'level': 'DEBUG',
-            'formatter': 'simple',
-            'when': 'midnight',
-            'interval': 1,
-        },
-        'warning': {
-            'class': 'adrift.settings.DateBasedFileHandler',
-            'filename': "warning.log",
-            'level': 'WARNING',
-            'formatter': 'verbose',
-            'when': 'midnight',
-            'interval': 1,
-        },
-        'error': {
-            'class': 'adrift.settings.DateBasedFileHandler',
-            'filename': "error.log",
-            'level': 'ERROR',
-            'formatter': 'verbose',
-            'when': 'midnight',
-            'interval': 1,
-        },
-        'critical': {
-            'class': 'adrift.settings.DateBasedFileHandler',
-            'filename': "critical.log",
-            'level': 'CRITICAL',
-            'formatter': 'verbose',
-            'when': 'midnight',
-            'interval': 1,
-        }
-    },
-    'formatters': {
-        'simple': {
-            'format': '%(asctime)s [%(module)s | %(levelname)s] %(message)s',
-        },
-        'verbose': {
-            'format': '%(asctime)s [%(module)s | %(levelname)s] %(message)s @ %(pathname)s : %(lineno)d : %(funcName)s',
+        'queued': {
+            'class': 'core.log.QueuedLogHandler',
+            'directory': 'logs',
+            'max_queue_size': int(os.environ.get("LOG_MAX_QUEUE_SIZE", 10000)),
+            'batch_size': int(os.environ.get("LOG_BATCH_SIZE", 500)),
+            'flush_interval': float(os.environ.get("LOG_FLUSH_INTERVAL", 1.0)),
+            'routes': {
+                'console': {'level': 'DEBUG', 'format': '%(message)s'},
+                'debug.log': {'level': 'DEBUG', 'format': SIMPLE_LOG_FORMAT},
+                'info.log': {'level': 'INFO', 'format': SIMPLE_LOG_FORMAT},
+                'warning.log': {'level': 'WARNING', 'format': VERBOSE_LOG_FORMAT},
+                'error.log': {'level': 'ERROR', 'format': VERBOSE_LOG_FORMAT},
+                'critical.log': {'level': 'CRITICAL', 'format': VERBOSE_LOG_FORMAT},
+            },
         },
     },
 }
\ No newline at end of file
@@ -4,7 +4,8 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.views.decorators.csrf import csrf_exempt
 
-from graphene_django.views import GraphQLView
+from core.settings import core_settings
+from core.views import AsyncGraphQLView, GraphQLView, MetricsView
 
 """
 URL configuration for adrift project.
@@ -23,9 +24,13 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+# the async view runs under asgi (e.g. `gunicorn adrift.asgi:application -k uvicorn.workers.UvicornWorker`)
+graphql_view = AsyncGraphQLView if core_settings.ASYNC_VIEW else GraphQLView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
+    path("graphql", csrf_exempt(graphql_view.as_view(graphiql=True))),
+    path("metrics", MetricsView.as_view()),
 ]
 
 if bool(settings.DEBUG):
@@ -0,0 +1,44 @@
+from inspect import iscoroutinefunction
+from asgiref.sync import sync_to_async
+from django.core.exceptions import SynchronousOnlyOperation
+from graphql.pyutils import is_awaitable
+from core.utils import is_default_resolver
+
+
+async def await_result(result):
+    return await result
+
+
+async def run_in_thread(next, root, info, **kwargs):
+    result = await sync_to_async(next)(root, info, **kwargs)
+    # a synchronous resolver may still hand back an awaitable, e.g. the connection of an async resolver
+    if is_awaitable(result):
+        result = await result
+    return result
+
+
+class SyncResolverMiddleware:
+    """
+    Graphene middleware of core.views.AsyncGraphQLView, runs every synchronous resolver through
+    `sync_to_async` so it can use the ORM while the event loop keeps serving other requests.
+    Async resolvers & graphene's default resolvers run in the event loop, the latter move to the
+    thread when they turn out to need the database (e.g. reading a deferred column).
+    """
+
+    # (parent type, field name) -> True when the field is resolved in the event loop
+    inline_fields = {}
+
+    def is_inline(self, info):
+        key = (info.parent_type.name, info.field_name)
+        if key not in self.inline_fields:
+            field = info.parent_type.fields.get(info.field_name)
+            self.inline_fields[key] = field is None or is_default_resolver(field.resolve) or iscoroutinefunction(field.resolve)
+        return self.inline_fields[key]
+
+    def resolve(self, next, root, info, **kwargs):
+        if self.is_inline(info):
+            try:
+                return next(root, info, **kwargs)
+            except SynchronousOnlyOperation:
+                pass
+        return run_in_thread(next, root, info, **kwargs)
@@ -0,0 +1,147 @@
+import uuid
+from django.contrib.auth import get_user_model
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.core.cache.backends.redis import RedisCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import router
+from graphql_auth.backends import GraphQLAuthBackend
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.shortcuts import get_user_by_token
+from graphql_jwt.utils import get_credentials, get_payload, jwt_payload as base_jwt_payload
+from core.permissions import ROLE_NAMES_ATTR, get_role_names
+from core.settings import core_settings
+
+# bumped whenever the layout of the claims below changes, older tokens then take the database path
+CLAIMS_VERSION = 1
+CLAIMS_KEY = "claims"
+TOKEN_VERSION_CACHE_PREFIX = "core:token-version"
+# caches every process reads alike, a token version revoked in a per-process cache would leave
+# every other process trusting the old claims until the token expires
+SHARED_CACHES = (RedisCache, BaseMemcachedCache, DatabaseCache)
+
+# compact claim set carried by the token when `JWT_CLAIMS` is enabled:
+# v = claims version, tv = token version of the user, uid = user pk, r = role names,
+# sid = user status pk, vf = verified, ar = archived
+
+
+def check_shared_cache():
+    if not isinstance(caches[DEFAULT_CACHE_ALIAS], SHARED_CACHES):
+        raise ImproperlyConfigured("JWT_CLAIMS needs a default cache shared by every process, e.g. Redis through REDIS_URL.")
+
+
+def get_token_version_cache_key(user_id):
+    return f"{TOKEN_VERSION_CACHE_PREFIX}:{user_id}"
+
+
+def get_token_version(user_id):
+    return cache.get(get_token_version_cache_key(user_id))
+
+
+def ensure_token_version(user_id):
+    version = uuid.uuid4().hex[:8]
+    if cache.add(get_token_version_cache_key(user_id), version, timeout=None):
+        return version
+    return get_token_version(user_id) or version
+
+
+# invalidates the claims of every token issued so far for the given users, those tokens keep
+# working but authenticate against the database again
+def revoke_claims(*user_ids):
+    cache.set_many({get_token_version_cache_key(user_id): uuid.uuid4().hex[:8] for user_id in user_ids}, timeout=None)
+
+
+def get_user_status(user):
+    try:
+        return user.status
+    except get_user_model().status.RelatedObjectDoesNotExist:
+        return None
+
+
+def get_claims(user, token_version):
+    status = get_user_status(user)
+    return {
+        "v": CLAIMS_VERSION,
+        "tv": token_version,
+        "uid": user.pk,
+        "r": sorted(get_role_names(user)),
+        "sid": status.pk if status else None,
+        "vf": status.verified if status else False,
+        "ar": status.archived if status else False,
+    }
+
+
+# JWT_PAYLOAD_HANDLER, adds the claim set on top of graphql-jwt's payload when enabled
+def jwt_payload(user, context=None):
+    payload = base_jwt_payload(user, context)
+    if core_settings.JWT_CLAIMS:
+        check_shared_cache()
+        payload[CLAIMS_KEY] = get_claims(user, ensure_token_version(user.pk))
+    return payload
+
+
+# builds the user straight from the claims, only the columns the claims carry are loaded and any
+# other column is deferred, so it is fetched lazily if (and only if) a resolver reads it
+def get_user_by_claims(payload, claims):
+    UserModel = get_user_model()
+    db = router.db_for_read(UserModel)
+    user = UserModel.from_db(
+        db,
+        [UserModel._meta.pk.attname, UserModel.USERNAME_FIELD, "is_active"],
+        [claims["uid"], payload[UserModel.USERNAME_FIELD], True],
+    )
+    setattr(user, ROLE_NAMES_ATTR, frozenset(claims["r"]))
+
+    status_relation = UserModel._meta.get_field("status")
+    status = None
+    if claims["sid"] is not None:
+        StatusModel = status_relation.related_model
+        status = StatusModel.from_db(
+            db,
+            [StatusModel._meta.pk.attname, status_relation.field.attname, "verified", "archived"],
+            [claims["sid"], claims["uid"], claims["vf"], claims["ar"]],
+        )
+        status_relation.field.set_cached_value(status, user)
+    status_relation.set_cached_value(user, status)
+    return user
+
+
+class ClaimsJSONWebTokenBackend(GraphQLAuthBackend):
+    """
+    Authenticates tokens carrying a current claim set without touching the database, any other
+    token goes through graphql-auth's backend.
+    """
+
+    def authenticate(self, request=None, **kwargs):
+        if request is None or getattr(request, "_jwt_token_auth", False) or not core_settings.JWT_CLAIMS:
+            return super().authenticate(request, **kwargs)
+
+        check_shared_cache()
+        token = get_credentials(request, **kwargs)
+        if token is None:
+            return None
+
+        try:
+            payload = get_payload(token, request)
+        except JSONWebTokenError:
+            return None
+
+        claims = payload.get(CLAIMS_KEY)
+        if not claims or claims.get("v") != CLAIMS_VERSION:
+            return super().authenticate(request, **kwargs)
+
+        token_version = get_token_version(claims["uid"])
+        if token_version is not None and token_version == claims["tv"]:
+            return get_user_by_claims(payload, claims)
+
+        try:
+            user = get_user_by_token(token, request)
+        except JSONWebTokenError:
+            return None
+
+        # the token version was evicted from the cache, claims that still match the database are
+        # trusted again from now on
+        if token_version is None and user is not None and get_claims(user, claims["tv"]) == claims:
+            cache.add(get_token_version_cache_key(user.pk), claims["tv"], timeout=None)
+        return user
@@ -0,0 +1,178 @@
+import copy
+import time
+import uuid
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from core.documents import LRUCache
+from core.settings import core_settings
+
+MODEL_CACHE_PREFIX = "core:model"
+# fields rows can be looked up by, both of them never change once a row exists
+LOOKUP_FIELDS = ("pk", "uuid")
+
+
+# a copy of the instance without anything a request attached to it (related objects, prefetched
+# rows), so cached instances are never shared between requests
+def detach(instance):
+    instance = copy.copy(instance)
+    instance._state = copy.copy(instance._state)
+    instance._state.fields_cache = {}
+    instance.__dict__.pop("_prefetched_objects_cache", None)
+    return instance
+
+
+class TwoTierCache(LRUCache):
+    """
+    Process local LRU (LOCAL_CACHE_SIZE entries, kept for up to LOCAL_CACHE_TIMEOUT seconds) in
+    front of the shared django cache, so hot keys skip the round trip to it. Entries deleted within
+    the process are gone from both tiers right away, other processes see it once their local
+    entry expired.
+    """
+
+    def get_many(self, keys):
+        found = {}
+        missing = []
+        now = time.monotonic()
+        for key in keys:
+            entry = self.get(key)
+            if entry is not None and entry[0] > now:
+                found[key] = entry[1]
+            else:
+                missing.append(key)
+        if missing:
+            shared = cache.get_many(missing)
+            self.set_local(shared)
+            found.update(shared)
+        return found
+
+    def set_many(self, values, timeout):
+        cache.set_many(values, timeout=timeout)
+        self.set_local(values)
+
+    def set_local(self, values):
+        timeout = core_settings.LOCAL_CACHE_TIMEOUT
+        if not timeout:
+            return
+        expires = time.monotonic() + timeout
+        for key, value in values.items():
+            self.set(key, (expires, value))
+
+    def delete_many(self, keys):
+        with self.lock:
+            for key in keys:
+                self.items.pop(key, None)
+        cache.delete_many(keys)
+
+
+two_tier_cache = TwoTierCache("LOCAL_CACHE_SIZE")
+
+
+class ModelCache:
+    """
+    Cache-aside reads of the rows of a model by primary key or uuid (see `BaseModel.cached`), e.g.
+    `Role.cached.get(pk=1)` or `Role.cached.get_many(uuids, field="uuid")`, through the two tier
+    cache. Saving or deleting an instance drops its entries, `invalidate` drops every entry of the
+    model (e.g. after `QuerySet.update` or bulk writes, which send no signals) by moving its keys
+    to a new version.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.label = model._meta.label_lower
+
+    def get_version_key(self):
+        return f"{MODEL_CACHE_PREFIX}:{self.label}:version"
+
+    def get_version(self):
+        key = self.get_version_key()
+        version = two_tier_cache.get_many([key]).get(key)
+        if version is None:
+            version = uuid.uuid4().hex[:8]
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key) or version
+            two_tier_cache.set_local({key: version})
+        return version
+
+    def invalidate(self):
+        two_tier_cache.set_many({self.get_version_key(): uuid.uuid4().hex[:8]}, timeout=None)
+
+    def get_keys(self, field, values, version=None):
+        version = version or self.get_version()
+        return {value: f"{MODEL_CACHE_PREFIX}:{self.label}:{version}:{field}:{value}" for value in values}
+
+    # the lookup values in their canonical form, the ones that are not valid values of the field are left out
+    def to_values(self, field, values):
+        model_field = self.model._meta.pk if field == "pk" else self.model._meta.get_field(field)
+        canonical = {}
+        for value in values:
+            if value is None:
+                continue
+            try:
+                canonical[str(model_field.to_python(value))] = value
+            except Exception:
+                continue
+        return canonical
+
+    def get(self, timeout=None, **lookup):
+        assert len(lookup) == 1, "Cached rows are looked up by a single field."
+        field, value = next(iter(lookup.items()))
+        instance = self.get_many([value], field=field, timeout=timeout).get(value)
+        if instance is None:
+            raise self.model.DoesNotExist(f"{self.model._meta.object_name} matching query does not exist.")
+        return instance
+
+    # {value: instance} of the rows found, the ones missing from the cache are loaded in one query
+    def get_many(self, values, field="pk", timeout=None):
+        assert field in LOOKUP_FIELDS, f"Cached rows are looked up by one of {', '.join(LOOKUP_FIELDS)}."
+        values = self.to_values(field, values)
+        version = self.get_version()
+        keys = self.get_keys(field, values, version)
+        cached = two_tier_cache.get_many(keys.values())
+
+        found = {}
+        missing = []
+        for value, key in keys.items():
+            if key in cached:
+                found[value] = detach(cached[key])
+            else:
+                missing.append(value)
+
+        if missing:
+            loaded = {}
+            for instance in self.model._default_manager.filter(**{f"{field}__in": missing}):
+                found[str(getattr(instance, field))] = instance
+                # under every lookup field, reads by the other one are served from the cache too
+                loaded.update(dict.fromkeys(self.get_instance_keys(instance, version), detach(instance)))
+            if loaded:
+                two_tier_cache.set_many(loaded, timeout=timeout or core_settings.MODEL_CACHE_TIMEOUT)
+
+        return {original: found[value] for value, original in values.items() if value in found}
+
+    def get_instance_keys(self, instance, version):
+        return [key for field in LOOKUP_FIELDS for key in self.get_keys(field, [str(getattr(instance, field))], version).values()]
+
+    def delete(self, instance):
+        two_tier_cache.delete_many(self.get_instance_keys(instance, self.get_version()))
+
+
+class ModelCacheDescriptor:
+    def __init__(self):
+        self.caches = {}
+
+    def __get__(self, instance, owner):
+        if instance is not None:
+            raise AttributeError("The model cache isn't accessible via instances.")
+        model_cache = self.caches.get(owner)
+        if model_cache is None:
+            model_cache = self.caches.setdefault(owner, ModelCache(owner))
+        return model_cache
+
+
+def invalidate_instance(sender, instance, **kwargs):
+    cached = getattr(sender, "cached", None)
+    if isinstance(cached, ModelCache):
+        cached.delete(instance)
+
+
+post_save.connect(invalidate_instance, dispatch_uid="core.cache.invalidate_instance")
+post_delete.connect(invalidate_instance, dispatch_uid="core.cache.invalidate_instance")
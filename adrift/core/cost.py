@@ -0,0 +1,179 @@
+from graphene import Connection, Dynamic
+from graphene.utils.str_converters import to_snake_case
+from graphene_django.settings import graphene_settings
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLError,
+    GraphQLInt,
+    InlineFragmentNode,
+    VariableNode,
+    get_named_type,
+    is_composite_type,
+    value_from_ast,
+    value_from_ast_untyped,
+)
+from core.settings import core_settings
+from core.types import RelayObjectTypeOptions
+
+# page size assumed for connections without `first`/`last` nor a `max_limit`
+DEFAULT_CONNECTION_SIZE = 100
+
+
+class QueryCostExceeded(GraphQLError):
+    def __init__(self, cost, max_cost):
+        super().__init__(
+            f"Query cost of {cost} exceeds the maximum of {max_cost}.",
+            extensions={"code": "QUERY_COST_EXCEEDED"},
+        )
+
+
+class QueryDepthExceeded(GraphQLError):
+    def __init__(self, depth, max_depth):
+        super().__init__(
+            f"Query depth of {depth} exceeds the maximum of {max_depth}.",
+            extensions={"code": "QUERY_DEPTH_EXCEEDED"},
+        )
+
+
+class QueryCost:
+    def __init__(self, cost=0, depth=0):
+        self.cost = cost
+        self.depth = depth
+
+    @property
+    def errors(self):
+        errors = []
+        if core_settings.QUERY_MAX_DEPTH is not None and self.depth > core_settings.QUERY_MAX_DEPTH:
+            errors.append(QueryDepthExceeded(self.depth, core_settings.QUERY_MAX_DEPTH))
+        if core_settings.QUERY_MAX_COST is not None and self.cost > core_settings.QUERY_MAX_COST:
+            errors.append(QueryCostExceeded(self.cost, core_settings.QUERY_MAX_COST))
+        return errors
+
+    @property
+    def extensions(self):
+        return {
+            "cost": {
+                "requested": self.cost,
+                "maximum": core_settings.QUERY_MAX_COST,
+                "depth": self.depth,
+                "maximumDepth": core_settings.QUERY_MAX_DEPTH,
+            }
+        }
+
+
+class QueryCostAnalyzer:
+    """
+    Computes the cost & depth of an operation before it is executed: a field costs its own cost
+    plus the cost of its selections, multiplied by the page size (`first`/`last`, or else the
+    `max_limit`) for connections. Own costs come from the `cost_hints` of a RelayObjectType, the
+    `cost` of a RelayFilterConnectionField, or else default to 1 for object fields of root types &
+    RelayObjectTypes (i.e. a lookup or a loader batch) & 0 for anything else, connections, edges &
+    payloads only expose what their parent field already loaded. Introspection is free.
+    """
+
+    # (parent type, field name) -> (own cost, max page size or None when not a connection)
+    field_costs = {}
+
+    def __init__(self, schema, document, operation, variables=None):
+        self.schema = schema
+        self.operation = operation
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, FragmentDefinitionNode)
+        }
+        self.variables = {
+            definition.variable.name.value: value_from_ast_untyped(definition.default_value)
+            for definition in operation.variable_definitions or ()
+            if definition.default_value is not None
+        }
+        if isinstance(variables, dict):
+            self.variables.update(variables)
+
+    def analyze(self):
+        root_type = self.schema.get_root_type(self.operation.operation)
+        if root_type is None:
+            return QueryCost()
+        return QueryCost(*self.visit(root_type, self.operation.selection_set))
+
+    # returns (cost, depth) of the selection set
+    def visit(self, parent_type, selection_set):
+        cost, depth = 0, 0
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                selection_cost, selection_depth = self.visit_field(parent_type, selection)
+            elif isinstance(selection, InlineFragmentNode):
+                type_condition = selection.type_condition
+                fragment_type = self.schema.get_type(type_condition.name.value) if type_condition else parent_type
+                selection_cost, selection_depth = self.visit(fragment_type, selection.selection_set)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments[selection.name.value]
+                selection_cost, selection_depth = self.visit(self.schema.get_type(fragment.type_condition.name.value), fragment.selection_set)
+            else:
+                continue
+            cost += selection_cost
+            depth = max(depth, selection_depth)
+        return cost, depth
+
+    def visit_field(self, parent_type, field_node):
+        name = field_node.name.value
+        if name.startswith("__"):
+            return 0, 0
+
+        field = parent_type.fields[name]
+        own_cost, max_size = self.get_field_cost(parent_type, name, field)
+        if field_node.selection_set is None:
+            return own_cost, 1
+
+        cost, depth = self.visit(get_named_type(field.type), field_node.selection_set)
+        if max_size is not None:
+            cost *= self.get_page_size(field_node, max_size)
+        return own_cost + cost, depth + 1
+
+    def get_field_cost(self, parent_type, name, field):
+        key = (parent_type.name, name)
+        if key not in self.field_costs:
+            graphene_type = getattr(parent_type, "graphene_type", None)
+            meta = getattr(graphene_type, "_meta", None)
+            graphene_field = getattr(meta, "fields", {}).get(to_snake_case(name))
+            if isinstance(graphene_field, Dynamic):
+                graphene_field = graphene_field.get_type()
+
+            own_cost = None
+            if isinstance(meta, RelayObjectTypeOptions):
+                own_cost = meta.cost_hints.get(to_snake_case(name))
+            if own_cost is None:
+                own_cost = getattr(graphene_field, "cost", None)
+            if own_cost is None:
+                is_loaded_by_field = isinstance(meta, RelayObjectTypeOptions) or parent_type in self.get_root_types()
+                own_cost = 1 if is_loaded_by_field and is_composite_type(get_named_type(field.type)) else 0
+
+            max_size = None
+            field_type = getattr(get_named_type(field.type), "graphene_type", None)
+            if isinstance(field_type, type) and issubclass(field_type, Connection):
+                max_size = getattr(graphene_field, "max_limit", None) or graphene_settings.RELAY_CONNECTION_MAX_LIMIT or DEFAULT_CONNECTION_SIZE
+            self.field_costs[key] = (own_cost, max_size)
+        return self.field_costs[key]
+
+    def get_root_types(self):
+        return (self.schema.query_type, self.schema.mutation_type, self.schema.subscription_type)
+
+    # the number of nodes a connection can return, given its `first`/`last` arguments
+    def get_page_size(self, field_node, max_size):
+        sizes = [max_size]
+        for argument in field_node.arguments:
+            if argument.name.value not in ("first", "last"):
+                continue
+            if isinstance(argument.value, VariableNode):
+                value = self.variables.get(argument.value.name.value)
+            else:
+                value = value_from_ast(argument.value, GraphQLInt)
+            if isinstance(value, int):
+                sizes.append(max(value, 0))
+        return min(sizes)
+
+
+def analyze_query_cost(schema, document, operation, variables=None):
+    return QueryCostAnalyzer(schema, document, operation, variables).analyze()
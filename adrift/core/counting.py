@@ -0,0 +1,47 @@
+import hashlib
+from django.core.cache import cache
+from django.db.models.query import QuerySet
+from core.settings import core_settings
+
+COUNT_CACHE_PREFIX = "core:count"
+
+
+# builds a stable key out of the compiled sql of the (already filtered) queryset, so every
+# filter argument, permission scoping & ordering ends up in the fingerprint
+def get_count_fingerprint(queryset, max_count=None):
+    sql, params = queryset.query.sql_with_params()
+    digest = hashlib.sha1(f"{sql}|{params}|{max_count}".encode("utf-8")).hexdigest()
+    return f"{COUNT_CACHE_PREFIX}:{queryset.model._meta.label_lower}:{digest}"
+
+
+# counts the given iterable with a single COUNT(*) query, the count is bounded when `COUNT_MAX`
+# is configured (and `exact` is not asked for), the query then becomes
+# `SELECT COUNT(*) FROM (... LIMIT COUNT_MAX + 1)` so the database stops scanning early
+# returns a tuple of (count, capped), a capped count means "more than COUNT_MAX rows"
+def count_iterable(iterable, exact=False):
+    if not isinstance(iterable, QuerySet):
+        return len(iterable), False
+
+    # a queryset that was already evaluated (e.g. prefetched) is counted for free
+    if iterable._result_cache is not None:
+        return len(iterable._result_cache), False
+
+    max_count = None if exact else core_settings.COUNT_MAX
+    cache_timeout = core_settings.COUNT_CACHE_TIMEOUT
+
+    cache_key = None
+    if cache_timeout:
+        cache_key = get_count_fingerprint(iterable, max_count)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return tuple(cached)
+
+    if max_count:
+        count = iterable[:max_count + 1].count()
+        result = (max_count, True) if count > max_count else (count, False)
+    else:
+        result = (iterable.count(), False)
+
+    if cache_key:
+        cache.set(cache_key, result, cache_timeout)
+    return result
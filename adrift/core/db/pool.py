@@ -0,0 +1,198 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread safe pool of DB-API connections of one database alias, used by the core.db.postgresql
+    backend so requests (or threads of the async view) reuse open connections instead of paying
+    the connect, TLS & auth round trips every time. Up to `max_size` connections are open at once,
+    `getconn` waits up to `timeout` seconds for one to be returned when all are in use.
+
+    Connections idle for longer than `max_idle` seconds (beyond the `min_size` most recently used
+    ones) or open for longer than `max_lifetime` seconds are closed, `check` is called on every
+    connection taken from the pool & `reset` on every one returned, a connection either of them
+    raises on is closed.
+    """
+
+    def __init__(self, min_size=0, max_size=4, timeout=10.0, max_idle=600.0, max_lifetime=3600.0, check=None, reset=None, key=None):
+        # what the connections were opened with (process, connection parameters & options), see get_pool
+        self.key = key
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check = check
+        self.reset = reset
+        # the pool was replaced (see get_pool), connections returned to it are closed
+        self.retired = False
+        # (connection, opened at, returned at) of the idle connections, the most recently returned last
+        self.idle = deque()
+        # opened at of the connections in use, by id
+        self.in_use = {}
+        self.condition = threading.Condition()
+        self.size = 0
+        self.waiting = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+        self.opened = 0
+        self.closed = 0
+
+    # an idle connection, or a new one opened with `connect` if there is none & the pool is not full
+    def getconn(self, connect):
+        start = time.monotonic()
+        waited = False
+        try:
+            while True:
+                with self.condition:
+                    connection, opened = self.take_idle()
+                    if connection is None:
+                        if self.size < self.max_size:
+                            self.size += 1
+                            break
+                        self.wait(start + self.timeout)
+                        waited = True
+                        continue
+                if self.check is not None:
+                    try:
+                        self.check(connection)
+                    except Exception:
+                        self.discard(connection)
+                        continue
+                with self.condition:
+                    self.in_use[id(connection)] = opened
+                return connection
+        finally:
+            if waited:
+                with self.condition:
+                    self.waits += 1
+                    self.wait_time += time.monotonic() - start
+        return self.open(connect)
+
+    # called with the condition held
+    def take_idle(self):
+        now = time.monotonic()
+        self.prune(now)
+        while self.idle:
+            connection, opened, _ = self.idle.pop()
+            if now - opened <= self.max_lifetime:
+                return connection, opened
+            self.close(connection)
+        return None, None
+
+    # called with the condition held
+    def wait(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self.timeouts += 1
+            raise PoolTimeout(f"No connection was returned to the pool of {self.max_size} within {self.timeout} seconds.")
+        self.waiting += 1
+        try:
+            self.condition.wait(remaining)
+        finally:
+            self.waiting -= 1
+
+    def open(self, connect):
+        try:
+            connection = connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.opened += 1
+            self.in_use[id(connection)] = time.monotonic()
+        return connection
+
+    def putconn(self, connection):
+        with self.condition:
+            opened = self.in_use.pop(id(connection), None)
+        if opened is None:
+            # not one of the pool
+            return connection.close()
+        if self.retired or time.monotonic() - opened > self.max_lifetime:
+            return self.discard(connection)
+        if self.reset is not None:
+            try:
+                self.reset(connection)
+            except Exception:
+                return self.discard(connection)
+        with self.condition:
+            self.idle.append((connection, opened, time.monotonic()))
+            self.condition.notify()
+
+    def discard(self, connection):
+        with self.condition:
+            self.in_use.pop(id(connection), None)
+            self.close(connection)
+            self.condition.notify()
+
+    # closes the connections idle for longer than max_idle, the least recently used first
+    def prune(self, now):
+        while len(self.idle) > self.min_size and now - self.idle[0][2] > self.max_idle:
+            self.close(self.idle.popleft()[0])
+
+    # called with the condition held
+    def close(self, connection):
+        self.size -= 1
+        self.closed += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close_all(self):
+        with self.condition:
+            while self.idle:
+                self.close(self.idle.popleft()[0])
+
+    # closes the idle connections & every connection in use once it is returned
+    def retire(self):
+        with self.condition:
+            self.retired = True
+        self.close_all()
+
+    def stats(self):
+        with self.condition:
+            return {
+                "size": self.size,
+                "idle": len(self.idle),
+                "in_use": self.size - len(self.idle),
+                "waiting": self.waiting,
+                "waits": self.waits,
+                "wait_time": self.wait_time,
+                "timeouts": self.timeouts,
+                "opened": self.opened,
+                "closed": self.closed,
+            }
+
+
+# the pools of the process by database alias
+pools = {}
+pools_lock = threading.Lock()
+
+
+# the pool of the alias for connections opened with `key` (e.g. the connection parameters), the
+# pool is replaced when the key changes (e.g. the test runner switching NAME to the test
+# database) or the process was forked, connections of the old pool are closed when returned
+def get_pool(alias, key=None, **options):
+    key = (os.getpid(), key)
+    pool = pools.get(alias)
+    if pool is None or pool.key != key:
+        with pools_lock:
+            pool = pools.get(alias)
+            if pool is None or pool.key != key:
+                # the idle connections of a parent process are its own, they are left alone
+                if pool is not None and pool.key[0] == key[0]:
+                    pool.retire()
+                pool = pools[alias] = ConnectionPool(key=key, **options)
+    return pool
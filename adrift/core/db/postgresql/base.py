@@ -0,0 +1,55 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql import base
+from core.db.pool import get_pool
+
+
+def check_connection(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1")
+
+
+# rolls back what a request left open so the next one starts outside of a transaction
+def reset_connection(connection):
+    if connection.closed:
+        raise base.Database.InterfaceError("connection already closed")
+    if connection.info.transaction_status != base.Database.extensions.TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The postgresql backend taking connections from a process wide pool (see core.db.pool) & giving
+    them back on close, configured by `OPTIONS["pool"]`, e.g. {"min_size": 1, "max_size": 4}, with
+    the names of the pool of Django 5.1 / psycopg 3 so switching to it later only changes ENGINE.
+    Pooled connections are checked before reuse when `CONN_HEALTH_CHECKS` is set.
+    """
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop("pool", None)
+        return conn_params
+
+    # the pool of the connections opened with the current settings of the alias
+    def get_pool(self, conn_params):
+        options = dict(self.settings_dict["OPTIONS"].get("pool") or {})
+        if self.settings_dict["CONN_MAX_AGE"]:
+            raise ImproperlyConfigured("Pooled connections are returned after every request, CONN_MAX_AGE must be 0.")
+        return get_pool(
+            self.alias,
+            key=repr(sorted({**conn_params, **options}.items())),
+            check=check_connection if self.settings_dict["CONN_HEALTH_CHECKS"] else None,
+            reset=reset_connection,
+            **options,
+        )
+
+    def get_new_connection(self, conn_params):
+        pool = self.get_pool(conn_params)
+        connection = pool.getconn(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        # returned to the pool it came from, which closes it if the pool of the alias was replaced since
+        self.connection_pool = pool
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.connection_pool.putconn(self.connection)
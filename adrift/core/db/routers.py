@@ -0,0 +1,118 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from graphql_jwt.utils import get_credentials
+from core.settings import core_settings
+from core.utils import logger
+
+PRIMARY_PIN_CACHE_PREFIX = "core:primary-pin"
+
+# the routing of the reads of the graphql operation being executed, None reads from the primary
+current_routing = ContextVar("db_routing", default=None)
+
+
+class ReplicaRouting:
+    """
+    The reads of one query operation: they all go to the same replica (picked on the first read)
+    so the operation sees a single snapshot, or to the primary when the request is pinned to it.
+    """
+
+    __slots__ = ("pinned", "alias")
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.alias = None
+
+
+# the credential of the request, hashed, identifies the client whose writes it has to read back
+def get_primary_pin_cache_key(request):
+    credential = get_credentials(request) if request is not None else None
+    if not credential:
+        return None
+    return f"{PRIMARY_PIN_CACHE_PREFIX}:{hashlib.sha256(credential.encode('utf-8')).hexdigest()}"
+
+
+# reads of the client's requests go to the primary for READ_YOUR_WRITES_TIMEOUT seconds after it
+# mutated, so replication lag never hides what it just wrote
+def pin_to_primary(request):
+    if not core_settings.REPLICA_DATABASES:
+        return
+    key = get_primary_pin_cache_key(request)
+    if key is not None and core_settings.READ_YOUR_WRITES_TIMEOUT:
+        cache.set(key, True, timeout=core_settings.READ_YOUR_WRITES_TIMEOUT)
+
+
+def is_pinned_to_primary(request):
+    key = get_primary_pin_cache_key(request)
+    return key is not None and bool(core_settings.READ_YOUR_WRITES_TIMEOUT) and bool(cache.get(key))
+
+
+@contextmanager
+def use_replicas(request=None):
+    token = current_routing.set(ReplicaRouting(pinned=is_pinned_to_primary(request)) if core_settings.REPLICA_DATABASES else None)
+    try:
+        yield
+    finally:
+        current_routing.reset(token)
+
+
+@contextmanager
+def use_primary():
+    token = current_routing.set(None)
+    try:
+        yield
+    finally:
+        current_routing.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Routes the reads of graphql query operations (see `use_replicas`) to the REPLICA_DATABASES
+    aliases, round robin by operation, anything else (writes, mutations, reads within a
+    transaction & outside of graphql) goes to the primary. A replica that fails to connect is left
+    out for REPLICA_EJECT_TIMEOUT seconds, reads go to the primary while none is available.
+    """
+
+    def __init__(self):
+        self.next_index = 0
+        self.ejected = {}
+        self.lock = threading.Lock()
+
+    def db_for_read(self, model, **hints):
+        routing = current_routing.get()
+        if routing is None or routing.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        if routing.alias is None:
+            routing.alias = self.get_replica() or DEFAULT_DB_ALIAS
+        return routing.alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    # replicas hold the same rows as the primary
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in core_settings.REPLICA_DATABASES
+
+    def get_replica(self):
+        replicas = core_settings.REPLICA_DATABASES
+        for _ in range(len(replicas)):
+            with self.lock:
+                alias = replicas[self.next_index % len(replicas)]
+                self.next_index += 1
+            if self.ejected.get(alias, 0) > time.monotonic():
+                continue
+            try:
+                connections[alias].ensure_connection()
+            except DatabaseError:
+                logger.warning("Replica %s is unavailable, ejected for %ss.", alias, core_settings.REPLICA_EJECT_TIMEOUT, exc_info=True)
+                self.ejected[alias] = time.monotonic() + core_settings.REPLICA_EJECT_TIMEOUT
+                continue
+            return alias
+        return None
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from django.core.cache import cache
+from graphql import GraphQLError
+from core.settings import core_settings
+
+PERSISTED_QUERY_CACHE_PREFIX = "core:apq"
+PERSISTED_QUERY_VERSION = 1
+
+
+class PersistedQueryNotFound(GraphQLError):
+    def __init__(self):
+        super().__init__("PersistedQueryNotFound", extensions={"code": "PERSISTED_QUERY_NOT_FOUND"})
+
+
+class PersistedQueryHashMismatch(GraphQLError):
+    def __init__(self):
+        super().__init__("Provided sha256Hash does not match the query.", extensions={"code": "PERSISTED_QUERY_HASH_MISMATCH"})
+
+
+def get_query_hash(query):
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+def get_persisted_query_cache_key(query_hash):
+    return f"{PERSISTED_QUERY_CACHE_PREFIX}:{query_hash}"
+
+
+# the sha256 hash of an automatic persisted query (apollo's protocol), sent as
+# `extensions: {"persistedQuery": {"version": 1, "sha256Hash": "..."}}` in the body or as a json
+# encoded `extensions` query parameter
+def get_persisted_query_hash(request, data):
+    extensions = request.GET.get("extensions") or data.get("extensions")
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            return None
+    if not isinstance(extensions, dict):
+        return None
+
+    persisted_query = extensions.get("persistedQuery")
+    if not isinstance(persisted_query, dict) or persisted_query.get("version") != PERSISTED_QUERY_VERSION:
+        return None
+    return persisted_query.get("sha256Hash") or None
+
+
+class LRUCache:
+    """
+    Process wide, thread safe LRU, `max_size_setting` names the core setting bounding it (a size
+    of 0 turns the cache off).
+    """
+
+    def __init__(self, max_size_setting):
+        self.max_size_setting = max_size_setting
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is not None:
+                self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        max_size = getattr(core_settings, self.max_size_setting)
+        if not max_size:
+            return
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > max_size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+
+class DocumentCache(LRUCache):
+    """
+    Parsed & validated query documents keyed by the sha256 hash of their query, the query texts
+    are also kept in the django cache (see `PERSISTED_QUERY_CACHE_TIMEOUT`) so that every process
+    can serve a persisted query registered on any of them.
+    """
+
+    def get_query(self, query_hash):
+        if not core_settings.PERSISTED_QUERY_CACHE_TIMEOUT:
+            return None
+        return cache.get(get_persisted_query_cache_key(query_hash))
+
+    def register_query(self, query_hash, query):
+        timeout = core_settings.PERSISTED_QUERY_CACHE_TIMEOUT
+        if timeout:
+            cache.set(get_persisted_query_cache_key(query_hash), query, timeout=timeout)
+
+
+document_cache = DocumentCache("DOCUMENT_CACHE_SIZE")
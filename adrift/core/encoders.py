@@ -0,0 +1,47 @@
+import json
+from functools import lru_cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+from core.settings import core_settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+django_json_encoder = DjangoJSONEncoder()
+
+
+# values graphql's scalars left as they are, e.g. uuids, datetimes & decimals of model fields
+# returned by a JSONString or custom scalar
+def encode_default(value):
+    return django_json_encoder.default(value)
+
+
+def encode_stdlib(data, pretty=False):
+    if pretty:
+        return json.dumps(data, sort_keys=True, indent=2, separators=(",", ": "), ensure_ascii=False, cls=DjangoJSONEncoder).encode("utf-8")
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, cls=DjangoJSONEncoder).encode("utf-8")
+
+
+# uuids & datetimes are serialized by orjson itself, datetimes as RFC 3339 with microseconds
+def encode_orjson(data, pretty=False):
+    option = orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS if pretty else 0
+    return orjson.dumps(data, default=encode_default, option=option)
+
+
+# the function serializing responses to utf-8 json bytes: the `JSON_ENCODER` dotted path, or
+# orjson when installed & the standard library otherwise
+@lru_cache
+def get_json_encoder(path=None):
+    if path:
+        return import_string(path)
+    return encode_orjson if orjson is not None else encode_stdlib
+
+
+def json_encode(data, pretty=False):
+    return get_json_encoder(core_settings.JSON_ENCODER)(data, pretty)
+
+
+def json_decode(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
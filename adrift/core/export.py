@@ -0,0 +1,100 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import islice
+from django.db.models import QuerySet
+from graphene.relay.connection import connection_adapter, page_info_adapter
+from graphene.utils.str_converters import to_camel_case
+from graphene_django.utils import maybe_queryset
+from graphql import FieldNode, GraphQLError
+from graphql_relay import offset_to_cursor
+from core.encoders import json_encode
+
+EXPORT_CONTENT_TYPE = "application/x-ndjson"
+
+# the export the operation being executed is part of
+current_export = ContextVar("graphql_connection_export", default=None)
+
+
+class ConnectionExport:
+    """
+    Streams the root connection field of a query operation as newline delimited json, one node
+    per line. The operation is executed once per chunk & the connection resolves to the next
+    `chunk_size` rows of a single `.iterator(chunk_size=...)` over its filtered queryset (which
+    also runs the prefetches of the selection per chunk), so memory stays flat however many rows
+    there are. Errors are written as a last `{"errors": [...]}` line.
+    """
+
+    def __init__(self, response_key, chunk_size):
+        self.response_key = response_key
+        self.chunk_size = chunk_size
+        self.rows = None
+        self.offset = 0
+        self.done = False
+
+    def next_page(self, connection, iterable):
+        if self.rows is None:
+            iterable = maybe_queryset(iterable)
+            self.rows = iterable.iterator(chunk_size=self.chunk_size) if isinstance(iterable, QuerySet) else iter(iterable)
+
+        nodes = list(islice(self.rows, self.chunk_size))
+        self.done = len(nodes) < self.chunk_size
+        edges = [connection.Edge(node=node, cursor=offset_to_cursor(self.offset + index)) for index, node in enumerate(nodes)]
+        page = connection_adapter(
+            connection,
+            edges=edges,
+            pageInfo=page_info_adapter(
+                startCursor=edges[0].cursor if edges else None,
+                endCursor=edges[-1].cursor if edges else None,
+                hasPreviousPage=self.offset > 0,
+                hasNextPage=not self.done,
+            ),
+        )
+        self.offset += len(nodes)
+        page.iterable = iterable
+        page.length = None
+        page.length_capped = False
+        return page
+
+    # the rows left are never read, e.g. after an error, the cursor over them is closed right away
+    def close(self):
+        close = getattr(self.rows, "close", None)
+        if close is not None:
+            close()
+
+    def encode(self, result, format_error):
+        if result.errors:
+            self.done = True
+            return json_encode({"errors": [format_error(error) for error in result.errors]}) + b"\n"
+
+        data = (result.data or {}).get(self.response_key)
+        if data is None:
+            self.done = True
+            return b""
+        return b"".join(json_encode(edge.get("node", edge)) + b"\n" for edge in data.get("edges") or ())
+
+
+@contextmanager
+def export_connection(export):
+    token = current_export.set(export)
+    try:
+        yield
+    finally:
+        current_export.reset(token)
+
+
+# the export of the operation when it queries a single root connection field declared with
+# `export=True`, raises a GraphQLError otherwise
+def get_connection_export(schema, operation_ast, chunk_size):
+    if operation_ast is None:
+        raise GraphQLError("Must provide the name of the operation to export.")
+    selections = operation_ast.selection_set.selections
+    if operation_ast.operation.value != "query" or len(selections) != 1 or not isinstance(selections[0], FieldNode):
+        raise GraphQLError("Only a query selecting a single connection field can be exported.")
+
+    selection = selections[0]
+    for name, field in schema.query._meta.fields.items():
+        if (field.name or to_camel_case(name)) == selection.name.value:
+            if getattr(field, "export", False):
+                return ConnectionExport(selection.alias.value if selection.alias else selection.name.value, chunk_size)
+            break
+    raise GraphQLError(f"`{selection.name.value}` cannot be exported.")
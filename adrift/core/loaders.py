@@ -0,0 +1,244 @@
+from collections import defaultdict
+from django.db.models import Prefetch, prefetch_related_objects
+from graphene_django import DjangoObjectType
+from graphql import get_named_type
+from core.optimizer import PAGINATION_ARGUMENTS
+
+# name of the attribute the loaders are stored under on the request (graphql context)
+REQUEST_LOADERS_ATTR = "_core_loaders"
+
+
+def get_relation_fields(model):
+    # maps the attribute name a relation is exposed under (field name for forward relations,
+    # accessor name for reverse ones) to its django field
+    relations = {}
+    for field in model._meta.get_fields():
+        if not field.is_relation:
+            continue
+        if field.auto_created and not field.concrete:
+            accessor_name = field.get_accessor_name()
+            if accessor_name:
+                relations[accessor_name] = field
+        else:
+            relations[field.name] = field
+    return relations
+
+
+class RelationLoader:
+    """
+    Loads one relation (model, field) for every instance of the model seen during the request,
+    so resolving the relation on a whole page of nodes costs a single `IN` query.
+    """
+
+    def __init__(self, loaders, model, name, field):
+        self.loaders = loaders
+        self.model = model
+        self.name = name
+        self.field = field
+
+        # the key django prefetches to-many relations under within `_prefetched_objects_cache`
+        self.cache_name = None
+        if field.many_to_many:
+            self.cache_name = field.name if field.concrete else field.field.related_query_name()
+        elif field.one_to_many:
+            self.cache_name = field.get_cache_name()
+
+    def is_loaded(self, instance):
+        if self.cache_name:
+            return self.cache_name in getattr(instance, "_prefetched_objects_cache", {})
+        return self.field.is_cached(instance)
+
+    # `queryset` is the queryset the related rows are fetched from, django's base manager is
+    # used when none is given
+    def load(self, instance, queryset=None):
+        instance = self.loaders.register(instance)
+
+        if not self.is_loaded(instance):
+            batch = [obj for obj in self.loaders.seen(self.model) if not self.is_loaded(obj)]
+            if self.cache_name:
+                self.load_many(batch, queryset)
+            elif self.field.concrete:
+                self.load_forward(batch, queryset)
+            else:
+                self.load_reverse_one(batch, queryset)
+
+        return getattr(instance, self.name)
+
+    # foreign keys & one-to-one fields declared on the model, rows already in the identity map
+    # are reused & only the missing ones are fetched (unless a scoped queryset has to be honoured)
+    def load_forward(self, batch, queryset=None):
+        related_model = self.field.related_model
+        target_attname = self.field.target_field.attname
+        values = {getattr(obj, self.field.attname) for obj in batch} - {None}
+
+        found = {}
+        if queryset is None and target_attname == related_model._meta.pk.attname:
+            for value in values:
+                cached = self.loaders.get(related_model, value)
+                if cached is not None:
+                    found[value] = cached
+
+        missing = values - set(found)
+        if missing:
+            if queryset is None:
+                queryset = related_model._base_manager.all()
+            queryset = queryset.filter(**{f"{target_attname}__in": missing})
+            for obj in self.loaders.register_many(queryset):
+                found[getattr(obj, target_attname)] = obj
+
+        for obj in batch:
+            self.field.set_cached_value(obj, found.get(getattr(obj, self.field.attname)))
+
+    # reverse side of a one-to-one field (e.g. `user.status`), a missing row is cached as None
+    # so accessing it raises `RelatedObjectDoesNotExist` like django would
+    def load_reverse_one(self, batch, queryset=None):
+        remote_field = self.field.field
+        if queryset is None:
+            queryset = self.field.related_model._base_manager.all()
+        queryset = queryset.filter(**{f"{remote_field.attname}__in": [obj.pk for obj in batch]})
+        found = {getattr(obj, remote_field.attname): obj for obj in self.loaders.register_many(queryset)}
+
+        for obj in batch:
+            related = found.get(obj.pk)
+            self.field.set_cached_value(obj, related)
+            if related is not None:
+                remote_field.set_cached_value(related, obj)
+
+    # reverse foreign keys & many-to-many relations go through django's own prefetching, the
+    # prefetched rows are then swapped for the instances already in the identity map
+    def load_many(self, batch, queryset=None):
+        prefetch_related_objects(batch, Prefetch(self.name, queryset=queryset))
+
+        for obj in batch:
+            result_cache = getattr(obj, self.name).all()._result_cache
+            if result_cache is not None:
+                result_cache[:] = self.loaders.register_many(result_cache)
+
+
+# copies whatever the other instance of the same row has loaded (columns deferred by `only()`,
+# cached relations & prefetched rows) onto the canonical instance, so swapping one for the
+# other never costs a query
+def merge_instance(canonical, obj):
+    for attname in canonical.get_deferred_fields() - obj.get_deferred_fields():
+        canonical.__dict__[attname] = obj.__dict__[attname]
+
+    for name, value in obj._state.fields_cache.items():
+        canonical._state.fields_cache.setdefault(name, value)
+
+    prefetched = getattr(obj, "_prefetched_objects_cache", None)
+    if prefetched:
+        if not hasattr(canonical, "_prefetched_objects_cache"):
+            canonical._prefetched_objects_cache = {}
+        for name, value in prefetched.items():
+            canonical._prefetched_objects_cache.setdefault(name, value)
+
+
+class RequestLoaders:
+    """
+    Request scoped registry of relation loaders together with an identity map, every model
+    instance that passes through it is kept once per (model, pk) for the rest of the request.
+    """
+
+    def __init__(self):
+        self.identity_map = {}
+        self.instances = defaultdict(dict)
+        self.loaders = {}
+
+    def get(self, model, pk):
+        return self.identity_map.get((model._meta.concrete_model, pk))
+
+    def seen(self, model):
+        return list(self.instances[model._meta.concrete_model].values())
+
+    # returns the canonical instance for the given object, i.e. the first instance of the same
+    # row that was registered within the request
+    def register(self, obj):
+        if obj is None or obj.pk is None:
+            return obj
+
+        model = obj._meta.concrete_model
+        key = (model, obj.pk)
+        canonical = self.identity_map.setdefault(key, obj)
+        self.instances[model].setdefault(obj.pk, canonical)
+        if canonical is not obj:
+            merge_instance(canonical, obj)
+        return canonical
+
+    def register_many(self, objs):
+        return [self.register(obj) for obj in objs]
+
+    def get_loader(self, model, name):
+        key = (model._meta.concrete_model, name)
+        if key not in self.loaders:
+            field = get_relation_fields(model)[name]
+            self.loaders[key] = RelationLoader(self, model, name, field)
+        return self.loaders[key]
+
+    def load(self, instance, name, queryset=None):
+        return self.get_loader(type(instance), name).load(instance, queryset)
+
+
+# the loaders live on the request so that every resolver within the same request (and only
+# that request) shares them, contexts that cannot hold attributes get a throwaway registry
+def get_request_loaders(context):
+    loaders = getattr(context, REQUEST_LOADERS_ATTR, None)
+    if loaders is None:
+        loaders = RequestLoaders()
+        try:
+            setattr(context, REQUEST_LOADERS_ATTR, loaders)
+        except AttributeError:
+            pass
+    return loaders
+
+
+# drops the loaders of the request along with every row they hold, e.g. between the chunks of an
+# export (see core.export)
+def clear_request_loaders(context):
+    context.__dict__.pop(REQUEST_LOADERS_ATTR, None)
+
+
+# the django object type a relation resolves to, unwrapping connections down to their node
+def get_node_type(info):
+    graphene_type = getattr(get_named_type(info.return_type), "graphene_type", None)
+    meta = getattr(graphene_type, "_meta", None)
+    node_type = getattr(meta, "node", None) or graphene_type
+    return node_type if isinstance(node_type, type) and issubclass(node_type, DjangoObjectType) else None
+
+
+# whether the type brings its own implementation of the classmethod, beyond the one of `base`
+def overrides(node_type, name, base=DjangoObjectType):
+    if not issubclass(node_type, base):
+        base = DjangoObjectType
+    return getattr(node_type, name).__func__ is not getattr(base, name).__func__
+
+
+# `node_base` is the object type the node types derive from (core.types.RelayObjectType), its
+# own `get_node` looks nodes up by global id value & not by the primary key foreign keys hold
+def relation_resolver(name, node_base=DjangoObjectType):
+    def resolver(root, info, **kwargs):
+        loader = get_request_loaders(info.context).get_loader(type(root), name)
+        node_type = get_node_type(info)
+        if node_type is None:
+            return loader.load(root)
+
+        # types guarding single nodes (e.g. graphql-auth's staff only UserNode) keep their own lookup
+        if loader.field.concrete and not loader.cache_name and overrides(node_type, "get_node", node_base):
+            value = getattr(root, loader.field.attname)
+            return node_type.get_node(info, value) if value is not None else None
+
+        # filtered connections query their own rows, batching the unfiltered ones would be wasted
+        if loader.cache_name and any(kwargs.get(arg) is not None for arg in set(kwargs) - PAGINATION_ARGUMENTS):
+            return getattr(root, name)
+
+        # the `get_queryset` of the type the relation resolves to is honoured, so its scoping
+        # & joins still apply to the batched rows
+        queryset = None
+        if overrides(node_type, "get_queryset"):
+            queryset = node_type.get_queryset(loader.field.related_model._default_manager.all(), info)
+        return loader.load(root, queryset)
+
+    # graphene-django would otherwise resolve foreign keys one `get_node` at a time
+    resolver._bypass_get_queryset = True
+
+    resolver.__name__ = f"resolve_{name}"
+    return resolver
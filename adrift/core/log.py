@@ -0,0 +1,163 @@
+import copy
+import logging
+import os
+import queue
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+
+
+# the numeric value of a level given by number or name, e.g. "INFO"
+def get_level(level):
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown level: {level}")
+    return value
+
+
+class QueuedLogHandler(logging.Handler):
+    """
+    Single logging backend of the process: `emit` only puts the record on a bounded queue (and
+    counts it as dropped when the queue is full), one writer thread routes each record by level
+    to every matching destination & writes them in batches, flushing once per batch.
+
+    `routes` maps a destination to its minimum level & format, the destination is either
+    "console" or a file name written to `<directory>/<YYYY-MM-DD>/<file name>`, e.g.
+    {"info.log": {"level": "INFO", "format": "%(asctime)s %(message)s"}}
+    """
+
+    def __init__(self, routes, directory="logs", max_queue_size=10000, batch_size=500, flush_interval=1.0, level=logging.NOTSET):
+        super().__init__(level)
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.routes = [
+            (destination, get_level(route.get("level", logging.NOTSET)), logging.Formatter(route.get("format")))
+            for destination, route in routes.items()
+        ]
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        # counted by the emitting threads & read by the writer thread
+        self.dropped = Counter()
+        self.dropped_lock = threading.Lock()
+        self.reported_dropped = 0
+        self.written = 0
+        self.files = {}
+        self.current_date = None
+        self.writer = None
+        self.writer_pid = None
+        self.writer_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    # the writer thread is started lazily so that forked workers (e.g. gunicorn --preload) each
+    # get their own one
+    def ensure_writer(self):
+        if self.writer_pid == os.getpid() and self.writer.is_alive():
+            return
+        with self.writer_lock:
+            if self.writer_pid != os.getpid() or not self.writer.is_alive():
+                self.files = {}
+                self.stopped.clear()
+                self.writer = threading.Thread(target=self.run, name="log-writer", daemon=True)
+                self.writer.start()
+                self.writer_pid = os.getpid()
+
+    # the message is rendered in the calling thread since its arguments may change afterwards,
+    # everything else (formatting, routing, I/O) happens in the writer thread, on a copy of the
+    # record as the other handlers of the logger get the record as it was logged
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        try:
+            self.ensure_writer()
+            self.queue.put_nowait(self.prepare(record))
+        except queue.Full:
+            with self.dropped_lock:
+                self.dropped[record.levelname] += 1
+        except Exception:
+            self.handleError(record)
+
+    def run(self):
+        while not (self.stopped.is_set() and self.queue.empty()):
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.write(batch + self.get_dropped_records())
+
+    # records dropped since the last batch are reported as a warning of their own
+    def get_dropped_records(self):
+        with self.dropped_lock:
+            dropped = sum(self.dropped.values()) - self.reported_dropped
+        if dropped <= 0:
+            return []
+        self.reported_dropped += dropped
+        return [logging.makeLogRecord({
+            "name": __name__,
+            "module": "log",
+            "levelno": logging.WARNING,
+            "levelname": logging.getLevelName(logging.WARNING),
+            "msg": f"Log queue full, dropped {dropped} records",
+        })]
+
+    def write(self, batch):
+        touched = set()
+        for record in batch:
+            for destination, level, formatter in self.routes:
+                if record.levelno < level:
+                    continue
+                stream = self.get_stream(destination)
+                try:
+                    stream.write(formatter.format(record) + "\n")
+                except Exception:
+                    self.handleError(record)
+                touched.add(stream)
+        for stream in touched:
+            stream.flush()
+        self.written += len(batch)
+
+    def get_stream(self, destination):
+        if destination == "console":
+            return sys.stderr
+
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        if current_date != self.current_date:
+            self.close_files()
+            self.current_date = current_date
+            os.makedirs(os.path.join(self.directory, current_date), exist_ok=True)
+
+        if destination not in self.files:
+            self.files[destination] = open(os.path.join(self.directory, current_date, destination), "a", encoding="utf-8")
+        return self.files[destination]
+
+    def close_files(self):
+        for stream in self.files.values():
+            stream.close()
+        self.files = {}
+
+    def stats(self):
+        with self.dropped_lock:
+            dropped = dict(self.dropped)
+        return {"queued": self.queue.qsize(), "written": self.written, "dropped": dropped}
+
+    # drains the queue before the process exits, called by `logging.shutdown`
+    def close(self):
+        self.stopped.set()
+        if self.writer is not None and self.writer_pid == os.getpid():
+            self.writer.join(timeout=self.flush_interval * 5)
+        self.close_files()
+        super().close()
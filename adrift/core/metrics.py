@@ -0,0 +1,163 @@
+import logging
+import threading
+from bisect import bisect_left
+from core.db.pool import pools
+from core.log import QueuedLogHandler
+
+# upper bounds (in seconds) of the resolver duration histogram buckets
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class FieldStats:
+    __slots__ = ("calls", "errors", "total_time", "max_time", "sql_queries", "sql_time", "buckets")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.sql_queries = 0
+        self.sql_time = 0.0
+        # calls per duration bucket, the last one counts the calls slower than every bound
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_time": self.total_time,
+            "max_time": self.max_time,
+            "sql_queries": self.sql_queries,
+            "sql_time": self.sql_time,
+            "buckets": list(self.buckets),
+        }
+
+
+class ResolverMetrics:
+    """
+    In-memory, per process counters & timings of every resolved graphql field, keyed by
+    "<parent type>.<field name>", recorded by core.middlewares.ResolverMetricsMiddleware.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        stats = self.fields.get(key)
+        if stats is None:
+            with self.lock:
+                stats = self.fields.setdefault(key, FieldStats())
+        return stats
+
+    def record(self, stats, duration, error=False, sql_queries=0, sql_time=0.0):
+        with self.lock:
+            stats.calls += 1
+            stats.total_time += duration
+            if duration > stats.max_time:
+                stats.max_time = duration
+            if error:
+                stats.errors += 1
+            stats.sql_queries += sql_queries
+            stats.sql_time += sql_time
+            stats.buckets[bisect_left(DURATION_BUCKETS, duration)] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {key: stats.as_dict() for key, stats in self.fields.items()}
+
+    # zeroes the counters in place, the middleware keeps references to them
+    def reset(self):
+        with self.lock:
+            for stats in self.fields.values():
+                stats.__init__()
+
+
+resolver_metrics = ResolverMetrics()
+
+
+def get_log_handlers():
+    loggers = [logging.getLogger(), *(logger for logger in logging.Logger.manager.loggerDict.values() if isinstance(logger, logging.Logger))]
+    handlers = {handler for logger in loggers for handler in logger.handlers if isinstance(handler, QueuedLogHandler)}
+    return list(handlers)
+
+
+# the resolver metrics (and the state of the log queue) in prometheus' text exposition format,
+# per process like the metrics themselves
+def render_prometheus():
+    lines = []
+
+    def metric(name, kind, help, samples):
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            labels = ",".join(f'{label}="{value}"' for label, value in labels)
+            lines.append(f"{name}{suffix}{{{labels}}} {value}" if labels else f"{name}{suffix} {value}")
+
+    fields = sorted(resolver_metrics.snapshot().items())
+    samples = []
+    for field, stats in fields:
+        count = 0
+        for bound, calls in zip((*DURATION_BUCKETS, "+Inf"), stats["buckets"]):
+            count += calls
+            samples.append(("_bucket", [("field", field), ("le", bound)], count))
+        samples.append(("_sum", [("field", field)], stats["total_time"]))
+        samples.append(("_count", [("field", field)], stats["calls"]))
+    metric("graphql_resolver_duration_seconds", "histogram", "Time spent in graphql resolvers.", samples)
+    metric(
+        "graphql_resolver_errors_total", "counter", "Graphql resolver calls that raised.",
+        [("", [("field", field)], stats["errors"]) for field, stats in fields],
+    )
+    metric(
+        "graphql_resolver_sql_queries_total", "counter", "SQL queries executed by graphql resolvers.",
+        [("", [("field", field)], stats["sql_queries"]) for field, stats in fields],
+    )
+    metric(
+        "graphql_resolver_sql_duration_seconds_total", "counter", "Time spent in SQL queries of graphql resolvers.",
+        [("", [("field", field)], stats["sql_time"]) for field, stats in fields],
+    )
+
+    log_stats = [handler.stats() for handler in get_log_handlers()]
+    if log_stats:
+        metric("log_queue_size", "gauge", "Log records waiting to be written.", [("", [], sum(stats["queued"] for stats in log_stats))])
+        metric("log_records_written_total", "counter", "Log records written.", [("", [], sum(stats["written"] for stats in log_stats))])
+        dropped = {}
+        for stats in log_stats:
+            for level, count in stats["dropped"].items():
+                dropped[level] = dropped.get(level, 0) + count
+        metric(
+            "log_records_dropped_total", "counter", "Log records dropped because the log queue was full.",
+            [("", [("level", level)], count) for level, count in sorted(dropped.items())],
+        )
+
+    pool_stats = sorted((alias, pool.stats()) for alias, pool in list(pools.items()))
+    if pool_stats:
+        metric(
+            "db_pool_connections", "gauge", "Open connections of the database connection pool.",
+            [("", [("alias", alias), ("state", state)], stats[state]) for alias, stats in pool_stats for state in ("idle", "in_use")],
+        )
+        metric(
+            "db_pool_waiting", "gauge", "Threads waiting for a connection of the pool.",
+            [("", [("alias", alias)], stats["waiting"]) for alias, stats in pool_stats],
+        )
+        metric(
+            "db_pool_waits_total", "counter", "Times a connection of the pool had to be waited for.",
+            [("", [("alias", alias)], stats["waits"]) for alias, stats in pool_stats],
+        )
+        metric(
+            "db_pool_wait_seconds_total", "counter", "Time spent waiting for a connection of the pool.",
+            [("", [("alias", alias)], stats["wait_time"]) for alias, stats in pool_stats],
+        )
+        metric(
+            "db_pool_timeouts_total", "counter", "Waits for a connection of the pool that timed out.",
+            [("", [("alias", alias)], stats["timeouts"]) for alias, stats in pool_stats],
+        )
+        metric(
+            "db_pool_connections_opened_total", "counter", "Connections opened by the pool.",
+            [("", [("alias", alias)], stats["opened"]) for alias, stats in pool_stats],
+        )
+        metric(
+            "db_pool_connections_closed_total", "counter", "Connections closed by the pool (idle, expired or broken).",
+            [("", [("alias", alias)], stats["closed"]) for alias, stats in pool_stats],
+        )
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,133 @@
+import random
+from time import perf_counter
+from django.utils.deprecation import MiddlewareMixin
+from graphene_django.views import GraphQLView as BaseGraphQLView
+from graphql.pyutils import is_awaitable
+from core.metrics import resolver_metrics
+from core.settings import core_settings
+from core.tracing import ResolverCall, current_call, current_tracer
+from core.utils import is_default_resolver, logger, remove_new_lines
+from core.views import get_graphql_errors
+
+# set on graphql requests, True once the request is picked for body logging
+LOG_SAMPLED_ATTR = "_graphql_log_sampled"
+
+
+def is_graphql_view(view_func):
+    view_class = getattr(view_func, "view_class", None)
+    return view_class is not None and issubclass(view_class, BaseGraphQLView)
+
+
+def truncate_body(body):
+    max_length = core_settings.LOG_BODY_MAX_LENGTH
+    text = body[:max_length].decode("utf-8", errors="replace")
+    if len(body) > max_length:
+        text += f"... ({len(body)} bytes)"
+    return remove_new_lines(text)
+
+
+class GraphQLLoggingMiddleware(MiddlewareMixin):
+    """
+    Logs the errors of every graphql request (taken from the execution result, see
+    core.views.GraphQLView) & the request/response bodies of a sample of them, capped in size.
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not is_graphql_view(view_func):
+            return None
+
+        sampled = random.random() < core_settings.LOG_BODY_SAMPLE_RATE
+        setattr(request, LOG_SAMPLED_ATTR, sampled)
+
+        if sampled and request.content_type == "application/json":
+            logger.info("Request Body: %s", truncate_body(request.body))
+        return None
+
+    def process_response(self, request, response):
+        if not hasattr(request, LOG_SAMPLED_ATTR):
+            return response
+
+        errors = get_graphql_errors(request)
+        if errors:
+            logger.error("GraphQL Error: %s", [getattr(error, "formatted", str(error)) for error in errors])
+        elif response.status_code >= 400:
+            logger.error("GraphQL Error: %s responded with %s", request.path, response.status_code)
+
+        if getattr(request, LOG_SAMPLED_ATTR, False) and not response.streaming:
+            logger.info("GraphQL Data: %s", truncate_body(response.content))
+        return response
+
+
+class ResolverMetricsMiddleware:
+    """
+    Graphene middleware recording the calls, errors, time & sql queries of every field with a
+    resolver of its own into core.metrics.resolver_metrics (and the trace of the operation, see
+    core.tracing), errors are logged & raised again for graphql to report them. Successful calls
+    are only logged for a sample (see `RESOLVER_LOG_SAMPLE_RATE`).
+    """
+
+    # (parent type, field name) -> FieldStats, or None for fields that are not measured
+    field_stats = {}
+
+    def __init__(self):
+        self.log_sample_rate = core_settings.RESOLVER_LOG_SAMPLE_RATE
+
+    def get_field_stats(self, info):
+        key = (info.parent_type.name, info.field_name)
+        if key not in self.field_stats:
+            # introspection fields (`__typename` & co.) are not part of the type's fields
+            field = info.parent_type.fields.get(info.field_name)
+            measured = field is not None and not is_default_resolver(field.resolve)
+            self.field_stats[key] = resolver_metrics.get(f"{key[0]}.{key[1]}") if measured else None
+        return self.field_stats[key]
+
+    def resolve(self, next, root, info, **kwargs):
+        stats = self.get_field_stats(info)
+        if stats is None:
+            return next(root, info, **kwargs)
+
+        call = ResolverCall(info)
+        token = current_call.set(call)
+        try:
+            result = next(root, info, **kwargs)
+        except Exception as e:
+            self.record_error(stats, call, e)
+            raise
+        finally:
+            current_call.reset(token)
+
+        if is_awaitable(result):
+            return self.resolve_async(result, stats, call)
+        self.record(stats, call)
+        return result
+
+    async def resolve_async(self, result, stats, call):
+        token = current_call.set(call)
+        try:
+            result = await result
+        except Exception as e:
+            self.record_error(stats, call, e)
+            raise
+        finally:
+            current_call.reset(token)
+        self.record(stats, call)
+        return result
+
+    def record(self, stats, call):
+        duration = perf_counter() - call.start
+        resolver_metrics.record(stats, duration, sql_queries=call.sql_queries, sql_time=call.sql_time)
+        self.trace(call)
+        if self.log_sample_rate and random.random() < self.log_sample_rate:
+            info = call.info
+            logger.info("Ran %s: %s (%.2fms, %s queries)", info.parent_type.name, info.field_name, duration * 1000, call.sql_queries)
+
+    def record_error(self, stats, call, error):
+        info = call.info
+        resolver_metrics.record(stats, perf_counter() - call.start, error=True, sql_queries=call.sql_queries, sql_time=call.sql_time)
+        self.trace(call)
+        logger.error("Error in %s.%s at %s: %s", info.parent_type.name, info.field_name, info.path.as_list(), error)
+
+    def trace(self, call):
+        tracer = current_tracer.get()
+        if tracer is not None:
+            tracer.record(call)
@@ -1,6 +1,7 @@
 import uuid
 from django.db import models
 from django.conf import settings
+from core.cache import ModelCacheDescriptor
 
 class BaseModel(models.Model):
     class Meta:
@@ -11,4 +12,7 @@ class BaseModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, related_name='%(class)s_created_by', on_delete=models.SET_NULL, db_column="created_by")
-    updated_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, related_name='%(class)s_updated_by', on_delete=models.SET_NULL, db_column="updated_by")
\ No newline at end of file
+    updated_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, related_name='%(class)s_updated_by', on_delete=models.SET_NULL, db_column="updated_by")
+
+    # cache-aside reads by pk or uuid, e.g. `Role.cached.get(pk=1)` (see core.cache)
+    cached = ModelCacheDescriptor()
\ No newline at end of file
@@ -0,0 +1,198 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Manager, Prefetch
+from django.db.models.query import QuerySet
+from graphene.utils.str_converters import to_snake_case
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode, get_named_type
+
+# graphql fields that never need a column besides the primary key
+PK_FIELD_NAMES = {"id", "pk"}
+# connection arguments that are applied on the prefetched rows in memory
+PAGINATION_ARGUMENTS = {"first", "last", "after", "before", "offset"}
+
+
+# merges the selections of the given field nodes by response name, fragments are flattened in
+# place since every object type we optimize for is a concrete django model
+def collect_fields(info, field_nodes):
+    fields = {}
+
+    def collect(selection_set):
+        if selection_set is None:
+            return
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                fields.setdefault(selection.name.value, []).append(selection)
+            elif isinstance(selection, InlineFragmentNode):
+                collect(selection.selection_set)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = info.fragments.get(selection.name.value)
+                if fragment is not None:
+                    collect(fragment.selection_set)
+
+    for field_node in field_nodes:
+        collect(field_node.selection_set)
+    return fields
+
+
+def get_connection_node_type(graphql_type):
+    graphene_type = getattr(get_named_type(graphql_type), "graphene_type", None)
+    return getattr(getattr(graphene_type, "_meta", None), "node", None)
+
+
+# field nodes selected below `edges { node { ... } }` of a connection
+def get_node_field_nodes(info, field_nodes):
+    node_field_nodes = []
+    for edges in collect_fields(info, field_nodes).get("edges", []):
+        node_field_nodes.extend(collect_fields(info, [edges]).get("node", []))
+    return node_field_nodes
+
+
+class QueryPlan:
+    def __init__(self):
+        self.only = set()
+        self.select_related = set()
+        self.prefetch_related = []
+        self.can_defer = True
+
+    def apply(self, queryset):
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        if self.can_defer and self.only:
+            queryset = queryset.only(*self.only)
+        return queryset
+
+
+class QueryOptimizer:
+    """
+    Derives `only()`, `select_related()` & `Prefetch(...)` for a queryset out of the selection set
+    of the graphql field resolving it. Fields that are not backed by a model field can declare the
+    lookups they read through the `optimizer_hints` of their `RelayObjectType`, any other unknown
+    field keeps every column of its model loaded.
+    """
+
+    def __init__(self, info):
+        self.info = info
+
+    def optimize(self, queryset, graphene_type, field_nodes):
+        plan = QueryPlan()
+        self.plan_model(plan, queryset.model, graphene_type, field_nodes, prefix="")
+        return plan.apply(queryset)
+
+    def plan_model(self, plan, model, graphene_type, field_nodes, prefix):
+        graphql_type = self.info.schema.get_type(graphene_type._meta.name)
+        hints = getattr(graphene_type._meta, "optimizer_hints", None) or {}
+        plan.only.add(prefix + model._meta.pk.attname)
+        # global ids are built from (& nodes looked up by) `global_id_field` of RelayObjectType
+        global_id_field = getattr(graphene_type._meta, "global_id_field", None) or "pk"
+        if global_id_field != "pk":
+            plan.only.add(prefix + model._meta.get_field(global_id_field).attname)
+
+        for name, selections in collect_fields(self.info, field_nodes).items():
+            if name.startswith("__"):
+                continue
+
+            field_name = to_snake_case(name)
+            if field_name in hints:
+                for lookup in hints[field_name]:
+                    self.plan_lookup(plan, model, lookup, prefix)
+                continue
+            if field_name in PK_FIELD_NAMES:
+                continue
+
+            try:
+                model_field = self.get_model_field(model, field_name)
+            except FieldDoesNotExist:
+                # we cannot know what a custom resolver reads, so nothing is deferred for it
+                plan.can_defer = False
+                continue
+
+            if not model_field.is_relation:
+                plan.only.add(prefix + model_field.attname)
+                continue
+
+            graphql_field = graphql_type.fields.get(name) if graphql_type else None
+            if graphql_field is None:
+                continue
+
+            if model_field.many_to_many or model_field.one_to_many:
+                self.plan_prefetch(plan, model_field, field_name, graphql_field, selections, prefix)
+            else:
+                self.plan_select_related(plan, model_field, field_name, graphql_field, selections, prefix)
+
+    def plan_select_related(self, plan, model_field, field_name, graphql_field, selections, prefix):
+        related_type = getattr(get_named_type(graphql_field.type), "graphene_type", None)
+        if related_type is None or not hasattr(related_type, "_meta"):
+            return
+
+        if model_field.concrete:
+            plan.only.add(prefix + model_field.attname)
+        plan.select_related.add(prefix + field_name)
+        self.plan_model(plan, model_field.related_model, related_type, selections, prefix=f"{prefix}{field_name}__")
+
+    def plan_prefetch(self, plan, model_field, field_name, graphql_field, selections, prefix):
+        node_type = get_connection_node_type(graphql_field.type)
+        if node_type is None:
+            return
+
+        # filtered connections are resolved (and filtered) on their own
+        arguments = {argument.name.value for selection in selections for argument in selection.arguments}
+        if arguments - PAGINATION_ARGUMENTS:
+            return
+
+        related_model = model_field.related_model
+        queryset = related_model._default_manager.all()
+        node_plan = QueryPlan()
+        self.plan_model(node_plan, related_model, node_type, get_node_field_nodes(self.info, selections), prefix="")
+
+        # the reverse side of a foreign key has to be loaded for django to match the prefetched rows
+        if model_field.one_to_many:
+            node_plan.only.add(model_field.field.attname)
+
+        plan.prefetch_related.append(Prefetch(prefix + self.get_accessor_name(model_field), queryset=node_plan.apply(queryset)))
+
+    def plan_lookup(self, plan, model, lookup, prefix):
+        parts = lookup.split("__")
+        current_model = model
+        path = prefix
+        for part in parts[:-1]:
+            model_field = self.get_model_field(current_model, part)
+            if model_field.concrete:
+                plan.only.add(path + model_field.attname)
+            path += part
+            plan.select_related.add(path)
+            path += "__"
+            current_model = model_field.related_model
+            plan.only.add(path + current_model._meta.pk.attname)
+        plan.only.add(path + self.get_model_field(current_model, parts[-1]).attname)
+
+    @staticmethod
+    def get_model_field(model, name):
+        for field in model._meta.get_fields():
+            if field.is_relation and field.auto_created and not field.concrete:
+                if field.get_accessor_name() == name:
+                    return field
+            elif field.name == name:
+                return field
+        raise FieldDoesNotExist(f"{model.__name__} has no field named '{name}'")
+
+    @staticmethod
+    def get_accessor_name(model_field):
+        if model_field.auto_created and not model_field.concrete:
+            return model_field.get_accessor_name()
+        return model_field.name
+
+
+# optimizes the queryset resolving the current graphql field for the given django object type,
+# the field can either return the type itself (e.g. `user(id:)`) or a connection of it
+def optimize_queryset(queryset, info, graphene_type):
+    if isinstance(queryset, Manager):
+        queryset = queryset.all()
+    if not isinstance(queryset, QuerySet) or queryset._result_cache is not None:
+        return queryset
+
+    field_nodes = info.field_nodes
+    if get_connection_node_type(info.return_type) is not None:
+        field_nodes = get_node_field_nodes(info, field_nodes)
+
+    return QueryOptimizer(info).optimize(queryset, graphene_type, field_nodes)
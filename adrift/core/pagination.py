@@ -0,0 +1,128 @@
+import base64
+import json
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from graphql import GraphQLError
+
+KEYSET_CURSOR_PREFIX = "keyset:"
+
+
+def is_keyset_cursor(cursor):
+    try:
+        return base64.urlsafe_b64decode(cursor.encode("ascii")).startswith(KEYSET_CURSOR_PREFIX.encode("ascii"))
+    except (ValueError, UnicodeError, AttributeError):
+        return False
+
+
+# the queryset with the given columns loaded, in case `only()`/`defer()` left them out
+def ensure_loaded(queryset, attnames):
+    field_names, defer = queryset.query.deferred_loading
+    if defer:
+        missing = field_names & set(attnames)
+        if missing:
+            queryset = queryset._chain()
+            queryset.query.deferred_loading = (field_names - missing, True)
+    elif field_names and not set(attnames) <= field_names:
+        queryset = queryset.only(*field_names, *attnames)
+    return queryset
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset by seeking on its ordering instead of counting rows off: cursors carry
+    the ordering values of their row (with the primary key as tiebreaker), `after`/`before` turn
+    into `WHERE (a, pk) > (x, y)` predicates & `first`/`last` fetch exactly one row more than
+    asked for to tell whether another page follows.
+
+    Only orderings over non nullable, non relational columns can be seeked on, `ordering` is None
+    for any other queryset (which is then paginated by offset).
+    """
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+        self.ordering = self.get_ordering(queryset) if isinstance(queryset, QuerySet) else None
+
+    @staticmethod
+    def get_ordering(queryset):
+        model = queryset.model
+        query = queryset.query
+        order_by = query.order_by or (query.default_ordering and model._meta.ordering) or ()
+
+        ordering = []
+        for item in order_by:
+            if not isinstance(item, str) or item == "?" or "__" in item:
+                return None
+            descending = item.startswith("-")
+            name = item.lstrip("-+")
+            try:
+                field = model._meta.pk if name == "pk" else model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if not field.concrete or field.null or field.is_relation:
+                return None
+            ordering.append((field, descending))
+
+        if not any(field.primary_key for field, _ in ordering):
+            ordering.append((model._meta.pk, ordering[-1][1] if ordering else False))
+        return ordering
+
+    @property
+    def signature(self):
+        return [("-" if descending else "") + field.attname for field, descending in self.ordering]
+
+    def encode_cursor(self, obj):
+        values = [field.value_to_string(obj) for field, _ in self.ordering]
+        data = json.dumps({"o": self.signature, "v": values}, separators=(",", ":"))
+        return base64.urlsafe_b64encode((KEYSET_CURSOR_PREFIX + data).encode("utf-8")).decode("ascii")
+
+    def decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+            if not data.startswith(KEYSET_CURSOR_PREFIX):
+                raise ValueError(cursor)
+            data = json.loads(data[len(KEYSET_CURSOR_PREFIX):])
+            if data["o"] != self.signature:
+                raise GraphQLError("Cursor does not match the ordering of the connection.")
+            return [field.to_python(value) for (field, _), value in zip(self.ordering, data["v"], strict=True)]
+        except GraphQLError:
+            raise
+        except Exception:
+            raise GraphQLError(f"Invalid cursor: {cursor}")
+
+    # rows coming after (or before, when reversed) the given ordering values
+    def seek(self, values, reverse=False):
+        predicate = Q()
+        for index, (field, descending) in enumerate(self.ordering):
+            lookup = "lt" if descending != reverse else "gt"
+            condition = {f"{previous.attname}": value for (previous, _), value in zip(self.ordering[:index], values)}
+            condition[f"{field.attname}__{lookup}"] = values[index]
+            predicate |= Q(**condition)
+        return predicate
+
+    def order_by(self, queryset, reverse=False):
+        return queryset.order_by(*[("-" if descending != reverse else "") + field.attname for field, descending in self.ordering])
+
+    # returns (rows, has_previous_page, has_next_page) of the page described by the relay arguments
+    def paginate(self, first=None, last=None, after=None, before=None):
+        queryset = ensure_loaded(self.queryset, [field.attname for field, _ in self.ordering])
+        if after is not None:
+            queryset = queryset.filter(self.seek(self.decode_cursor(after)))
+        if before is not None:
+            queryset = queryset.filter(self.seek(self.decode_cursor(before), reverse=True))
+
+        if last is not None and first is None:
+            rows = list(self.order_by(queryset, reverse=True)[: last + 1])
+            has_previous_page = len(rows) > last
+            rows = rows[:last][::-1]
+            return rows, has_previous_page, before is not None
+
+        queryset = self.order_by(queryset)
+        rows = list(queryset[: first + 1] if first is not None else queryset)
+        has_next_page = first is not None and len(rows) > first
+        rows = rows[:first]
+        has_previous_page = after is not None
+        if last is not None:
+            has_previous_page = has_previous_page or len(rows) > last
+            rows = rows[-last:] if last else []
+        return rows, has_previous_page, has_next_page
@@ -0,0 +1,44 @@
+from django.core.cache import cache
+from core.settings import core_settings
+
+# attribute the role names are memoized under on the user object, which lives for one request
+ROLE_NAMES_ATTR = "_core_role_names"
+ROLE_CACHE_PREFIX = "core:roles"
+
+
+def get_role_cache_key(user_id):
+    return f"{ROLE_CACHE_PREFIX}:{user_id}"
+
+
+# the names of every role the user has, loaded once per request and shared between requests
+# through the cache for `ROLE_CACHE_TIMEOUT` seconds
+def get_role_names(user):
+    role_names = getattr(user, ROLE_NAMES_ATTR, None)
+    if role_names is not None:
+        return role_names
+
+    timeout = core_settings.ROLE_CACHE_TIMEOUT
+    cache_key = get_role_cache_key(user.pk)
+    role_names = cache.get(cache_key) if timeout else None
+    if role_names is None:
+        role_names = frozenset(user.roles.values_list("name", flat=True))
+        if timeout:
+            cache.set(cache_key, role_names, timeout)
+
+    setattr(user, ROLE_NAMES_ATTR, role_names)
+    return role_names
+
+
+# drops the role names memoized on the user, e.g. once a mutation of the request changed them
+def clear_role_names(user):
+    if hasattr(user, ROLE_NAMES_ATTR):
+        delattr(user, ROLE_NAMES_ATTR)
+
+
+def has_any_role(user, role_names):
+    return not get_role_names(user).isdisjoint(role_names)
+
+
+# called whenever the roles of a user change so the next request sees them straight away
+def invalidate_role_names(*user_ids):
+    cache.delete_many([get_role_cache_key(user_id) for user_id in user_ids])
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import uuid
+from django.core.cache import cache
+from graphene.utils.str_converters import to_snake_case
+from graphql import (
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLObjectType,
+    InlineFragmentNode,
+    OperationType,
+    get_named_type,
+    get_operation_ast,
+    print_ast,
+)
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.settings import jwt_settings
+from graphql_jwt.utils import get_credentials, get_payload
+from core.documents import LRUCache, get_query_hash
+from core.settings import core_settings
+from core.types import RelayObjectTypeOptions
+
+RESPONSE_CACHE_PREFIX = "core:response"
+MODEL_VERSION_CACHE_PREFIX = "core:response-version"
+
+
+class CachePolicy:
+    """
+    How long the response to an operation can be cached for, i.e. the lowest cache hint among
+    the fields it selects, & the models its response is built from.
+    """
+
+    def __init__(self, max_age=0, models=(), query_hash=None):
+        self.max_age = max_age
+        self.models = sorted({model._meta.label_lower for model in models})
+        self.query_hash = query_hash
+
+
+class Uncacheable(Exception):
+    pass
+
+
+class CachePolicyBuilder:
+    """
+    Walks the selection set of an operation: every field selected on a `RelayObjectType` takes its
+    `cache_hints` entry (or the type's `cache_max_age`), fields of other types (connections, edges,
+    page info & the root types) inherit from their parent. A field without a hint, selections on
+    interfaces & introspection make the whole operation uncacheable.
+    """
+
+    def __init__(self, schema, document):
+        self.schema = schema
+        self.fragments = {
+            definition.name.value: definition
+            for definition in document.definitions
+            if isinstance(definition, FragmentDefinitionNode)
+        }
+        self.max_age = None
+        self.models = set()
+
+    def build(self, document, operation_name):
+        operation = get_operation_ast(document, operation_name)
+        if operation is None or operation.operation != OperationType.QUERY:
+            return CachePolicy()
+
+        try:
+            self.visit(self.schema.query_type, operation.selection_set)
+        except Uncacheable:
+            return CachePolicy()
+
+        if not self.max_age:
+            return CachePolicy()
+        # formatting is normalized, so the same query sent differently shares its responses
+        return CachePolicy(self.max_age, self.models, get_query_hash(print_ast(document)))
+
+    def visit(self, parent_type, selection_set):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                self.visit_field(parent_type, selection)
+            elif isinstance(selection, InlineFragmentNode):
+                type_condition = selection.type_condition
+                self.visit(self.schema.get_type(type_condition.name.value) if type_condition else parent_type, selection.selection_set)
+            elif isinstance(selection, FragmentSpreadNode):
+                fragment = self.fragments[selection.name.value]
+                self.visit(self.schema.get_type(fragment.type_condition.name.value), fragment.selection_set)
+
+    def visit_field(self, parent_type, field_node):
+        name = field_node.name.value
+        if name == "__typename":
+            return
+        if name.startswith("__") or not isinstance(parent_type, GraphQLObjectType):
+            raise Uncacheable()
+
+        meta = getattr(getattr(parent_type, "graphene_type", None), "_meta", None)
+        if isinstance(meta, RelayObjectTypeOptions):
+            self.models.add(meta.model)
+            self.restrict(meta.cache_hints.get(to_snake_case(name), meta.cache_max_age))
+
+        if field_node.selection_set is not None:
+            self.visit(get_named_type(parent_type.fields[name].type), field_node.selection_set)
+
+    def restrict(self, max_age):
+        if not max_age:
+            raise Uncacheable()
+        self.max_age = max_age if self.max_age is None else min(self.max_age, max_age)
+
+
+cache_policies = LRUCache("DOCUMENT_CACHE_SIZE")
+
+
+def get_cache_policy(schema, document, operation_name, query_hash):
+    key = (query_hash, operation_name)
+    policy = cache_policies.get(key)
+    if policy is None:
+        policy = CachePolicyBuilder(schema, document).build(document, operation_name)
+        cache_policies.set(key, policy)
+    return policy
+
+
+# who the response is for, None when it must not be cached at all (e.g. an invalid token, or an
+# authenticated user while `RESPONSE_CACHE_AUTHENTICATED` is off)
+def get_auth_scope(request):
+    token = get_credentials(request)
+    if token is not None:
+        try:
+            payload = get_payload(token, request)
+        except JSONWebTokenError:
+            return None
+        username = jwt_settings.JWT_PAYLOAD_GET_USERNAME_HANDLER(payload)
+        return f"user:{username}" if core_settings.RESPONSE_CACHE_AUTHENTICATED else None
+
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.get_username()}" if core_settings.RESPONSE_CACHE_AUTHENTICATED else None
+    return "anonymous"
+
+
+def get_model_version_cache_key(label):
+    return f"{MODEL_VERSION_CACHE_PREFIX}:{label}"
+
+
+# every model carries a random version which is part of the response cache keys, replacing it
+# orphans every cached response built from the model
+def get_model_versions(labels):
+    keys = [get_model_version_cache_key(label) for label in labels]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = uuid.uuid4().hex[:8]
+            versions[key] = version if cache.add(key, version, timeout=None) else cache.get(key, version)
+    return [versions[key] for key in keys]
+
+
+def invalidate_responses(*models):
+    cache.set_many({get_model_version_cache_key(model._meta.label_lower): uuid.uuid4().hex[:8] for model in models}, timeout=None)
+
+
+def get_response_cache_key(policy, operation_name, variables, scope):
+    key = json.dumps(
+        [policy.query_hash, operation_name, variables, scope, get_model_versions(policy.models)],
+        sort_keys=True,
+        default=str,
+    )
+    return f"{RESPONSE_CACHE_PREFIX}:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
@@ -0,0 +1,77 @@
+from django.conf import settings
+
+# default values for every knob read through `core_settings`, the project can override
+# any of them through the `CORE` dict in the django settings module
+DEFAULTS = {
+    # upper bound for `totalCount`, counting stops at this many rows (None = exact count)
+    "COUNT_MAX": None,
+    # seconds a connection count is cached for per filter fingerprint (0 = no caching)
+    "COUNT_CACHE_TIMEOUT": 5,
+    # seconds the role names of a user are cached for between requests (0 = no caching)
+    "ROLE_CACHE_TIMEOUT": 60,
+    # issue tokens carrying the user's claims & authenticate them without a database query, needs a
+    # default cache shared by every process (redis, memcached or the database) to revoke them
+    "JWT_CLAIMS": False,
+    # share of graphql requests whose request & response bodies get logged
+    "LOG_BODY_SAMPLE_RATE": 0.01,
+    # bodies are cut off after this many bytes in the logs
+    "LOG_BODY_MAX_LENGTH": 2048,
+    # share of successful resolver calls that get logged (errors are always logged)
+    "RESOLVER_LOG_SAMPLE_RATE": 0,
+    # accept automatic persisted queries, i.e. a sha256 hash in place of the query text
+    "PERSISTED_QUERIES": True,
+    # parsed & validated documents kept per process (0 = no caching)
+    "DOCUMENT_CACHE_SIZE": 1000,
+    # seconds persisted query texts are kept in the django cache (0 = per process only)
+    "PERSISTED_QUERY_CACHE_TIMEOUT": 60 * 60 * 24,
+    # serve cacheable queries (see `cache_max_age` & `cache_hints` of RelayObjectType) from the cache
+    "RESPONSE_CACHE": False,
+    # also cache the responses of authenticated users, per user (anonymous ones only otherwise)
+    "RESPONSE_CACHE_AUTHENTICATED": False,
+    # serve /graphql with core.views.AsyncGraphQLView, meant for ASGI servers (e.g. uvicorn workers)
+    "ASYNC_VIEW": False,
+    # operations accepted in a single batch request (a json array of operations)
+    "BATCH_MAX_OPERATIONS": 20,
+    # run the queries of a batch concurrently (AsyncGraphQLView only)
+    "BATCH_CONCURRENT": False,
+    # deepest field nesting an operation may select (None = unbounded)
+    "QUERY_MAX_DEPTH": 10,
+    # highest cost an operation may have, connections count once per requested node (None = unbounded)
+    "QUERY_MAX_COST": 5000,
+    # trace the operations of requests sending the `X-GraphQL-Tracing` header, see core.tracing
+    "TRACING": False,
+    # bearer token the metrics endpoint requires (None = the endpoint is disabled)
+    "METRICS_TOKEN": None,
+    # in DEBUG, warn when the same sql shape runs more than this many times in one operation (None = never)
+    "REPEATED_QUERY_THRESHOLD": 10,
+    # items a bulk mutation (e.g. assignRoles) accepts at once, counting every (user, role) pair
+    "BULK_MUTATION_MAX_ITEMS": 10000,
+    # entries of the process local tier of the model cache (see core.cache), 0 = shared cache only
+    "LOCAL_CACHE_SIZE": 1000,
+    # seconds entries are kept in the local tier, i.e. how long another process may serve a row
+    # changed elsewhere
+    "LOCAL_CACHE_TIMEOUT": 5,
+    # seconds rows read through `Model.cached` are kept in the shared cache by default
+    "MODEL_CACHE_TIMEOUT": 300,
+    # dotted path of the function serializing responses (see core.encoders), None = orjson when
+    # installed, the standard library otherwise
+    "JSON_ENCODER": None,
+    # rows per chunk of connection exports (see core.export)
+    "EXPORT_CHUNK_SIZE": 1000,
+    # database aliases the reads of query operations are spread over (see core.db.routers)
+    "REPLICA_DATABASES": [],
+    # seconds a replica that failed to connect is left out
+    "REPLICA_EJECT_TIMEOUT": 30,
+    # seconds the reads of a client go to the primary after it mutated (0 = never)
+    "READ_YOUR_WRITES_TIMEOUT": 5,
+}
+
+
+class CoreSettings:
+    def __getattr__(self, name):
+        if name not in DEFAULTS:
+            raise AttributeError(f"Invalid core setting: '{name}'")
+        return getattr(settings, "CORE", {}).get(name, DEFAULTS[name])
+
+
+core_settings = CoreSettings()
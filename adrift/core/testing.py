@@ -0,0 +1,68 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from graphene_django.settings import graphene_settings
+
+
+class GraphQLQueryTestCase(TestCase):
+    """
+    Executes graphql documents against the project's schema (`GRAPHENE["SCHEMA"]`) in-process,
+    with a fresh request as context like the view would, & asserts on the sql they run.
+    """
+
+    schema = None
+
+    def get_schema(self):
+        return self.schema or graphene_settings.SCHEMA
+
+    def get_context(self, user=None):
+        request = RequestFactory().post("/graphql")
+        request.user = user or AnonymousUser()
+        return request
+
+    def execute(self, query, variables=None, user=None, operation_name=None):
+        return self.get_schema().execute(
+            query,
+            variable_values=variables,
+            context_value=self.get_context(user),
+            operation_name=operation_name,
+        )
+
+    def assertExecutes(self, query, variables=None, user=None, operation_name=None):
+        result = self.execute(query, variables=variables, user=user, operation_name=operation_name)
+        self.assertIsNone(result.errors, result.errors)
+        return result.data
+
+    # executes the query with captured sql, returns (data, captured queries), the cache is cleared
+    # first so that cached counts & role names do not hide queries
+    def execute_counted(self, query, variables=None, user=None, operation_name=None, using=DEFAULT_DB_ALIAS):
+        cache.clear()
+        with CaptureQueriesContext(connections[using]) as context:
+            data = self.assertExecutes(query, variables=variables, user=user, operation_name=operation_name)
+        return data, context.captured_queries
+
+    def assertNumQueriesConstant(self, query, seed, sizes=(10, 100), variables=None, user=None, count_nodes=None):
+        """
+        Fails when the number of queries executed by `query` grows with the number of nodes it
+        returns, i.e. the query suffers from N+1 queries. `seed(size)` brings the data to `size`
+        nodes before each execution, `count_nodes(data)` (if given) checks that it did.
+        """
+        counts = []
+        for size in sizes:
+            seed(size)
+            data, queries = self.execute_counted(query, variables=variables, user=user)
+            if count_nodes is not None:
+                self.assertEqual(count_nodes(data), size, f"expected the query to return {size} nodes")
+            counts.append((size, queries))
+
+        (first_size, first_queries), *others = counts
+        for size, queries in others:
+            if len(queries) != len(first_queries):
+                executed = "\n".join(f"{index}. {query['sql']}" for index, query in enumerate(queries, start=1))
+                self.fail(
+                    f"{len(first_queries)} queries for {first_size} nodes but {len(queries)} for {size} nodes, "
+                    f"queries executed for {size} nodes:\n{executed}"
+                )
+        return len(first_queries)
@@ -0,0 +1,144 @@
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from time import perf_counter, perf_counter_ns
+from django.db import connections
+from django.db.backends.signals import connection_created
+from core.settings import core_settings
+from core.utils import logger
+
+# requests sending this header (with tracing enabled, see `TRACING`) get the trace of their
+# operation under `extensions.tracing`
+TRACING_HEADER = "X-GraphQL-Tracing"
+
+# the tracer of the operation being executed & the resolver call being measured, the sql
+# queries executed meanwhile are attributed to both
+current_tracer = ContextVar("graphql_tracer", default=None)
+current_call = ContextVar("graphql_resolver_call", default=None)
+current_detector = ContextVar("graphql_repeated_query_detector", default=None)
+
+# placeholders of `IN (...)` lists, so batches of different sizes share their shape
+IN_LIST_PATTERN = re.compile(r"\((?:%s, )+%s\)")
+
+
+class ResolverCall:
+    __slots__ = ("info", "start", "start_ns", "sql_queries", "sql_time")
+
+    def __init__(self, info):
+        self.info = info
+        self.start = perf_counter()
+        self.start_ns = perf_counter_ns()
+        self.sql_queries = 0
+        self.sql_time = 0.0
+
+
+class OperationTracer:
+    """
+    Collects the resolver calls of an operation in apollo's tracing format (version 1), each with
+    the number & time of the sql queries it executed. Only fields with a resolver of their own
+    are traced, see core.middlewares.ResolverMetricsMiddleware.
+    """
+
+    def __init__(self):
+        self.start_time = datetime.now(timezone.utc)
+        self.start_ns = perf_counter_ns()
+        self.resolvers = []
+        self.sql_queries = 0
+        self.sql_time = 0.0
+
+    def record(self, call):
+        info = call.info
+        self.resolvers.append({
+            "path": info.path.as_list(),
+            "parentType": info.parent_type.name,
+            "fieldName": info.field_name,
+            "returnType": str(info.return_type),
+            "startOffset": call.start_ns - self.start_ns,
+            "duration": perf_counter_ns() - call.start_ns,
+            "sqlQueries": call.sql_queries,
+            "sqlDuration": int(call.sql_time * 1e9),
+        })
+
+    @property
+    def extensions(self):
+        return {
+            "tracing": {
+                "version": 1,
+                "startTime": self.start_time.isoformat(),
+                "endTime": datetime.now(timezone.utc).isoformat(),
+                "duration": perf_counter_ns() - self.start_ns,
+                "execution": {"resolvers": self.resolvers},
+                "sql": {"queries": self.sql_queries, "duration": int(self.sql_time * 1e9)},
+            }
+        }
+
+
+class RepeatedQueryDetector:
+    """
+    Counts the sql statements of an operation by shape (their sql without the parameters) & logs
+    a warning, with the path of the resolver running it, once a shape repeats more than
+    `REPEATED_QUERY_THRESHOLD` times, which usually means N+1 queries. Only used in DEBUG.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.shapes = Counter()
+
+    def record(self, sql, call):
+        shape = IN_LIST_PATTERN.sub("(%s, ...)", sql)
+        self.shapes[shape] += 1
+        if self.shapes[shape] == self.threshold + 1:
+            path = call.info.path.as_list() if call is not None else None
+            logger.warning("Query repeated %s times at %s: %s", self.shapes[shape], path, shape)
+
+
+# sets the tracer & the repeated query detector (if any) of the operation executed within
+@contextmanager
+def trace_operation(tracer=None, detector=None):
+    tracer_token = current_tracer.set(tracer)
+    detector_token = current_detector.set(detector)
+    try:
+        yield
+    finally:
+        current_tracer.reset(tracer_token)
+        current_detector.reset(detector_token)
+
+
+def get_repeated_query_detector(debug):
+    threshold = core_settings.REPEATED_QUERY_THRESHOLD
+    return RepeatedQueryDetector(threshold) if debug and threshold else None
+
+
+def record_sql(execute, sql, params, many, context):
+    call = current_call.get()
+    tracer = current_tracer.get()
+    detector = current_detector.get()
+    if detector is not None:
+        detector.record(sql, call)
+    if call is None and tracer is None:
+        return execute(sql, params, many, context)
+
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = perf_counter() - start
+        if call is not None:
+            call.sql_queries += 1
+            call.sql_time += duration
+        if tracer is not None:
+            tracer.sql_queries += 1
+            tracer.sql_time += duration
+
+
+def install_sql_recorder(connection, **kwargs):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+# every database connection (of every alias & thread) records the queries of the resolvers
+connection_created.connect(install_sql_recorder, dispatch_uid="core.tracing.install_sql_recorder")
+for connection in connections.all(initialized_only=True):
+    install_sql_recorder(connection)
@@ -1,20 +1,35 @@
+from functools import partial
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import QuerySet
 import graphene
-from graphene import relay
+from graphene import relay, Dynamic
 from graphql import GraphQLError
+from graphql.pyutils import is_awaitable
 from graphene.relay.node import NodeField, Node
+from graphene.relay.connection import connection_adapter, page_info_adapter
+from graphql_relay import connection_from_array_slice, cursor_to_offset, from_global_id, get_offset_with_default, offset_to_cursor
 from graphene_django import DjangoObjectType as BaseObjectType
+from graphene_django.types import DjangoObjectTypeOptions
 from graphene_django.filter import DjangoFilterConnectionField as BaseRelayFilterConnectionField
-from core.utils import handle_graphql_error
+from graphene_django.utils import maybe_queryset
+from promise import Promise
+from core.cache import LOOKUP_FIELDS
+from core.counting import count_iterable
+from core.db.routers import use_primary
+from core.export import current_export
+from core.loaders import get_relation_fields, get_request_loaders, relation_resolver
+from core.optimizer import optimize_queryset
+from core.pagination import KeysetPaginator, is_keyset_cursor
+from core.permissions import has_any_role
 
 def eval_permission(user, login_required=False, permission_roles=[]):
     if login_required and not user.is_authenticated:
         raise Exception("Only for logged-in users.")
     
-    if (user.is_authenticated):
-        user_has_permission = user.roles.exists_by_names(permission_roles)
-    
-    if login_required and permission_roles and not user_has_permission:
+    # roles are only looked up when they are required, and then only once per request
+    if login_required and permission_roles and not has_any_role(user, permission_roles):
         raise Exception("You do not have the permission to access this.")
     
     return True
@@ -28,21 +43,71 @@ class RelayNode(Node):
         return NodeField(cls, *args, **kwargs)
     
     @classmethod
-    @handle_graphql_error()
     def node_resolver(cls, only_type, root, info, id):
         # check whether the query requires permission
         eval_permission(info.context.user, cls.login_required, cls.permission_roles)
-        return super().get_node_from_global_id(info, id, only_type=only_type)
-    
+        node = super().get_node_from_global_id(info, id, only_type=only_type)
+        return get_request_loaders(info.context).register(node) if node is not None else node
+
+    # a list of nodes of the given type looked up by their global ids at once, e.g.
+    # `users = RelayNode.NodesField(UserNode)` resolves `users(ids: [...])`
+    @classmethod
+    def NodesField(cls, only_type, **kwargs):
+        login_required = kwargs.pop("login_required", False)
+        permission_roles = kwargs.pop("permission_roles", [])
+        return graphene.Field(
+            graphene.List(only_type),
+            ids=graphene.List(graphene.NonNull(graphene.ID), required=True),
+            resolver=partial(cls.nodes_resolver, only_type, login_required, permission_roles),
+            **kwargs,
+        )
+
+    # the nodes in the order of `ids`, None for the ones that do not exist & an error (at the index
+    # of the id) for the ones that are malformed or of another type, as `node_resolver` reports them
+    @classmethod
+    def nodes_resolver(cls, only_type, login_required, permission_roles, root, info, ids):
+        eval_permission(info.context.user, login_required, permission_roles)
+        ids = [only_type.decode_global_id(global_id) for global_id in ids]
+        nodes = get_request_loaders(info.context).register_many(only_type.get_nodes(info, ids))
+        return [GraphQLError(f"Must receive a {only_type._meta.name} id.") if id is None else node for id, node in zip(ids, nodes)]
+
 
 class CountableConnection(graphene.Connection):
     class Meta:
         abstract = True
 
     total_count = graphene.Int()
+    total_count_capped = graphene.Boolean(description="Indicates whether totalCount stopped at the configured maximum.")
 
+    # the length is known when the page reached the end of the rows (see
+    # RelayFilterConnectionField.resolve_connection), the rows are only counted when asked to otherwise
     def resolve_total_count(root, info, **kwargs):
-        return len(root.iterable)
+        if root.length is None:
+            root.length, root.length_capped = count_iterable(root.iterable)
+        return root.length
+
+    def resolve_total_count_capped(root, info, **kwargs):
+        if root.length is None:
+            root.length, root.length_capped = count_iterable(root.iterable)
+        return getattr(root, "length_capped", False)
+
+
+# swaps graphene-django's connection for to-many relations with `RelayFilterConnectionField`,
+# which knows how to serve the rows the loaders already fetched
+def get_relation_connection_field(dynamic):
+    field = dynamic.get_type()
+    if isinstance(field, BaseRelayFilterConnectionField) and not isinstance(field, RelayFilterConnectionField):
+        return RelayFilterConnectionField(field._type, description=field.description)
+    return field
+
+
+class RelayObjectTypeOptions(DjangoObjectTypeOptions):
+    optimizer_hints = None
+    cache_max_age = None
+    cache_hints = None
+    cost_hints = None
+    global_id_field = None
+    node_cache_timeout = None
 
 
 class RelayObjectType(BaseObjectType):
@@ -56,16 +121,123 @@ class RelayObjectType(BaseObjectType):
         interfaces=(RelayNode,),
         filter_fields=["id"],
         connection_class=CountableConnection,
+        optimizer_hints=None,
+        cache_max_age=None,
+        cache_hints=None,
+        cost_hints=None,
+        global_id_field="pk",
+        node_cache_timeout=None,
+        _meta=None,
         **options,
     ):
-        return super().__init_subclass_with_meta__(
+        if not _meta:
+            _meta = RelayObjectTypeOptions(cls)
+
+        # model lookups read by fields that are not model fields themselves, e.g.
+        # {"full_name": ["first_name", "last_name"]}, see core.optimizer.QueryOptimizer
+        _meta.optimizer_hints = optimizer_hints or {}
+        # seconds responses selecting the fields of the type can be cached for, per field through
+        # `cache_hints` (e.g. {"email": 0}) or else `cache_max_age`, see core.response_cache
+        _meta.cache_max_age = cache_max_age
+        _meta.cache_hints = cache_hints or {}
+        # cost of resolving a field itself (e.g. {"full_name": 0, "roles": 5}), fields without a
+        # hint cost 1 when they return objects & 0 otherwise, see core.cost.QueryCostAnalyzer
+        _meta.cost_hints = cost_hints or {}
+        # the unique model field global ids carry, e.g. "uuid" so that ids neither expose nor
+        # depend on the sequential primary key
+        assert global_id_field == "pk" or model._meta.get_field(global_id_field).unique, (
+            f"{cls.__name__}.global_id_field must be a unique field of {model.__name__}."
+        )
+        _meta.global_id_field = global_id_field
+        # seconds nodes looked up by id are cached (see `Model.cached` of core.cache), 0 = not cached
+        assert not node_cache_timeout or global_id_field in LOOKUP_FIELDS and hasattr(model, "cached"), (
+            f"{cls.__name__}.node_cache_timeout needs a BaseModel & a global_id_field of {', '.join(LOOKUP_FIELDS)}."
+        )
+        _meta.node_cache_timeout = node_cache_timeout
+
+        super().__init_subclass_with_meta__(
             model=model,
             interfaces=interfaces,
             filter_fields=filter_fields,
             connection_class=connection_class,
+            _meta=_meta,
             **options,
         )
 
+        # resolve every relation exposed by the type through the request scoped loaders,
+        # unless the type brings its own resolver for it
+        for name, relation in get_relation_fields(model).items():
+            field = cls._meta.fields.get(name)
+            if field is None or hasattr(cls, f"resolve_{name}"):
+                continue
+
+            setattr(cls, f"resolve_{name}", staticmethod(relation_resolver(name, RelayObjectType)))
+            if isinstance(field, Dynamic) and (relation.many_to_many or relation.one_to_many):
+                cls._meta.fields[name] = Dynamic(partial(get_relation_connection_field, field))
+
+    # only the columns, joins & prefetches the current selection set needs are loaded
+    @classmethod
+    def get_queryset(cls, queryset, info):
+        return optimize_queryset(queryset, info, cls)
+
+    def resolve_id(root, info):
+        return getattr(root, info.parent_type.graphene_type._meta.global_id_field)
+
+    # the value of `global_id_field` a global id of the type carries, None for ids that are
+    # malformed or of another type
+    @classmethod
+    def decode_global_id(cls, global_id):
+        try:
+            type_name, id = from_global_id(global_id)
+        except Exception:
+            return None
+        return id if type_name == cls._meta.name else None
+
+    @classmethod
+    def get_lookup_value(cls, id):
+        field = cls._meta.model._meta.pk if cls._meta.global_id_field == "pk" else cls._meta.model._meta.get_field(cls._meta.global_id_field)
+        try:
+            return None if id is None else str(field.to_python(id))
+        except ValidationError:
+            return None
+
+    @classmethod
+    def get_node(cls, info, id):
+        return cls.get_nodes(info, [id])[0]
+
+    # the nodes with the given ids (the values of `global_id_field`, not the global ids) in one
+    # `<global_id_field>__in` query (for the nodes missing from the cache of types setting
+    # `node_cache_timeout`), in the order of `ids` with None for the ones that do not exist
+    @classmethod
+    def get_nodes(cls, info, ids):
+        model = cls._meta.model
+        field = cls._meta.global_id_field
+        values = [cls.get_lookup_value(id) for id in ids]
+        lookup_values = set(values) - {None}
+
+        if cls._meta.node_cache_timeout:
+            # cached nodes are loaded whole, the next selection may need any of their columns
+            found = model.cached.get_many(lookup_values, field=field, timeout=cls._meta.node_cache_timeout)
+        elif lookup_values:
+            queryset = cls.get_queryset(model._default_manager.all(), info)
+            found = {str(getattr(node, field)): node for node in queryset.filter(**{f"{field}__in": lookup_values})}
+        else:
+            found = {}
+
+        return [found.get(value) for value in values]
+
+    # maps global ids of the type to the primary keys of their rows in one query, None for the
+    # ids that are malformed, of another type or whose row does not exist
+    @classmethod
+    def get_pks(cls, global_ids):
+        values = {global_id: cls.get_lookup_value(cls.decode_global_id(global_id)) for global_id in global_ids}
+        field = cls._meta.global_id_field
+        pks = {
+            str(value): pk
+            for value, pk in cls._meta.model._default_manager.filter(**{f"{field}__in": set(values.values()) - {None}}).values_list(field, "pk")
+        }
+        return {global_id: pks.get(value) for global_id, value in values.items()}
+
 
 class RelayFilterConnectionField(BaseRelayFilterConnectionField):
     def __init__(
@@ -76,13 +248,16 @@ class RelayFilterConnectionField(BaseRelayFilterConnectionField):
     ):
         self.login_required = kwargs.pop("login_required", False)
         self.permission_roles = kwargs.pop("permission_roles", [])
+        # cost of the connection itself, its nodes are weighted by `first`/`last` on top of it
+        self.cost = kwargs.pop("cost", None)
+        # whether the field (at the root of the query) can be streamed as ndjson, see core.export
+        self.export = kwargs.pop("export", False)
         super().__init__(type_, *args, **kwargs)
 
     @classmethod
     def default_resolver(cls, args, info, iterable):
         return iterable
 
-    @handle_graphql_error()
     def resolve_queryset(
         cls, connection, iterable, info, args, filtering_args, filterset_class
     ):
@@ -96,6 +271,13 @@ class RelayFilterConnectionField(BaseRelayFilterConnectionField):
         # otherwise proceed to return the result from the queryset
         if iterable is None:
             raise Exception(f"{connection.__name__} matching query does not exist.")
+
+        # rows batched by the loaders are served as they are, unless they have to be filtered
+        loaded = maybe_queryset(iterable)
+        if getattr(loaded, "_result_cache", None) is not None and not any(
+            args.get(name) is not None for name in filtering_args
+        ):
+            return loaded
         
         return super(RelayFilterConnectionField, cls).resolve_queryset(
             **{
@@ -108,6 +290,139 @@ class RelayFilterConnectionField(BaseRelayFilterConnectionField):
             }
         )
 
+    @classmethod
+    def connection_resolver(cls, resolver, connection, default_manager, queryset_resolver, max_limit, enforce_first_or_last, root, info, **args):
+        # make each page known to the loaders so relations of its nodes get batched together
+        def register_page(connection):
+            loaders = get_request_loaders(info.context)
+            for edge in connection.edges:
+                edge.node = loaders.register(edge.node)
+            return connection
+
+        # exported connections resolve to the next chunk of their rows instead of a page
+        export = current_export.get()
+        if export is not None and info.path.prev is None:
+            iterable = resolver(root, info, **args)
+            if iterable is None:
+                iterable = default_manager
+            return register_page(export.next_page(connection, queryset_resolver(connection, iterable, info, args)))
+
+        # async resolvers (see core.views.AsyncGraphQLView) get their iterable awaited first, the
+        # queryset is then filtered & paginated synchronously
+        iterable = resolver(root, info, **args)
+        if is_awaitable(iterable):
+            async def resolve_async():
+                resolved = await iterable
+                return await sync_to_async(cls.connection_resolver)(
+                    lambda *_, **__: resolved, connection, default_manager, queryset_resolver, max_limit, enforce_first_or_last, root, info, **args
+                )
+            return resolve_async()
+
+        connection = super().connection_resolver(
+            lambda *_, **__: iterable, connection, default_manager, queryset_resolver, max_limit, enforce_first_or_last, root, info, **args
+        )
+        if Promise.is_thenable(connection):
+            return Promise.resolve(connection).then(register_page)
+        return register_page(connection)
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        # same as graphene-django's implementation, except that the rows are sliced from the
+        # arguments alone, with one row past `first` telling whether there is a next page, instead
+        # of from the length of the iterable, which is only counted when `last` has no `before` to
+        # end at (`totalCount` counts on its own, see `count_iterable`)
+        offset = args.pop("offset", None)
+        after = args.get("after")
+        if offset:
+            if after:
+                offset += cursor_to_offset(after) + 1
+            # input offset starts at 1 while the graphene offset starts at 0
+            args["after"] = offset_to_cursor(offset - 1)
+
+        # impose the maximum limit via the `first` field if neither first or last are already provided
+        if max_limit is not None and args.get("first") is None and args.get("last") is None:
+            args["first"] = max_limit
+
+        iterable = maybe_queryset(iterable)
+        first, last = args.get("first"), args.get("last")
+        slice_start = max(get_offset_with_default(args.get("after"), -1) + 1, 0)
+        slice_stop = get_offset_with_default(args.get("before"), None)
+        length = None
+        if first is not None:
+            slice_stop = slice_start + first + 1 if slice_stop is None else min(slice_stop, slice_start + first + 1)
+        elif last is not None:
+            if slice_stop is None:
+                slice_stop = length = iterable.count() if isinstance(iterable, QuerySet) else len(iterable)
+            slice_start = max(slice_start, slice_stop - last)
+        if slice_stop is not None:
+            slice_stop = max(slice_stop, slice_start)
+        rows = list(iterable[slice_start:slice_stop])
+
+        # the rows reached the end of the iterable, which tells its length for free
+        if args.get("before") is None and (first is None or len(rows) <= first):
+            length = slice_start + len(rows)
+
+        connection = connection_from_array_slice(
+            rows,
+            args,
+            slice_start=slice_start,
+            array_length=slice_start + len(rows),
+            connection_type=partial(connection_adapter, connection),
+            edge_type=connection.Edge,
+            page_info_type=page_info_adapter,
+        )
+        connection.iterable = iterable
+        connection.length = length
+        connection.length_capped = False
+        return connection
+
+class KeysetFilterConnectionField(RelayFilterConnectionField):
+    """
+    RelayFilterConnectionField paginating by keyset (see core.pagination.KeysetPaginator) so deep
+    pages cost the same as the first one, querysets that cannot be seeked on (or an `offset`
+    without a keyset cursor) are paginated by offset as usual.
+    """
+
+    @classmethod
+    def resolve_connection(cls, connection, args, iterable, max_limit=None):
+        iterable = maybe_queryset(iterable)
+        paginator = KeysetPaginator(iterable)
+        if paginator.ordering is None or getattr(iterable, "_result_cache", None) is not None:
+            return super().resolve_connection(connection, args, iterable, max_limit=max_limit)
+
+        # offsets & offset cursors (e.g. handed out before the field was switched to keysets) keep
+        # paginating by offset
+        cursors = [cursor for cursor in (args.get("after"), args.get("before")) if cursor]
+        keyset_cursors = [cursor for cursor in cursors if is_keyset_cursor(cursor)]
+        if args.get("offset") and keyset_cursors:
+            raise GraphQLError("`offset` cannot be combined with keyset cursors.")
+        if args.get("offset") or len(keyset_cursors) != len(cursors):
+            return super().resolve_connection(connection, args, iterable, max_limit=max_limit)
+        args.pop("offset", None)
+
+        # impose the maximum limit via the `first` field if neither first or last are already provided
+        first, last = args.get("first"), args.get("last")
+        if max_limit is not None and first is None and last is None:
+            first = max_limit
+
+        rows, has_previous_page, has_next_page = paginator.paginate(first=first, last=last, after=args.get("after"), before=args.get("before"))
+        edges = [connection.Edge(node=row, cursor=paginator.encode_cursor(row)) for row in rows]
+        connection = connection_adapter(
+            connection,
+            edges=edges,
+            pageInfo=page_info_adapter(
+                startCursor=edges[0].cursor if edges else None,
+                endCursor=edges[-1].cursor if edges else None,
+                hasPreviousPage=has_previous_page,
+                hasNextPage=has_next_page,
+            ),
+        )
+        connection.iterable = iterable
+        connection.length = None
+        connection.length_capped = False
+        return connection
+
+
 class RelayMutation(relay.ClientIDMutation):
     """Base class for all mutations with default success and errors fields."""
     # Define the output fields
@@ -126,10 +441,11 @@ class RelayMutation(relay.ClientIDMutation):
         raise NotImplementedError("The resolve_mutation method must be overridden.")
 
     @classmethod
-    @handle_graphql_error()
     def mutate_and_get_payload(cls, root, info, **input):
         """
         Wrap the main mutation logic and handle success/error response.
         """
 
-        return cls.resolve_mutation(root, info, **input)
+        # reads of a mutation must see the rows it (or the last mutations) wrote
+        with use_primary():
+            return cls.resolve_mutation(root, info, **input)
@@ -1,9 +1,8 @@
 import copy
+from functools import partial, wraps
+from graphene.types.resolver import attr_resolver, dict_or_attr_resolver, dict_resolver
 from graphql_relay import from_global_id
 from django.conf import settings
-from graphql import GraphQLResolveInfo
-import json
-from django.utils.deprecation import MiddlewareMixin
 
 import logging.config
 logging.config.dictConfig(settings.LOGGING)
@@ -16,6 +15,7 @@ logger = logging.getLogger('general')
 # credit: https://stackoverflow.com/questions/15572288/general-decorator-to-wrap-try-except-in-python
 def handle_error(return_if_error=None, log_error=True, *args, **kwargs):
     def decorate(func):
+        @wraps(func)
         def applicator(*args, **kwargs):
             try:
                 return func(*args, **kwargs)
@@ -29,23 +29,6 @@ def handle_error(return_if_error=None, log_error=True, *args, **kwargs):
 
     return decorate
 
-def handle_graphql_error(*args, **kwargs):
-    def decorate(func):
-        def applicator(*args, **kwargs):
-            graphql_resolve_info = [arg for arg in args if isinstance(arg, GraphQLResolveInfo)][0]
-            field_name = graphql_resolve_info.field_name
-            try:
-                logger.info(f"Ran {graphql_resolve_info.parent_type}: {field_name}")
-                return func(*args, **kwargs)
-            except Exception as e:
-                # log where the exception is coming from
-                logger.error(f"Error in {func.__qualname__} at {graphql_resolve_info.parent_type} {field_name}: {e}")
-                raise e
-
-        return applicator
-
-    return decorate
-
 # helper function to decode a Relay global id back to django model object id
 # with error handling
 @handle_error(log_error=False)
@@ -77,42 +60,10 @@ def remove_from_dict(_dict, *keys):
 def remove_new_lines(text):
     return text.replace('\n', '').replace('\r', '')
 
-def find_key(obj, key_value):
-    if isinstance(obj, dict):
-        if key_value in obj:
-            return obj[key_value]
-        for key, value in obj.items():
-            result = find_key(value, key_value)
-            if result is not None:
-                return result
-    elif isinstance(obj, list):
-        for item in obj:
-            result = find_key(item, key_value)
-            if result is not None:
-                return result
-    return None
 
-class GraphQLLoggingMiddleware(MiddlewareMixin):
-    def process_view(self, request, view_func, view_args, view_kwargs):
-        if hasattr(request, 'body') and request.content_type == 'application/json':
-            try:
-                body = json.loads(request.body)
-                
-                logger.info(f"Request Body: {remove_new_lines(safe_get(body, 'query'))}")
-            except (ValueError, KeyError) as exception:
-                logger.error(f"Error processing GraphQL request: {exception}")
-        return None
+# graphene's default resolvers, which only read an attribute (or key) of the parent
+DEFAULT_RESOLVERS = {attr_resolver, dict_or_attr_resolver, dict_resolver}
 
-    def process_response(self, request, response):
-        if hasattr(response, 'content'):
-            byte_result = response.content
-            decoded_result = byte_result.decode('utf-8')
-            data = json.loads(decoded_result)
 
-            logger.info(f"GraphQL Data: {data}")
-            errors_data = find_key(data, "errors")
-            errors = {'errors': errors_data}
-    
-            if errors_data:
-                logger.error(f"GraphQL Error: {errors}")
-        return response
\ No newline at end of file
+def is_default_resolver(resolver):
+    return isinstance(resolver, partial) and resolver.func in DEFAULT_RESOLVERS
@@ -0,0 +1,555 @@
+import asyncio
+import contextvars
+from contextlib import ExitStack, contextmanager
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotAllowed, HttpResponseNotFound, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import ensure_csrf_cookie
+from graphene_django.constants import MUTATION_ERRORS_FLAG
+from graphene_django.settings import graphene_settings
+from graphene_django.utils.utils import set_rollback
+from graphene_django.views import GraphQLView as BaseGraphQLView, HttpError
+from graphql import ExecutionResult, GraphQLError, MiddlewareManager, OperationType, execute, get_operation_ast, parse, validate, validate_schema
+from graphql.pyutils import is_awaitable
+from core.asynchronous import SyncResolverMiddleware, await_result
+from core.cost import analyze_query_cost
+from core.db.routers import pin_to_primary, use_primary, use_replicas
+from core.documents import (
+    PersistedQueryHashMismatch,
+    PersistedQueryNotFound,
+    document_cache,
+    get_persisted_query_hash,
+    get_query_hash,
+)
+from core.encoders import json_decode, json_encode
+from core.export import EXPORT_CONTENT_TYPE, export_connection, get_connection_export
+from core.loaders import clear_request_loaders
+from core.metrics import render_prometheus
+from core.permissions import clear_role_names
+from core.response_cache import get_auth_scope, get_cache_policy, get_response_cache_key
+from core.settings import core_settings
+from core.tracing import TRACING_HEADER, OperationTracer, get_repeated_query_detector, trace_operation
+
+# errors of every graphql operation executed within the request, so nothing downstream (e.g.
+# GraphQLLoggingMiddleware) has to parse them back out of the response
+GRAPHQL_ERRORS_ATTR = "graphql_errors"
+
+
+def get_graphql_errors(request):
+    return getattr(request, GRAPHQL_ERRORS_ATTR, None) or []
+
+
+def record_graphql_errors(request, result):
+    if result is not None and result.errors:
+        if not hasattr(request, GRAPHQL_ERRORS_ATTR):
+            setattr(request, GRAPHQL_ERRORS_ATTR, [])
+        getattr(request, GRAPHQL_ERRORS_ATTR).extend(result.errors)
+    return result
+
+
+# carries the validation errors of a document, they are reported all at once
+class GraphQLErrors(Exception):
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+# the chunks of a synchronous stream, each one produced in the thread of the request
+async def iterate_async(chunks):
+    while True:
+        chunk = await sync_to_async(next)(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+class GraphQLView(BaseGraphQLView):
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_export(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        export = self.get_export(request)
+        if isinstance(export, HttpResponse):
+            return export
+        return StreamingHttpResponse(self.stream_export(request, *export), content_type=EXPORT_CONTENT_TYPE)
+
+    # a json array of operations is executed as a batch within the same request, so the operations
+    # share the authenticated user, the loaders & the permission caches of the request (until a
+    # mutation changes what they hold), a json object is a single operation as usual
+    def parse_body(self, request):
+        if self.get_content_type(request) != "application/json":
+            return super().parse_body(request)
+
+        try:
+            data = json_decode(request.body.decode("utf-8"))
+        except UnicodeDecodeError as e:
+            raise HttpError(HttpResponseBadRequest(str(e)))
+        except (TypeError, ValueError):
+            raise HttpError(HttpResponseBadRequest("POST body sent invalid JSON."))
+
+        if isinstance(data, dict):
+            return data
+        if not isinstance(data, list) or not all(isinstance(entry, dict) for entry in data):
+            raise HttpError(HttpResponseBadRequest("The received data is not a valid JSON query."))
+        if not data:
+            raise HttpError(HttpResponseBadRequest("Received an empty list in the batch request."))
+        if len(data) > core_settings.BATCH_MAX_OPERATIONS:
+            raise HttpError(
+                HttpResponseBadRequest(f"Batch requests are limited to {core_settings.BATCH_MAX_OPERATIONS} operations.")
+            )
+
+        # the view is instantiated per request
+        self.batch = True
+        return data
+
+    # responses of cacheable queries (see core.response_cache) are served straight from the cache,
+    # already serialized & without executing anything
+    def get_response(self, request, data, show_graphiql=False):
+        cache_key, timeout = None, None
+        # batched responses carry the id & status of their entry & traces are per execution, so
+        # neither are cached
+        if core_settings.RESPONSE_CACHE and not show_graphiql and not self.batch and not self.is_traced(request):
+            cache_key, timeout = self.get_response_cache_key(request, data)
+            if cache_key is not None:
+                response = cache.get(cache_key)
+                if response is not None:
+                    return response, 200
+
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = self.execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+        result, status_code = self.format_response(request, execution_result, id, show_graphiql)
+        if cache_key is not None and status_code == 200 and not get_graphql_errors(request):
+            cache.set(cache_key, result, timeout=timeout)
+        return result, status_code
+
+    # the serialization part of graphene-django's `get_response`
+    def format_response(self, request, execution_result, id=None, show_graphiql=False):
+        if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+            set_rollback()
+
+        status_code = 200
+        if execution_result:
+            response = {}
+
+            if execution_result.errors:
+                set_rollback()
+                response["errors"] = [self.format_error(e) for e in execution_result.errors]
+
+            if execution_result.errors and any(not getattr(e, "path", None) for e in execution_result.errors):
+                status_code = 400
+            else:
+                response["data"] = execution_result.data
+
+            if execution_result.extensions:
+                response["extensions"] = execution_result.extensions
+
+            if self.batch:
+                response["id"] = id
+                response["status"] = status_code
+
+            result = self.json_encode(request, response, pretty=show_graphiql)
+            # the entries of a batch are joined as text
+            if self.batch:
+                result = result.decode("utf-8")
+        else:
+            result = None
+
+        return result, status_code
+
+    # utf-8 json bytes (see core.encoders), compact unless graphiql or `?pretty` asks for it
+    def json_encode(self, request, d, pretty=False):
+        return json_encode(d, pretty=bool(self.pretty or pretty or request.GET.get("pretty")))
+
+    def get_response_cache_key(self, request, data):
+        query, variables, operation_name, _ = self.get_graphql_params(request, data)
+        scope = get_auth_scope(request)
+        if scope is None:
+            return None, None
+
+        # whatever is wrong with the query is reported by the execution
+        try:
+            query_hash = self.get_query_hash(request, data, query)
+            document = self.get_document(request, data, query)
+        except Exception:
+            return None, None
+
+        policy = get_cache_policy(self.schema.graphql_schema, document, operation_name, query_hash)
+        if not policy.max_age:
+            return None, None
+        return get_response_cache_key(policy, operation_name, variables, scope), policy.max_age
+
+    def execute_graphql_request(self, request, data, query, *args, **kwargs):
+        return record_graphql_errors(request, self.execute_document_request(request, data, query, *args, **kwargs))
+
+    # the sha256 hash the document of the request is cached under, the persisted query hash when
+    # the client sent one
+    def get_query_hash(self, request, data, query):
+        query_hash = get_persisted_query_hash(request, data) if core_settings.PERSISTED_QUERIES else None
+        if query_hash is None:
+            return get_query_hash(query)
+        if query and get_query_hash(query) != query_hash:
+            raise PersistedQueryHashMismatch()
+        return query_hash
+
+    # returns the parsed & validated document of the request, out of the document cache when the
+    # same query (or its persisted query hash) was seen before, raises GraphQLError otherwise
+    def get_document(self, request, data, query):
+        query_hash = self.get_query_hash(request, data, query)
+        document = document_cache.get(query_hash)
+        if document is not None:
+            return document
+
+        if not query:
+            query = document_cache.get_query(query_hash)
+            if query is None:
+                raise PersistedQueryNotFound()
+        elif core_settings.PERSISTED_QUERIES and get_persisted_query_hash(request, data):
+            document_cache.register_query(query_hash, query)
+
+        document = parse(query)
+        validation_errors = validate(
+            self.schema.graphql_schema,
+            document,
+            self.validation_rules,
+            graphene_settings.MAX_VALIDATION_ERRORS,
+        )
+        if validation_errors:
+            raise GraphQLErrors(validation_errors)
+
+        # only valid documents are cached, invalid ones are rejected again on every request
+        document_cache.set(query_hash, document)
+        return document
+
+    # graphene-django's `execute_graphql_request`, with parsing & validation going through
+    # `get_document` so repeated & persisted queries skip both
+    def execute_document_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        operation = self.get_operation(request, data, query, operation_name, show_graphiql)
+        if not isinstance(operation, tuple):
+            return operation
+        document, operation_ast = operation
+        query_cost = self.get_query_cost(document, operation_ast, variables)
+        if query_cost is not None and query_cost.errors:
+            return ExecutionResult(errors=query_cost.errors, extensions=query_cost.extensions)
+
+        tracer = OperationTracer() if self.is_traced(request) else None
+        with trace_operation(tracer, get_repeated_query_detector(settings.DEBUG)), self.route_operation(request, operation_ast):
+            result = self.execute_operation(request, document, operation_ast, variables, operation_name)
+        return self.add_extensions(result, query_cost, tracer)
+
+    # queries read from the replicas (see core.db.routers), anything else from the primary, which
+    # the client is pinned to for a while after it mutated
+    @contextmanager
+    def route_operation(self, request, operation_ast):
+        if operation_ast is not None and operation_ast.operation == OperationType.QUERY:
+            with use_replicas(request):
+                yield
+            return
+
+        try:
+            with use_primary():
+                yield
+        finally:
+            if operation_ast is not None and operation_ast.operation == OperationType.MUTATION:
+                pin_to_primary(request)
+                self.clear_request_state(request)
+
+    # the rows & role names operations of the request loaded before a mutation may have changed
+    # since, the operations after it (in the same batch) load them again
+    def clear_request_state(self, request):
+        clear_request_loaders(request)
+        clear_role_names(getattr(request, "user", None))
+
+    # `Accept: application/x-ndjson` streams the root connection of a query line by line (see
+    # core.export) instead of answering with a single json document
+    def is_export(self, request):
+        return request.method.lower() == "post" and EXPORT_CONTENT_TYPE in request.headers.get("Accept", "")
+
+    # (document, operation, variables, operation name, export) of an export request, or else the
+    # response it ends with
+    def get_export(self, request):
+        try:
+            data = self.parse_body(request)
+            if self.batch:
+                raise HttpError(HttpResponseBadRequest("Batch requests cannot be exported."))
+            query, variables, operation_name, _ = self.get_graphql_params(request, data)
+            operation = self.get_operation(request, data, query, operation_name)
+            if not isinstance(operation, tuple):
+                return self.get_export_error_response(request, operation)
+
+            document, operation_ast = operation
+            query_cost = self.get_query_cost(document, operation_ast, variables)
+            if query_cost is not None and query_cost.errors:
+                return self.get_export_error_response(request, ExecutionResult(errors=query_cost.errors, extensions=query_cost.extensions))
+            export = get_connection_export(self.schema, operation_ast, core_settings.EXPORT_CHUNK_SIZE)
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+        except GraphQLError as e:
+            return self.get_export_error_response(request, ExecutionResult(errors=[e]))
+        return document, operation_ast, variables, operation_name, export
+
+    def get_export_error_response(self, request, execution_result):
+        result, status_code = self.format_response(request, record_graphql_errors(request, execution_result))
+        return HttpResponse(status=status_code, content=result, content_type="application/json")
+
+    # the chunks of the export run within the same context, e.g. reading from the same replica,
+    # & without the loaders of the previous chunks holding on to their rows
+    def stream_export(self, request, document, operation_ast, variables, operation_name, export):
+        context = contextvars.copy_context()
+        stack = ExitStack()
+        context.run(stack.enter_context, self.route_operation(request, operation_ast))
+        context.run(stack.enter_context, export_connection(export))
+        try:
+            while not export.done:
+                clear_request_loaders(request)
+                result = context.run(self.execute_operation, request, document, operation_ast, variables, operation_name)
+                yield export.encode(result, self.format_error)
+        finally:
+            export.close()
+            context.run(stack.close)
+
+    def is_traced(self, request):
+        return core_settings.TRACING and bool(request.headers.get(TRACING_HEADER))
+
+    # operations over the depth or cost budget (see core.cost) are rejected before they execute,
+    # None when the operation is missing from the document, which the execution reports
+    def get_query_cost(self, document, operation_ast, variables):
+        if operation_ast is None:
+            return None
+        return analyze_query_cost(self.schema.graphql_schema, document, operation_ast, variables)
+
+    # the cost of the operation & its trace, when it was traced, are reported under `extensions`
+    def add_extensions(self, result, query_cost, tracer=None):
+        if result is None:
+            return result
+        for extension in (query_cost, tracer):
+            if extension is not None:
+                result.extensions = {**(result.extensions or {}), **extension.extensions}
+        return result
+
+    # returns (document, operation) to execute or else the result (None for graphiql) the request
+    # ends with
+    def get_operation(self, request, data, query, operation_name, show_graphiql=False):
+        if not query and not (core_settings.PERSISTED_QUERIES and get_persisted_query_hash(request, data)):
+            if show_graphiql:
+                return None
+            raise HttpError(HttpResponseBadRequest("Must provide query string."))
+
+        schema_validation_errors = validate_schema(self.schema.graphql_schema)
+        if schema_validation_errors:
+            return ExecutionResult(data=None, errors=schema_validation_errors)
+
+        try:
+            document = self.get_document(request, data, query)
+        except GraphQLErrors as e:
+            return ExecutionResult(data=None, errors=e.errors)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+        operation_ast = get_operation_ast(document, operation_name)
+
+        if (
+            request.method.lower() == "get"
+            and operation_ast is not None
+            and operation_ast.operation != OperationType.QUERY
+        ):
+            if show_graphiql:
+                return None
+
+            raise HttpError(
+                HttpResponseNotAllowed(
+                    ["POST"],
+                    "Can only perform a {} operation from a POST request.".format(
+                        operation_ast.operation.value
+                    ),
+                )
+            )
+
+        return document, operation_ast
+
+    def get_execute_options(self, request, variables, operation_name, middleware):
+        execute_options = {
+            "root_value": self.get_root_value(request),
+            "context_value": self.get_context(request),
+            "variable_values": variables,
+            "operation_name": operation_name,
+            "middleware": middleware,
+        }
+        if self.execution_context_class:
+            execute_options["execution_context_class"] = self.execution_context_class
+        return execute_options
+
+    # async resolvers are supported here too, their results are awaited in an event loop of
+    # their own
+    def execute_operation(self, request, document, operation_ast, variables, operation_name):
+        schema = self.schema.graphql_schema
+        try:
+            execute_options = self.get_execute_options(request, variables, operation_name, self.get_middleware(request))
+
+            if (
+                operation_ast is not None
+                and operation_ast.operation == OperationType.MUTATION
+                and (
+                    graphene_settings.ATOMIC_MUTATIONS is True
+                    or connection.settings_dict.get("ATOMIC_MUTATIONS", False) is True
+                )
+            ):
+                with transaction.atomic():
+                    result = execute(schema, document, **execute_options)
+                    if is_awaitable(result):
+                        result = async_to_sync(await_result)(result)
+                    if getattr(request, MUTATION_ERRORS_FLAG, False) is True:
+                        transaction.set_rollback(True)
+                return result
+
+            result = execute(schema, document, **execute_options)
+            if is_awaitable(result):
+                result = async_to_sync(await_result)(result)
+            return result
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+
+class AsyncGraphQLView(GraphQLView):
+    """
+    GraphQLView for ASGI, queries run on graphql-core's async executor: async resolvers (e.g. using
+    django's async ORM) run in the event loop & synchronous ones are offloaded to the thread of the
+    request (see core.asynchronous.SyncResolverMiddleware), so a worker keeps serving other
+    requests while one waits on the database. Mutations run synchronously in that thread from
+    start to end, within their transaction.
+    """
+
+    view_is_async = True
+
+    @method_decorator(ensure_csrf_cookie)
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            if request.method.lower() not in ("get", "post"):
+                raise HttpError(
+                    HttpResponseNotAllowed(
+                        ["GET", "POST"], "GraphQL only supports GET and POST requests."
+                    )
+                )
+
+            data = self.parse_body(request)
+            # graphiql is served by the synchronous view
+            if self.graphiql and self.can_display_graphiql(request, data):
+                return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+            # the lazy user of the request would hit the session store from the event loop
+            if hasattr(request, "auser"):
+                request.user = await request.auser()
+
+            if self.is_export(request):
+                export = await sync_to_async(self.get_export)(request)
+                if isinstance(export, HttpResponse):
+                    return export
+                return StreamingHttpResponse(iterate_async(self.stream_export(request, *export)), content_type=EXPORT_CONTENT_TYPE)
+
+            if self.batch:
+                responses = await self.get_batch_responses_async(request, data)
+                result = "[{}]".format(",".join([response[0] for response in responses]))
+                status_code = responses and max(responses, key=lambda response: response[1])[1] or 200
+            else:
+                result, status_code = await self.get_response_async(request, data)
+
+            return HttpResponse(status=status_code, content=result, content_type="application/json")
+
+        except HttpError as e:
+            response = e.response
+            response["Content-Type"] = "application/json"
+            response.content = self.json_encode(request, {"errors": [self.format_error(e)]})
+            return response
+
+    # queries of a batch run concurrently when `BATCH_CONCURRENT` is on, batches with a mutation run
+    # in order
+    async def get_batch_responses_async(self, request, data):
+        if core_settings.BATCH_CONCURRENT and all(await asyncio.gather(*[self.is_query_async(request, entry) for entry in data])):
+            return await asyncio.gather(*[self.get_response_async(request, entry) for entry in data])
+        return [await self.get_response_async(request, entry) for entry in data]
+
+    async def is_query_async(self, request, data):
+        query, _, operation_name, _ = self.get_graphql_params(request, data)
+        try:
+            operation = await sync_to_async(self.get_operation)(request, data, query, operation_name)
+        except HttpError:
+            return False
+        return isinstance(operation, tuple) and operation[1] is not None and operation[1].operation == OperationType.QUERY
+
+    async def get_response_async(self, request, data):
+        cache_key, timeout = None, None
+        if core_settings.RESPONSE_CACHE and not self.batch and not self.is_traced(request):
+            cache_key, timeout = await sync_to_async(self.get_response_cache_key)(request, data)
+            if cache_key is not None:
+                response = await cache.aget(cache_key)
+                if response is not None:
+                    return response, 200
+
+        query, variables, operation_name, id = self.get_graphql_params(request, data)
+        execution_result = record_graphql_errors(
+            request, await self.execute_document_request_async(request, data, query, variables, operation_name)
+        )
+        result, status_code = self.format_response(request, execution_result, id)
+        if cache_key is not None and status_code == 200 and not get_graphql_errors(request):
+            await cache.aset(cache_key, result, timeout=timeout)
+        return result, status_code
+
+    async def execute_document_request_async(self, request, data, query, variables, operation_name):
+        operation = await sync_to_async(self.get_operation)(request, data, query, operation_name)
+        if not isinstance(operation, tuple):
+            return operation
+
+        document, operation_ast = operation
+        query_cost = self.get_query_cost(document, operation_ast, variables)
+        if query_cost is not None and query_cost.errors:
+            return ExecutionResult(errors=query_cost.errors, extensions=query_cost.extensions)
+
+        # the queries of a concurrent batch run in tasks of their own, each with its own tracer
+        tracer = OperationTracer() if self.is_traced(request) else None
+        with trace_operation(tracer, get_repeated_query_detector(settings.DEBUG)), self.route_operation(request, operation_ast):
+            return await self.execute_query_async(request, document, operation_ast, variables, operation_name, query_cost, tracer)
+
+    async def execute_query_async(self, request, document, operation_ast, variables, operation_name, query_cost, tracer):
+        try:
+            if operation_ast is None or operation_ast.operation != OperationType.QUERY:
+                result = await sync_to_async(self.execute_operation)(request, document, operation_ast, variables, operation_name)
+                return self.add_extensions(result, query_cost, tracer)
+
+            result = execute(
+                self.schema.graphql_schema,
+                document,
+                **self.get_execute_options(request, variables, operation_name, self.get_async_middleware(request)),
+            )
+            if is_awaitable(result):
+                result = await result
+            return self.add_extensions(result, query_cost, tracer)
+        except Exception as e:
+            return ExecutionResult(errors=[e])
+
+    def get_async_middleware(self, request):
+        middleware = self.get_middleware(request)
+        if isinstance(middleware, MiddlewareManager):
+            middleware = middleware.middlewares
+        return [*(middleware or ()), SyncResolverMiddleware()]
+
+
+class MetricsView(View):
+    """
+    The resolver metrics of the process (see core.metrics) for prometheus to scrape, behind the
+    bearer token `METRICS_TOKEN`, the endpoint does not exist while no token is set.
+    """
+
+    def get(self, request, *args, **kwargs):
+        token = core_settings.METRICS_TOKEN
+        if not token:
+            return HttpResponseNotFound()
+        if not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return HttpResponseForbidden()
+        return HttpResponse(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
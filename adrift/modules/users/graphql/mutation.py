@@ -1,11 +1,23 @@
 import graphene
+from django.db import transaction
 from graphql_auth import relay
+from core.response_cache import invalidate_responses
+from core.settings import core_settings
 from core.types import RelayMutation, eval_permission
-from .types import RoleNode
-from users.models import Role
+from .types import RoleNode, UserNode
+from users.models import Role, User, UserRole
 from users.enums import Role as RoleEnum
+from users.signals import invalidate_user_roles
 from graphql_jwt.decorators import login_required, user_passes_test
 
+ROLE_NAMES = {role.name for role in RoleEnum}
+
+
+def validate_items(items):
+    if len(items) > core_settings.BULK_MUTATION_MAX_ITEMS:
+        raise Exception(f"Bulk mutations are limited to {core_settings.BULK_MUTATION_MAX_ITEMS} items.")
+
+
 class CreateRoleMutation(RelayMutation):
     class Input:
         name = graphene.String(required=True)
@@ -15,11 +27,137 @@ class CreateRoleMutation(RelayMutation):
     @classmethod
     @user_passes_test(lambda user: eval_permission(user, login_required=True))
     def resolve_mutation(cls, root, info, name):
-        if Role.objects.contains_duplicates(name):
+        if name not in ROLE_NAMES:
+            return cls(success=False, errors=[f"Invalid role: {name}"])
+
+        # a role created concurrently is reported as a duplicate instead of failing on the constraint
+        with transaction.atomic():
+            roles, created = Role.objects.create_many([name])
+            if created:
+                invalidate_responses(Role)
+        if not created:
             return cls(success=False)
-        
-        role = Role.objects.create(name)
-        return cls(success=True, role=role)
+        return cls(success=True, role=roles[name])
+
+
+class CreateRoleResult(graphene.ObjectType):
+    name = graphene.String()
+    success = graphene.Boolean()
+    created = graphene.Boolean(description="Indicates whether the role did not exist before.")
+    error = graphene.String()
+    role = graphene.Field(RoleNode)
+
+
+class CreateRolesMutation(RelayMutation):
+    """Creates the given roles at once, the roles that already exist are reported as such."""
+    class Input:
+        names = graphene.List(graphene.NonNull(graphene.String), required=True)
+
+    results = graphene.List(graphene.NonNull(CreateRoleResult))
+
+    @classmethod
+    @user_passes_test(lambda user: eval_permission(user, login_required=True))
+    def resolve_mutation(cls, root, info, names):
+        validate_items(names)
+        valid_names = [name for name in names if name in ROLE_NAMES]
+
+        with transaction.atomic():
+            roles, created = Role.objects.create_many(valid_names)
+            if created:
+                invalidate_responses(Role)
+
+        results = []
+        for name in names:
+            if name not in ROLE_NAMES:
+                results.append(CreateRoleResult(name=name, success=False, created=False, error=f"Invalid role: {name}"))
+            else:
+                results.append(CreateRoleResult(name=name, success=True, created=name in created, role=roles.get(name)))
+        return cls(success=all(result.success for result in results), results=results)
+
+
+class UserRoleResult(graphene.ObjectType):
+    user_id = graphene.ID()
+    role = graphene.String()
+    success = graphene.Boolean()
+    changed = graphene.Boolean(description="Indicates whether the role was assigned (or revoked) by this mutation.")
+    error = graphene.String()
+
+
+class UserRolesMutation(RelayMutation):
+    """
+    Base of the mutations changing the roles of many users at once, every role is applied to every
+    user within one transaction & a constant number of queries, with a result per (user, role) pair.
+    """
+    class Input:
+        user_ids = graphene.List(graphene.NonNull(graphene.ID), required=True)
+        roles = graphene.List(graphene.NonNull(graphene.String), required=True)
+
+    results = graphene.List(graphene.NonNull(UserRoleResult))
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def apply(cls, user_ids, role_ids):
+        raise NotImplementedError("The apply method must be overridden.")
+
+    @classmethod
+    def resolve_mutation(cls, root, info, user_ids, roles):
+        validate_items([(user_id, role) for user_id in user_ids for role in roles])
+
+        with transaction.atomic():
+            pks = UserNode.get_pks(user_ids)
+            existing_pks = set(pks.values()) - {None}
+            role_ids = dict(Role.objects.filter(name__in=set(roles) & ROLE_NAMES).values_list("name", "pk"))
+            changed = cls.apply(existing_pks, set(role_ids.values()))
+            if changed:
+                # bulk inserts & raw deletes send no signals, so the role names, claims & responses of
+                # the changed users are invalidated here once
+                invalidate_user_roles(*{user_pk for user_pk, _ in changed})
+                invalidate_responses(User, Role)
+
+        results = []
+        for user_id in user_ids:
+            for role in roles:
+                error = None
+                if pks.get(user_id) not in existing_pks:
+                    error = f"User does not exist: {user_id}"
+                elif role not in role_ids:
+                    error = f"Role does not exist: {role}"
+                results.append(UserRoleResult(
+                    user_id=user_id,
+                    role=role,
+                    success=error is None,
+                    changed=error is None and (pks[user_id], role_ids[role]) in changed,
+                    error=error,
+                ))
+        return cls(success=all(result.success for result in results), results=results)
+
+
+class AssignRolesMutation(UserRolesMutation):
+    """Assigns every given role to every given user, roles already assigned are left as they are."""
+
+    @classmethod
+    def apply(cls, user_ids, role_ids):
+        return UserRole.objects.assign(user_ids, role_ids)
+
+    @classmethod
+    @user_passes_test(lambda user: eval_permission(user, login_required=True, permission_roles=[RoleEnum.ADMIN.name]))
+    def resolve_mutation(cls, root, info, **input):
+        return super().resolve_mutation(root, info, **input)
+
+
+class RevokeRolesMutation(UserRolesMutation):
+    """Revokes every given role from every given user."""
+
+    @classmethod
+    def apply(cls, user_ids, role_ids):
+        return UserRole.objects.revoke(user_ids, role_ids)
+
+    @classmethod
+    @user_passes_test(lambda user: eval_permission(user, login_required=True, permission_roles=[RoleEnum.ADMIN.name]))
+    def resolve_mutation(cls, root, info, **input):
+        return super().resolve_mutation(root, info, **input)
 
 class AuthMutation(graphene.ObjectType):
     register = relay.Register.Field()
@@ -39,4 +177,7 @@ class AuthMutation(graphene.ObjectType):
     revoke_token = relay.RevokeToken.Field()
 
 class Mutation(AuthMutation, graphene.ObjectType):
-    create_role = CreateRoleMutation.Field()
\ No newline at end of file
+    create_role = CreateRoleMutation.Field()
+    create_roles = CreateRolesMutation.Field()
+    assign_roles = AssignRolesMutation.Field()
+    revoke_roles = RevokeRolesMutation.Field()
\ No newline at end of file
@@ -1,16 +1,18 @@
 import graphene
 from graphene import relay
-from core.types import RelayFilterConnectionField, RelayNode
-from core.utils import handle_graphql_error
+from core.types import KeysetFilterConnectionField, RelayNode
 from users.enums import Role as RoleEnum
 from .types import *
 
 class Query(graphene.ObjectType):
     me = graphene.Field(UserNode)
     user = RelayNode.Field(UserNode)
-    all_users = RelayFilterConnectionField(UserNode)
+    users = RelayNode.NodesField(UserNode)
+    # streamed as ndjson for `Accept: application/x-ndjson`, e.g. by the nightly sync jobs
+    all_users = KeysetFilterConnectionField(UserNode, export=True)
+    role = RelayNode.Field(RoleNode)
+    roles = RelayNode.NodesField(RoleNode)
 
-    @handle_graphql_error()
     def resolve_me(self, info):
         user = info.context.user
 
@@ -1,5 +1,6 @@
 import graphene
 from django.contrib.auth import get_user_model
+from core.loaders import get_request_loaders
 from core.types import RelayObjectType
 from core.utils import safe_get
 from users.models import Role
@@ -11,6 +12,10 @@ class RoleNode(RelayObjectType):
         model = Role
         filter_fields = ["name"]
         fields = "__all__"
+        cache_max_age = 300
+        global_id_field = "uuid"
+        # a handful of rows, read by most clients & hardly ever changed
+        node_cache_timeout = 300
 
 class UserNode(RelayObjectType):
     class Meta:
@@ -18,6 +23,16 @@ class UserNode(RelayObjectType):
         filter_fields = ["username", "roles__name"]
         skip_registry = True
         fields = "__all__"
+        optimizer_hints = {
+            "full_name": ["first_name", "last_name"],
+            "archived": ["status__archived"],
+            "verified": ["status__verified"],
+            "secondary_email": ["status__secondary_email"],
+        }
+        cache_max_age = 60
+        global_id_field = "uuid"
+        # changes with every login, which does not invalidate cached responses
+        cache_hints = {"last_login": 0}
 
     pk = graphene.Int()
     full_name = graphene.String()
@@ -32,15 +47,11 @@ class UserNode(RelayObjectType):
         return f"{self.first_name} {self.last_name}"
 
     def resolve_archived(self, info):
-        return self.status.archived
+        return get_request_loaders(info.context).load(self, "status").archived
 
     def resolve_verified(self, info):
-        return self.status.verified
+        return get_request_loaders(info.context).load(self, "status").verified
 
     def resolve_secondary_email(self, info):
-        return self.status.secondary_email
-
-    @classmethod
-    def get_queryset(cls, queryset, info):
-        return queryset.prefetch_related("roles").select_related("status")
+        return get_request_loaders(info.context).load(self, "status").secondary_email
 
@@ -0,0 +1,368 @@
+import json
+import math
+import platform
+import statistics
+import time
+import tracemalloc
+import urllib.request
+from datetime import datetime, timezone
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from graphene_django.settings import graphene_settings
+from graphql_auth.models import UserStatus
+from graphql_jwt.shortcuts import get_token
+from graphql_relay import to_global_id
+from core.settings import core_settings
+from users.enums import Role as RoleEnum
+from users.models import Role, User, UserRole
+
+USERNAME_PREFIX = "benchmark_"
+PASSWORD = "benchmark-password"
+
+USER_FIELDS = "id username fullName archived verified roles { edges { node { name } } }"
+
+
+# the catalogue of operations, each as (name, query, variables, authenticated), `variables`
+# may be a callable of the benchmark returning them
+def get_operations(benchmark):
+    return [
+        ("me", f"query {{ me {{ {USER_FIELDS} }} }}", {}, True),
+        ("user", f"query($id: ID!) {{ user(id: $id) {{ {USER_FIELDS} }} }}", lambda: {"id": benchmark.user_id}, False),
+        ("allUsers", f"query {{ allUsers(first: 50) {{ totalCount edges {{ node {{ {USER_FIELDS} }} }} }} }}", {}, False),
+        (
+            "allUsers.page",
+            f"query($after: String) {{ allUsers(first: 50, after: $after) {{ edges {{ cursor node {{ {USER_FIELDS} }} }} }} }}",
+            lambda: {"after": benchmark.cursor},
+            False,
+        ),
+        (
+            "allUsers.filtered",
+            f"query($role: UsersRoleNameChoices) {{ allUsers(first: 50, roles_Name: $role) {{ edges {{ node {{ {USER_FIELDS} }} }} }} }}",
+            {"role": RoleEnum.ADMIN.name},
+            False,
+        ),
+        (
+            "createRole",
+            "mutation($name: String!) { createRole(input: {name: $name}) { success role { name } } }",
+            lambda: {"name": benchmark.new_role},
+            True,
+        ),
+        (
+            "tokenAuth",
+            "mutation($username: String!, $password: String!) { tokenAuth(input: {username: $username, password: $password}) { success token } }",
+            lambda: {"username": benchmark.user.username, "password": PASSWORD},
+            False,
+        ),
+    ]
+
+
+# nearest-rank percentile
+def percentile(values, percent):
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, math.ceil(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+class SchemaTransport:
+    name = "schema"
+
+    def __init__(self, benchmark):
+        self.schema = graphene_settings.SCHEMA
+        self.benchmark = benchmark
+
+    def execute(self, query, variables, authenticated):
+        request = RequestFactory().post("/graphql")
+        # a user of its own per execution, as each request authenticates one, so neither the role
+        # names nor the relations loaded for it are carried over & their queries are counted every time
+        request.user = User.objects.get(pk=self.benchmark.user.pk) if authenticated else AnonymousUser()
+        result = self.schema.execute(query, variable_values=variables, context_value=request)
+        return result.data, [str(error) for error in result.errors or ()]
+
+
+class ClientTransport:
+    """
+    Goes through the whole django stack (middlewares, view, serialization) without a server.
+    """
+
+    name = "http"
+
+    def __init__(self, benchmark):
+        self.benchmark = benchmark
+        hosts = [host.lstrip(".") for host in settings.ALLOWED_HOSTS if host and host != "*"]
+        self.client = Client(SERVER_NAME=hosts[0] if hosts else "testserver")
+
+    def execute(self, query, variables, authenticated):
+        headers = {"Authorization": f"Bearer {self.benchmark.token}"} if authenticated else {}
+        response = self.client.post(
+            "/graphql", json.dumps({"query": query, "variables": variables}), content_type="application/json", headers=headers
+        )
+        return self.parse(response.status_code, response.content)
+
+    def parse(self, status_code, content):
+        try:
+            body = json.loads(content)
+        except ValueError:
+            return None, [f"{status_code}: {content[:200]!r}"]
+        return body.get("data"), [error.get("message") for error in body.get("errors") or ()]
+
+
+class URLTransport(ClientTransport):
+    """
+    Sends the operations to a running server, the queries it executes are not counted.
+    """
+
+    def __init__(self, benchmark, url):
+        self.benchmark = benchmark
+        self.url = url
+        self.name = f"http {url}"
+
+    def execute(self, query, variables, authenticated):
+        headers = {"Content-Type": "application/json"}
+        if authenticated:
+            headers["Authorization"] = f"Bearer {self.benchmark.token}"
+        request = urllib.request.Request(self.url, json.dumps({"query": query, "variables": variables}).encode("utf-8"), headers)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return self.parse(response.status, response.read())
+        except urllib.error.HTTPError as e:
+            return self.parse(e.code, e.read())
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds users, roles & user roles, runs a fixed catalogue of graphql operations in-process and "
+        "over http & reports their p50/p95/p99 latency, queries & peak memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="Users to seed (default: 1000).")
+        parser.add_argument(
+            "--roles", type=int, default=len(RoleEnum) - 1,
+            help=f"Roles to seed, at most {len(RoleEnum)} (the role names are an enum), createRole creates a missing one.",
+        )
+        parser.add_argument("--roles-per-user", type=int, default=1, help="Roles assigned to each user (default: 1).")
+        parser.add_argument("--iterations", type=int, default=50, help="Timed executions per operation (default: 50).")
+        parser.add_argument("--warmup", type=int, default=5, help="Untimed executions per operation first (default: 5).")
+        parser.add_argument("--operation", action="append", dest="operations", help="Only run the given operations.")
+        parser.add_argument("--transport", action="append", choices=["schema", "http"], dest="transports", help="Only run through the given transports.")
+        parser.add_argument("--url", help="Also benchmark a running server, e.g. http://localhost:8000/graphql.")
+        parser.add_argument("--output", help="Write the results as json to this file.")
+        parser.add_argument("--baseline", help="Compare the results against a json file written by --output.")
+        parser.add_argument(
+            "--max-regression", type=float,
+            help="Fail when the p95 of an operation is slower than the baseline by more than this fraction, e.g. 0.2.",
+        )
+        parser.add_argument("--keep", action="store_true", help="Keep the seeded rows instead of deleting them afterwards.")
+        parser.add_argument("--force", action="store_true", help="Run against a database holding other users than the benchmark ones.")
+
+    def handle(self, *args, **options):
+        if not 0 < options["roles"] <= len(RoleEnum):
+            raise CommandError(f"--roles must be between 1 and {len(RoleEnum)}.")
+        if not 0 <= options["roles_per_user"] <= options["roles"]:
+            raise CommandError("--roles-per-user must be between 0 and --roles.")
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be at least 1.")
+        # the benchmark writes & deletes rows, it belongs on a database of its own
+        if not options["force"] and User.objects.exclude(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError("The database holds users other than the benchmark ones, run against a benchmark database or pass --force.")
+
+        self.seed(options["users"], options["roles"], options["roles_per_user"])
+        try:
+            results = self.run(options)
+        finally:
+            self.teardown_role()
+            if not options["keep"]:
+                self.clean()
+
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "database": connection.vendor,
+                "users": options["users"],
+                "roles": options["roles"],
+                "roles_per_user": options["roles_per_user"],
+                "iterations": options["iterations"],
+                "response_cache": core_settings.RESPONSE_CACHE,
+            },
+            "results": results,
+        }
+        self.print_report(results)
+
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(report, file, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options["baseline"]:
+            self.compare(results, options["baseline"], options["max_regression"])
+
+    # bulk inserts the missing benchmark rows, every user shares the same password hash
+    def seed(self, users, roles, roles_per_user):
+        started = time.perf_counter()
+        with transaction.atomic():
+            names = [role.name for role in RoleEnum]
+            # only the roles created here are deleted afterwards
+            self.created_roles = []
+            for name in names[:roles]:
+                if not Role.objects.filter(name=name).exists():
+                    Role(name=name).save()
+                    self.created_roles.append(name)
+            self.roles = list(Role.objects.filter(name__in=names[:roles]).order_by("name"))
+            self.seeded_roles = {role.name for role in self.roles}
+            self.new_role = next((name for name in names if name not in self.seeded_roles), names[0])
+            # a role that existed before the run is never deleted, with its user roles along
+            self.new_role_existed = Role.objects.filter(name=self.new_role).exists()
+
+            existing = set(User.objects.filter(username__startswith=USERNAME_PREFIX).values_list("username", flat=True))
+            password = make_password(PASSWORD)
+            created = User.objects.bulk_create(
+                [
+                    User(
+                        username=f"{USERNAME_PREFIX}{index:07}",
+                        email=f"{USERNAME_PREFIX}{index}@example.com",
+                        first_name="Benchmark",
+                        last_name=str(index),
+                        password=password,
+                    )
+                    for index in range(users)
+                    if f"{USERNAME_PREFIX}{index:07}" not in existing
+                ],
+                batch_size=1000,
+            )
+            UserStatus.objects.bulk_create([UserStatus(user=user, verified=True) for user in created], batch_size=1000)
+            UserRole.objects.bulk_create(
+                [
+                    UserRole(user=user, role=self.roles[(index + offset) % len(self.roles)])
+                    for index, user in enumerate(created)
+                    for offset in range(roles_per_user)
+                ],
+                batch_size=1000,
+            )
+
+        self.user = User.objects.filter(username__startswith=USERNAME_PREFIX).order_by("username").first()
+        if self.user is None:
+            raise CommandError("--users must be at least 1.")
+        self.user_id = to_global_id("UserNode", self.user.uuid)
+        self.token = get_token(self.user)
+        self.stdout.write(f"Seeded {len(created)} users ({users} in total) in {time.perf_counter() - started:.2f}s")
+
+    def clean(self):
+        User.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+        Role.objects.filter(name__in=self.created_roles).delete()
+
+    # createRole is timed against a role that does not exist yet & the role is removed again after
+    # every execution, unless it existed before (it then measures the duplicate check)
+    def teardown_role(self):
+        if not self.new_role_existed:
+            Role.objects.filter(name=self.new_role).delete()
+
+    def run(self, options):
+        transports = []
+        if not options["transports"] or "schema" in options["transports"]:
+            transports.append(SchemaTransport(self))
+        if not options["transports"] or "http" in options["transports"]:
+            transports.append(ClientTransport(self))
+        if options["url"]:
+            transports.append(URLTransport(self, options["url"]))
+
+        operations = get_operations(self)
+        if options["operations"]:
+            unknown = set(options["operations"]) - {name for name, *_ in operations}
+            if unknown:
+                raise CommandError(f"Unknown operations: {', '.join(sorted(unknown))}")
+            operations = [operation for operation in operations if operation[0] in options["operations"]]
+
+        # the cursor of the second page of users
+        data, errors = SchemaTransport(self).execute("query { allUsers(first: 50) { pageInfo { endCursor } } }", {}, False)
+        self.cursor = data["allUsers"]["pageInfo"]["endCursor"] if not errors else None
+
+        results = {}
+        for transport in transports:
+            results[transport.name] = {}
+            for name, query, variables, authenticated in operations:
+                results[transport.name][name] = self.run_operation(
+                    transport, name, query, variables, authenticated, options["iterations"], options["warmup"]
+                )
+        return results
+
+    def run_operation(self, transport, name, query, variables, authenticated, iterations, warmup):
+        def execute():
+            data, errors = transport.execute(query, variables() if callable(variables) else variables, authenticated)
+            if name == "createRole":
+                self.teardown_role()
+            if errors:
+                raise CommandError(f"{name} failed through {transport.name}: {errors}")
+            return data
+
+        for _ in range(warmup):
+            execute()
+
+        latencies = []
+        counted = not isinstance(transport, URLTransport)
+        queries = []
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                execute()
+                latencies.append((time.perf_counter() - started) * 1000)
+            queries.append(len(context.captured_queries))
+
+        # memory is measured apart, tracing allocations slows every execution down
+        tracemalloc.start()
+        try:
+            execute()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            "p50_ms": percentile(latencies, 50),
+            "p95_ms": percentile(latencies, 95),
+            "p99_ms": percentile(latencies, 99),
+            "mean_ms": statistics.fmean(latencies),
+            "queries": max(queries) if counted else None,
+            "peak_memory_kb": peak / 1024 if counted else None,
+        }
+
+    def print_report(self, results):
+        for transport, operations in results.items():
+            self.stdout.write("")
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{transport}"))
+            self.stdout.write(f"{'operation':<20}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}{'peak kb':>10}")
+            for name, result in operations.items():
+                queries = "-" if result["queries"] is None else result["queries"]
+                memory = "-" if result["peak_memory_kb"] is None else f"{result['peak_memory_kb']:.0f}"
+                self.stdout.write(
+                    f"{name:<20}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}{queries:>10}{memory:>10}"
+                )
+
+    def compare(self, results, path, max_regression):
+        with open(path) as file:
+            baseline = json.load(file)["results"]
+
+        regressions = []
+        self.stdout.write("")
+        self.stdout.write(self.style.MIGRATE_HEADING(f"compared to {path}"))
+        for transport, operations in results.items():
+            for name, result in operations.items():
+                previous = baseline.get(transport, {}).get(name)
+                if previous is None:
+                    continue
+                change = (result["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] if previous["p95_ms"] else 0
+                queries = ""
+                if result["queries"] is not None and previous.get("queries") is not None and result["queries"] != previous["queries"]:
+                    queries = f", queries {previous['queries']} -> {result['queries']}"
+                line = f"{transport} {name}: p95 {previous['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms ({change:+.0%}){queries}"
+                if max_regression is not None and change > max_regression:
+                    regressions.append(line)
+                    self.stdout.write(self.style.ERROR(line))
+                else:
+                    self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f"{len(regressions)} operations regressed by more than {max_regression:.0%}.")
@@ -0,0 +1,106 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from graphene_django.settings import graphene_settings
+from core.types import RelayObjectType
+
+# lookups a b-tree index on the column cannot serve
+UNINDEXABLE_LOOKUPS = {"contains", "icontains", "iexact", "istartswith", "endswith", "iendswith", "regex", "iregex"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Checks every `filter_fields` entry (and the default ordering) of the RelayObjectTypes of the "
+        "schema against the indexes of the database & reports the columns no index leads with."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default", help="Database whose indexes are checked (default: default).")
+        parser.add_argument("--fail", action="store_true", help="Exit with an error when gaps are found, e.g. in CI.")
+
+    def handle(self, *args, **options):
+        self.connection = connections[options["database"]]
+        self.constraints = {}
+        gaps = 0
+
+        for object_type in self.get_object_types():
+            model = object_type._meta.model
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{object_type.__name__} ({model._meta.db_table})"))
+
+            filter_fields = object_type._meta.filter_fields or {}
+            if not isinstance(filter_fields, dict):
+                filter_fields = {name: ["exact"] for name in filter_fields}
+            for path, lookups in filter_fields.items():
+                gaps += self.report(f"filter {path}", self.check_path(model, path))
+                for lookup in sorted(set(lookups or ()) & UNINDEXABLE_LOOKUPS):
+                    self.stdout.write(self.style.WARNING(f"  filter {path}__{lookup}: needs an expression or trigram index"))
+
+            ordering = [name.lstrip("-") for name in model._meta.ordering if isinstance(name, str) and "__" not in name and name != "?"]
+            if ordering:
+                columns = [model._meta.pk.column if name == "pk" else model._meta.get_field(name).column for name in ordering]
+                gaps += self.report(f"ordering {', '.join(ordering)}", [(model._meta.db_table, columns)])
+
+        if gaps:
+            message = f"{gaps} missing indexes."
+            if options["fail"]:
+                raise CommandError(message)
+            self.stdout.write(self.style.ERROR(message))
+        else:
+            self.stdout.write(self.style.SUCCESS("Every filter & ordering is backed by an index."))
+
+    # RelayObjectTypes are looked up in the schema, some are not in graphene's registry
+    def get_object_types(self):
+        object_types = []
+        for graphql_type in graphene_settings.SCHEMA.graphql_schema.type_map.values():
+            graphene_type = getattr(graphql_type, "graphene_type", None)
+            if isinstance(graphene_type, type) and issubclass(graphene_type, RelayObjectType):
+                object_types.append(graphene_type)
+        return sorted(object_types, key=lambda object_type: object_type.__name__)
+
+    # the (table, columns) an index has to lead with for the filter to be served by indexes: the
+    # joined side of every join along the path & the filtered column itself
+    def check_path(self, model, path):
+        required = []
+        *relations, name = path.split("__")
+        for part in relations + [name]:
+            try:
+                field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                return [(model._meta.db_table, None)]
+
+            if not field.is_relation:
+                required.append((model._meta.db_table, [field.column]))
+                return required
+
+            for path_info in field.path_infos:
+                joined_columns = [joined.column for _, joined in path_info.join_field.get_joining_fields()]
+                required.append((path_info.to_opts.db_table, joined_columns))
+            model = field.path_infos[-1].to_opts.model
+        return required
+
+    def report(self, label, required):
+        gaps = 0
+        for table, columns in required:
+            if columns is None:
+                self.stdout.write(self.style.ERROR(f"  {label}: unknown field on {table}"))
+                gaps += 1
+                continue
+            index = self.get_index(table, columns)
+            if index is None:
+                self.stdout.write(self.style.ERROR(f"  {label}: no index on {table} ({', '.join(columns)})"))
+                gaps += 1
+            else:
+                self.stdout.write(f"  {label}: {table} ({', '.join(columns)}) -> {index}")
+        return gaps
+
+    # the name of an index, unique constraint or primary key leading with the columns
+    def get_index(self, table, columns):
+        if table not in self.constraints:
+            with self.connection.cursor() as cursor:
+                self.constraints[table] = self.connection.introspection.get_constraints(cursor, table)
+        for name, constraint in self.constraints[table].items():
+            if not (constraint["index"] or constraint["unique"] or constraint["primary_key"]):
+                continue
+            if constraint["columns"] and constraint["columns"][: len(columns)] == columns:
+                return name
+        return None
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:19
+
+from django.db import migrations, models
+
+
+# keeps the first row of every duplicated (user, role) pair so the constraint can be added
+def delete_duplicate_user_roles(apps, schema_editor):
+    UserRole = apps.get_model('users', 'UserRole')
+    duplicates = (
+        UserRole.objects.values('user_id', 'role_id')
+        .annotate(first_id=models.Min('id'), count=models.Count('id'))
+        .filter(count__gt=1)
+    )
+    for duplicate in duplicates:
+        UserRole.objects.filter(user_id=duplicate['user_id'], role_id=duplicate['role_id']).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_alter_role_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_user_roles, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userrole',
+            constraint=models.UniqueConstraint(fields=('user', 'role'), name='users_userrole_unique_user_role'),
+        ),
+    ]
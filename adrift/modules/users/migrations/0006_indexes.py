@@ -0,0 +1,42 @@
+# Generated by Django 5.0.6 on 2026-10-18 09:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('users', '0005_userrole_unique_user_role'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userrole',
+            name='role',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='users.role'),
+        ),
+        migrations.AlterField(
+            model_name='userrole',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='role',
+            index=models.Index(fields=['created_at', 'id'], name='users_role_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['created_at', 'id'], name='users_user_created_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userrole',
+            index=models.Index(fields=['role', 'user'], name='users_userrole_role_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userrole',
+            index=models.Index(fields=['created_at', 'id'], name='users_userrole_created_at_idx'),
+        ),
+    ]
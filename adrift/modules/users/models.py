@@ -1,3 +1,5 @@
+from functools import reduce
+from operator import or_
 from django.db import models
 from core.models import BaseModel
 from .enums import Role as RoleEnum
@@ -14,16 +16,61 @@ class User(AbstractUser, BaseModel):
 
     class Meta:
         ordering = ["username"]
+        indexes = [
+            # time ordered listing, with the primary key as tiebreaker for keyset pagination
+            models.Index(fields=["created_at", "id"], name="users_user_created_at_idx"),
+        ]
 
     # def has_roles(self, roles):
     #     return self.roles.filter(name__in=roles).exists()
 
+class UserRoleManager(models.Manager):
+    # the (user id, role id) pairs out of the given ones that are assigned
+    def existing_pairs(self, user_ids, role_ids):
+        return set(self.filter(user_id__in=user_ids, role_id__in=role_ids).values_list("user_id", "role_id"))
+
+    # assigns every role to every user at once, returns the (user id, role id) pairs that were not
+    # assigned before, bulk inserts send no signals so the caller invalidates what depends on them
+    def assign(self, user_ids, role_ids):
+        pairs = {(user_id, role_id) for user_id in user_ids for role_id in role_ids}
+        created = pairs - self.existing_pairs(user_ids, role_ids)
+        self.bulk_create(
+            [UserRole(user_id=user_id, role_id=role_id) for user_id, role_id in created],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        return created
+
+    # revokes every role from every user at once, returns the (user id, role id) pairs that were
+    # assigned, only those exact pairs are deleted in one statement & without signals as well
+    # (`QuerySet.delete` would send a post_delete signal per row) so the caller invalidates what
+    # depends on them, nothing references a user role so there is nothing to cascade to
+    def revoke(self, user_ids, role_ids):
+        deleted = self.existing_pairs(user_ids, role_ids)
+        if deleted:
+            pairs = reduce(or_, (models.Q(user_id=user_id, role_id=role_id) for user_id, role_id in deleted))
+            self.filter(pairs)._raw_delete(self.db)
+        return deleted
+
+
 class UserRole(BaseModel):
-    role = models.ForeignKey('Role', on_delete=models.CASCADE)
-    user = models.ForeignKey('User', on_delete=models.CASCADE)
+    # both columns lead an index of their own already, the unique (user, role) constraint & the
+    # (role, user) index below
+    role = models.ForeignKey('Role', on_delete=models.CASCADE, db_index=False)
+    user = models.ForeignKey('User', on_delete=models.CASCADE, db_index=False)
+
+    objects = UserRoleManager()
 
     class Meta:
         app_label = "users"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "role"], name="users_userrole_unique_user_role"),
+        ]
+        indexes = [
+            # users filtered by role (`roles__name`) join from the role side
+            models.Index(fields=["role", "user"], name="users_userrole_role_user_idx"),
+            models.Index(fields=["created_at", "id"], name="users_userrole_created_at_idx"),
+        ]
 
 
 class RoleQuerySet(models.QuerySet):
@@ -44,6 +91,16 @@ class RoleManager(models.Manager):
     def create(self, name):
         role = Role(name=name)
         role.save()
+        return role
+
+    # creates the roles that do not exist yet in one insert, returns the roles of every name &
+    # the names that were created
+    def create_many(self, names):
+        names = set(names)
+        existing = set(self.filter(name__in=names).values_list("name", flat=True))
+        self.bulk_create([Role(name=name) for name in names - existing], ignore_conflicts=True)
+        roles = {role.name: role for role in self.filter(name__in=names)}
+        return roles, names - existing
 
 class Role(BaseModel):
     name = models.CharField(
@@ -55,6 +112,9 @@ class Role(BaseModel):
 
     class Meta:
         ordering = ["name"]
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="users_role_created_at_idx"),
+        ]
 
     def __str__(self):
         return self.name
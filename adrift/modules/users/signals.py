@@ -0,0 +1,89 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from graphql_auth.models import UserStatus
+from core.auth import revoke_claims
+from core.permissions import invalidate_role_names
+from core.response_cache import invalidate_responses
+from users.models import Role, User, UserRole
+
+
+# drops everything derived from the roles of the given users, i.e. the cached role names and
+# the claims carried by their tokens
+def invalidate_user_roles(*user_ids):
+    invalidate_role_names(*user_ids)
+    revoke_claims(*user_ids)
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def invalidate_user_role(sender, instance, **kwargs):
+    invalidate_user_roles(instance.user_id)
+
+
+# `role.users.add(...)` & co. go through the through model without sending save/delete signals
+@receiver(m2m_changed, sender=UserRole)
+def invalidate_changed_user_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "pre_clear"):
+        return
+
+    if reverse:
+        invalidate_user_roles(instance.pk)
+    elif action == "pre_clear":
+        invalidate_user_roles(*instance.users.values_list("pk", flat=True))
+    else:
+        invalidate_user_roles(*pk_set)
+
+
+# renaming a role changes the role names of every user holding it
+@receiver(post_save, sender=Role)
+def invalidate_role_users(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_user_roles(*UserRole.objects.filter(role=instance).values_list("user_id", flat=True))
+
+
+# archiving, verifying or deactivating an account makes the claims of its tokens stale, logging
+# in only touches `last_login` & keeps them
+@receiver(post_save, sender=UserStatus)
+def revoke_status_claims(sender, instance, created, **kwargs):
+    if not created:
+        revoke_claims(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def revoke_user_claims(sender, instance, created, update_fields, **kwargs):
+    if not created and set(update_fields or ()) != {"last_login"}:
+        revoke_claims(instance.pk)
+
+
+# tokens of a deleted user must not authenticate from their claims until they expire
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_claims(sender, instance, **kwargs):
+    revoke_claims(instance.pk)
+
+
+# cached graphql responses built from users & roles, assigning roles changes both sides
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_responses(sender, update_fields=None, **kwargs):
+    if set(update_fields or ()) != {"last_login"}:
+        invalidate_responses(User)
+
+
+@receiver(post_save, sender=UserStatus)
+@receiver(post_delete, sender=UserStatus)
+def invalidate_status_responses(sender, **kwargs):
+    invalidate_responses(User)
+
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def invalidate_role_responses(sender, **kwargs):
+    invalidate_responses(Role)
+
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+@receiver(m2m_changed, sender=UserRole)
+def invalidate_user_role_responses(sender, action=None, **kwargs):
+    if action is None or action in ("post_add", "post_remove", "post_clear"):
+        invalidate_responses(User, Role)
@@ -1,3 +1,1236 @@
-from django.test import TestCase
+import decimal
+import json
+import logging
+import os
+import sys
+import tempfile
+import uuid
+from datetime import date, datetime
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.backends.postgresql import base as postgresql
+from django.db.migrations.executor import MigrationExecutor
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from graphql_auth.models import UserStatus
+from graphql_jwt.shortcuts import get_token
+from graphql_relay import offset_to_cursor, to_global_id
+from core.auth import ClaimsJSONWebTokenBackend, revoke_claims
+from core.counting import count_iterable
+from core.db.pool import ConnectionPool, PoolTimeout, get_pool, pools
+from core.db.postgresql.base import DatabaseWrapper as PooledDatabaseWrapper
+from core.db.routers import ReplicaRouter, is_pinned_to_primary, pin_to_primary, use_primary, use_replicas
+from core.documents import document_cache, get_query_hash
+from core.encoders import encode_orjson, encode_stdlib, json_decode, json_encode
+from core.loaders import RequestLoaders
+from core.log import QueuedLogHandler
+from core.metrics import resolver_metrics
+from core.pagination import is_keyset_cursor
+from core.permissions import has_any_role
+from core.testing import GraphQLQueryTestCase
+from core.types import RelayFilterConnectionField, eval_permission
+from core.views import AsyncGraphQLView
+from users.enums import Role as RoleEnum
+from users.graphql.types import UserNode
+from users.management.commands.benchmark import percentile
+from users.models import Role, User, UserRole
 
-# Create your tests here.
+
+def count_edges(field):
+    return lambda data: len(data[field]["edges"])
+
+
+class UserQueryCountTests(GraphQLQueryTestCase):
+    """
+    The number of queries of the user queries must not grow with the number of users returned.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roles = Role.objects.bulk_create([Role(name=role.name) for role in RoleEnum])
+
+    # brings the users (each with a status & a role) up to `size`
+    def seed_users(self, size):
+        existing = User.objects.count()
+        users = User.objects.bulk_create([
+            User(username=f"user{index:04}", email=f"user{index}@example.com", first_name="First", last_name=f"Last {index}")
+            for index in range(existing, size)
+        ])
+        UserStatus.objects.bulk_create([UserStatus(user=user, verified=True) for user in users])
+        UserRole.objects.bulk_create([
+            UserRole(user=user, role=self.roles[index % len(self.roles)]) for index, user in enumerate(users)
+        ])
+
+    def test_all_users_fields(self):
+        query = """
+            query {
+                allUsers(first: 100) {
+                    totalCount
+                    edges { node { id username fullName archived verified secondaryEmail } }
+                }
+            }
+        """
+        self.assertNumQueriesConstant(query, self.seed_users, count_nodes=count_edges("allUsers"))
+
+    def test_all_users_roles(self):
+        query = """
+            query {
+                allUsers(first: 100) {
+                    edges { node { username roles { totalCount edges { node { id name } } } } }
+                }
+            }
+        """
+        self.assertNumQueriesConstant(query, self.seed_users, count_nodes=count_edges("allUsers"))
+
+    def test_all_users_roles_users(self):
+        query = """
+            query {
+                allUsers(first: 100) {
+                    edges { node { username roles { edges { node { name users(first: 5) { edges { node { username } } } } } } } }
+                }
+            }
+        """
+        self.assertNumQueriesConstant(query, self.seed_users, count_nodes=count_edges("allUsers"))
+
+    def test_all_users_filtered_by_role(self):
+        query = """
+            query($role: UsersRoleNameChoices) {
+                allUsers(first: 100, roles_Name: $role) {
+                    edges { node { username verified roles { edges { node { name } } } } }
+                }
+            }
+        """
+        self.assertNumQueriesConstant(query, self.seed_users, variables={"role": RoleEnum.ADMIN.name})
+
+
+class RoleCacheTests(GraphQLQueryTestCase):
+    """
+    Roles read through `Role.cached` come from the cache until they change.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.role = Role.objects.create(RoleEnum.ADMIN.name)
+
+    def test_cached_get(self):
+        with self.assertNumQueries(1):
+            Role.cached.get(pk=self.role.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(Role.cached.get(uuid=str(self.role.uuid)).name, RoleEnum.ADMIN.name)
+            self.assertEqual(Role.cached.get(pk=self.role.pk).name, RoleEnum.ADMIN.name)
+
+    def test_cached_get_invalidated(self):
+        Role.cached.get(pk=self.role.pk)
+        self.role.name = RoleEnum.DEVELOPER.name
+        self.role.save()
+        self.assertEqual(Role.cached.get(pk=self.role.pk).name, RoleEnum.DEVELOPER.name)
+
+        pk = self.role.pk
+        self.role.delete()
+        with self.assertRaises(Role.DoesNotExist):
+            Role.cached.get(pk=pk)
+
+
+class RelationTests(GraphQLQueryTestCase):
+    """
+    Foreign keys of nodes resolve to the rows they point to, batched by primary key.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = User.objects.create(username="creator", email="creator@example.com")
+        cls.updater = User.objects.create(username="updater", email="updater@example.com")
+        cls.role = Role.objects.create(RoleEnum.ADMIN.name)
+        Role.objects.filter(pk=cls.role.pk).update(created_by=cls.creator, updated_by=cls.updater)
+
+    def seed_users(self, size):
+        users = User.objects.bulk_create([
+            User(username=f"user{index:04}", email=f"user{index}@example.com")
+            for index in range(User.objects.count() - 2, size)
+        ])
+        UserRole.objects.bulk_create([UserRole(user=user, role=self.role) for user in users])
+
+    def test_created_by_updated_by(self):
+        query = """
+            query {
+                allUsers(first: 100, roles_Name: ADMIN) {
+                    edges { node { roles { edges { node { createdBy { username } updatedBy { username } } } } } }
+                }
+            }
+        """
+        self.seed_users(1)
+        data = self.assertExecutes(query)
+        role = data["allUsers"]["edges"][0]["node"]["roles"]["edges"][0]["node"]
+        self.assertEqual(role, {"createdBy": {"username": "creator"}, "updatedBy": {"username": "updater"}})
+
+        self.assertNumQueriesConstant(query, self.seed_users)
+
+
+class NodesFieldTests(GraphQLQueryTestCase):
+    """
+    `users(ids: [...])` looks up every user at once & answers in the order of the ids.
+    """
+
+    query = "query($ids: [ID!]!) { users(ids: $ids) { username roles { edges { node { name } } } } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(RoleEnum.ADMIN.name)
+        cls.users = User.objects.bulk_create([User(username=f"user{index}", email=f"user{index}@example.com") for index in range(5)])
+        UserRole.objects.bulk_create([UserRole(user=user, role=cls.role) for user in cls.users])
+
+    def get_ids(self, users):
+        return [to_global_id("UserNode", user.uuid) for user in users]
+
+    def test_order(self):
+        users = [self.users[3], self.users[0], self.users[3]]
+        data = self.assertExecutes(self.query, variables={"ids": self.get_ids(users)})
+        self.assertEqual([user["username"] for user in data["users"]], ["user3", "user0", "user3"])
+        self.assertEqual(data["users"][0]["roles"]["edges"], [{"node": {"name": RoleEnum.ADMIN.name}}])
+
+    def test_missing(self):
+        ids = [self.get_ids(self.users[:1])[0], to_global_id("UserNode", uuid.UUID(int=0))]
+        data = self.assertExecutes(self.query, variables={"ids": ids})
+        self.assertEqual(data["users"][0]["username"], "user0")
+        self.assertIsNone(data["users"][1])
+
+    def test_malformed_or_foreign(self):
+        ids = ["garbage", to_global_id("RoleNode", self.role.pk), self.get_ids(self.users[:1])[0]]
+        result = self.execute(self.query, variables={"ids": ids})
+        self.assertEqual(result.data["users"][:2], [None, None])
+        self.assertEqual(result.data["users"][2]["username"], "user0")
+        self.assertEqual([error.path for error in result.errors], [["users", 0], ["users", 1]])
+        self.assertEqual({error.message for error in result.errors}, {"Must receive a UserNode id."})
+
+    def test_batched(self):
+        _, two = self.execute_counted(self.query, variables={"ids": self.get_ids(self.users[:2])})
+        _, five = self.execute_counted(self.query, variables={"ids": self.get_ids(self.users)})
+        self.assertEqual(len(two), len(five))
+
+
+@override_settings(
+    CORE={**settings.CORE, "JWT_CLAIMS": True},
+    CACHES={"default": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "test_cache"}},
+)
+class ClaimsAuthTests(TestCase):
+    """
+    Tokens carrying current claims authenticate without a query, until the user changes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command("createcachetable", verbosity=0)
+        cls.admin_role = Role.objects.create(name=RoleEnum.ADMIN.name)
+
+    def setUp(self):
+        user = User.objects.create(username="claims", email="claims@example.com")
+        UserStatus.objects.filter(user=user).update(verified=True)
+        UserRole.objects.create(user=user, role=self.admin_role)
+        self.user = User.objects.get(pk=user.pk)
+        self.token = get_token(self.user)
+
+    def authenticate(self):
+        request = RequestFactory().post("/graphql", HTTP_AUTHORIZATION=f"Bearer {self.token}")
+        return ClaimsJSONWebTokenBackend().authenticate(request)
+
+    def test_claims(self):
+        user = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertTrue(user.status.verified)
+        self.assertTrue(has_any_role(user, [RoleEnum.ADMIN.name]))
+
+    def test_revoked_claims(self):
+        revoke_claims(self.user.pk)
+        with CaptureQueriesContext(connection) as queries:
+            user = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertTrue(any(User._meta.db_table in query["sql"] for query in queries))
+
+    def test_revoked_role(self):
+        UserRole.objects.filter(user=self.user).delete()
+        user = self.authenticate()
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertFalse(has_any_role(user, [RoleEnum.ADMIN.name]))
+
+    def test_deleted_user(self):
+        self.user.delete()
+        self.assertIsNone(self.authenticate())
+
+    def test_deactivated_user(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.authenticate())
+
+    def test_per_process_cache(self):
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}):
+            with self.assertRaises(ImproperlyConfigured):
+                self.authenticate()
+            with self.assertRaises(ImproperlyConfigured):
+                get_token(self.user)
+
+
+class MetricsTests(TestCase):
+    """
+    The metrics endpoint only answers to the configured bearer token.
+    """
+
+    def test_disabled_without_token(self):
+        with override_settings(CORE={**settings.CORE, "METRICS_TOKEN": None}):
+            self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+    def test_token(self):
+        with override_settings(CORE={**settings.CORE, "METRICS_TOKEN": "secret"}):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            self.assertEqual(self.client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code, 403)
+            response = self.client.get("/metrics", headers={"Authorization": "Bearer secret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"# TYPE", response.content)
+
+
+class TracingTests(TestCase):
+    """
+    Traced operations report the timing & sql queries of every resolver under `extensions.tracing`.
+    """
+
+    query = "query { allUsers(first: 2) { edges { node { username } } } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create([User(username=f"user{index}", email=f"user{index}@example.com") for index in range(3)])
+
+    def execute(self, **headers):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/graphql", {"query": self.query}, content_type="application/json", headers=headers)
+        return json.loads(response.content), queries
+
+    def test_tracing(self):
+        with override_settings(CORE={**settings.CORE, "TRACING": True}):
+            body, queries = self.execute(**{"X-GraphQL-Tracing": "1"})
+        tracing = body["extensions"]["tracing"]
+        self.assertEqual(tracing["version"], 1)
+        self.assertEqual(tracing["sql"]["queries"], len(queries))
+        self.assertGreater(tracing["duration"], 0)
+        resolvers = {tuple(resolver["path"]): resolver for resolver in tracing["execution"]["resolvers"]}
+        self.assertEqual(resolvers[("allUsers",)]["parentType"], "Query")
+        self.assertGreater(resolvers[("allUsers",)]["sqlQueries"], 0)
+        self.assertGreaterEqual(resolvers[("allUsers",)]["duration"], resolvers[("allUsers",)]["sqlDuration"])
+
+    def test_not_traced(self):
+        with override_settings(CORE={**settings.CORE, "TRACING": True}):
+            body, _ = self.execute()
+        self.assertNotIn("tracing", body.get("extensions") or {})
+        with override_settings(CORE={**settings.CORE, "TRACING": False}):
+            body, _ = self.execute(**{"X-GraphQL-Tracing": "1"})
+        self.assertNotIn("tracing", body.get("extensions") or {})
+
+
+class BatchTests(TestCase):
+    """
+    The operations of a batch request see the changes of the mutations before them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roles = {role.name: role for role in Role.objects.bulk_create([Role(name=role.name) for role in RoleEnum])}
+        cls.admin = User.objects.create(username="admin", email="admin@example.com")
+        UserRole.objects.create(user=cls.admin, role=cls.roles[RoleEnum.ADMIN.name])
+
+    def setUp(self):
+        cache.clear()
+
+    def post_batch(self, *queries):
+        response = self.client.post(
+            "/graphql",
+            [{"query": query} for query in queries],
+            content_type="application/json",
+            headers={"Authorization": f"Bearer {get_token(self.admin)}"},
+        )
+        return response.json()
+
+    def roles_mutation(self, mutation, role):
+        user_id = to_global_id("UserNode", self.admin.uuid)
+        return f'mutation {{ {mutation}(input: {{userIds: ["{user_id}"], roles: ["{role}"]}}) {{ success }} }}'
+
+    def test_mutation_reloads_rows(self):
+        query = "query { allUsers(first: 10) { edges { node { roles { edges { node { name } } } } } } }"
+        before, _, after = self.post_batch(query, self.roles_mutation("assignRoles", RoleEnum.DEVELOPER.name), query)
+
+        names = lambda entry: {edge["node"]["name"] for edge in entry["data"]["allUsers"]["edges"][0]["node"]["roles"]["edges"]}
+        self.assertEqual(names(before), {RoleEnum.ADMIN.name})
+        self.assertEqual(names(after), {RoleEnum.ADMIN.name, RoleEnum.DEVELOPER.name})
+
+    def test_mutation_reloads_role_names(self):
+        revoked, denied = self.post_batch(
+            self.roles_mutation("revokeRoles", RoleEnum.ADMIN.name),
+            self.roles_mutation("assignRoles", RoleEnum.ADMIN.name),
+        )
+        self.assertTrue(revoked["data"]["revokeRoles"]["success"])
+        self.assertIsNone(denied["data"]["assignRoles"])
+        self.assertFalse(UserRole.objects.filter(user=self.admin).exists())
+
+
+class FakeConnection:
+    # idle outside of a transaction as far as the reset of the postgresql backend is concerned
+    info = SimpleNamespace(transaction_status=postgresql.Database.extensions.TRANSACTION_STATUS_IDLE)
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """
+    Connections are reused up to the size of the pool, the pool of an alias is replaced once the
+    parameters its connections were opened with change.
+    """
+
+    def tearDown(self):
+        pools.pop("test", None)
+
+    def test_reuse(self):
+        pool = ConnectionPool(max_size=1, timeout=0)
+        connection = pool.getconn(FakeConnection)
+        with self.assertRaises(PoolTimeout):
+            pool.getconn(FakeConnection)
+        pool.putconn(connection)
+        self.assertIs(pool.getconn(FakeConnection), connection)
+        self.assertEqual(pool.stats()["opened"], 1)
+
+    def test_replaced_with_parameters(self):
+        pool = get_pool("test", key="dbname=adrift")
+        connection = pool.getconn(FakeConnection)
+        pool.putconn(connection)
+        self.assertIs(get_pool("test", key="dbname=adrift"), pool)
+
+        replaced = get_pool("test", key="dbname=test_adrift")
+        self.assertIsNot(replaced, pool)
+        self.assertTrue(connection.closed)
+        self.assertIsNot(replaced.getconn(FakeConnection), connection)
+
+    def test_replaced_in_use(self):
+        pool = get_pool("test", key="dbname=adrift")
+        connection = pool.getconn(FakeConnection)
+        get_pool("test", key="dbname=test_adrift")
+        self.assertFalse(connection.closed)
+        pool.putconn(connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()["size"], 0)
+
+    # the connections of the postgresql backend, connecting through psycopg2 is left out
+    def get_database(self, name):
+        settings_dict = {
+            **connection.settings_dict,
+            "ENGINE": "core.db.postgresql",
+            "NAME": name,
+            "CONN_MAX_AGE": 0,
+            "CONN_HEALTH_CHECKS": False,
+            "OPTIONS": {"pool": {"max_size": 2}},
+        }
+        return PooledDatabaseWrapper(settings_dict, alias="test")
+
+    def connect(self, database):
+        database.connection = database.get_new_connection(database.get_connection_params())
+        return database.connection
+
+    @mock.patch.object(postgresql.DatabaseWrapper, "get_new_connection", lambda self, conn_params: FakeConnection())
+    def test_backend(self):
+        database = self.get_database("adrift")
+        first = self.connect(database)
+        database._close()
+        self.assertFalse(first.closed)
+        self.assertIs(self.connect(database), first)
+        self.assertEqual(pools["test"].stats()["opened"], 1)
+
+        # the test runner switching to the test database while the connection is in use
+        replaced = self.get_database("test_adrift")
+        second = self.connect(replaced)
+        self.assertIsNot(second, first)
+        database._close()
+        self.assertTrue(first.closed)
+        replaced._close()
+        self.assertFalse(second.closed)
+
+
+class BulkMutationTests(GraphQLQueryTestCase):
+    """
+    Bulk mutations apply every role to every user at once & report each (user, role) pair.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.roles = {role.name: role for role in Role.objects.bulk_create([Role(name=role.name) for role in RoleEnum])}
+        cls.admin = User.objects.create(username="admin", email="admin@example.com")
+        UserRole.objects.create(user=cls.admin, role=cls.roles[RoleEnum.ADMIN.name])
+        cls.users = User.objects.bulk_create([User(username=f"user{index}", email=f"user{index}@example.com") for index in range(3)])
+
+    def setUp(self):
+        cache.clear()
+
+    def mutate_roles(self, mutation, users, roles):
+        query = f"""
+            mutation($userIds: [ID!]!, $roles: [String!]!) {{
+                {mutation}(input: {{userIds: $userIds, roles: $roles}}) {{ success results {{ role success changed error }} }}
+            }}
+        """
+        variables = {"userIds": [to_global_id("UserNode", user.uuid) for user in users], "roles": roles}
+        return self.assertExecutes(query, variables=variables, user=self.admin)[mutation]
+
+    def test_assign_revoke_roles(self):
+        roles = [RoleEnum.DEVELOPER.name]
+        assigned = self.mutate_roles("assignRoles", self.users, roles)
+        self.assertTrue(assigned["success"])
+        self.assertEqual([result["changed"] for result in assigned["results"]], [True] * len(self.users))
+        self.assertFalse(any(result["changed"] for result in self.mutate_roles("assignRoles", self.users, roles)["results"]))
+        self.assertEqual(UserRole.objects.filter(user__in=self.users).count(), len(self.users))
+
+        revoked = self.mutate_roles("revokeRoles", self.users[:2], roles)
+        self.assertEqual([result["changed"] for result in revoked["results"]], [True, True])
+        self.assertEqual(list(UserRole.objects.filter(user__in=self.users).values_list("user_id", flat=True)), [self.users[2].pk])
+
+    def test_revoke_invalidates(self):
+        developer, admin = self.roles[RoleEnum.DEVELOPER.name], self.roles[RoleEnum.ADMIN.name]
+        UserRole.objects.bulk_create([
+            UserRole(user=self.users[0], role=developer),
+            UserRole(user=self.users[1], role=admin),
+            UserRole(user=self.users[2], role=developer),
+        ])
+        self.assertTrue(has_any_role(User.objects.get(pk=self.users[0].pk), [RoleEnum.DEVELOPER.name]))
+
+        revoked = self.mutate_roles("revokeRoles", self.users[:2], [RoleEnum.DEVELOPER.name, RoleEnum.ADMIN.name])
+        self.assertEqual([result["changed"] for result in revoked["results"]], [True, False, False, True])
+        self.assertEqual(list(UserRole.objects.filter(user__in=self.users).values_list("user_id", flat=True)), [self.users[2].pk])
+        self.assertFalse(has_any_role(User.objects.get(pk=self.users[0].pk), [RoleEnum.DEVELOPER.name]))
+
+    def test_unknown_role(self):
+        results = self.mutate_roles("assignRoles", self.users[:1], [RoleEnum.DEVELOPER.name, "UNKNOWN"])
+        self.assertEqual([(result["role"], result["success"], result["error"]) for result in results["results"]], [
+            (RoleEnum.DEVELOPER.name, True, None),
+            ("UNKNOWN", False, "Role does not exist: UNKNOWN"),
+        ])
+
+    def test_create_roles(self):
+        Role.objects.filter(name=RoleEnum.DEVELOPER.name).delete()
+        query = "mutation($names: [String!]!) { createRoles(input: {names: $names}) { success results { name created error } } }"
+        data = self.assertExecutes(query, variables={"names": [RoleEnum.ADMIN.name, RoleEnum.DEVELOPER.name]}, user=self.admin)
+        self.assertEqual([(result["name"], result["created"]) for result in data["createRoles"]["results"]], [
+            (RoleEnum.ADMIN.name, False),
+            (RoleEnum.DEVELOPER.name, True),
+        ])
+        self.assertTrue(Role.objects.filter(name=RoleEnum.DEVELOPER.name).exists())
+
+
+class UniqueUserRoleMigrationTests(TransactionTestCase):
+    """
+    The migration adding the unique (user, role) constraint drops duplicated user roles first.
+    """
+
+    before = [("users", "0004_alter_role_name")]
+    after = [("users", "0005_userrole_unique_user_role")]
+
+    def tearDown(self):
+        MigrationExecutor(connection).migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_duplicates_deleted(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        apps = executor.loader.project_state(self.before).apps
+        OldUser, OldRole, OldUserRole = (apps.get_model("users", name) for name in ("User", "Role", "UserRole"))
+        user = OldUser.objects.create(username="duplicated", email="duplicated@example.com")
+        role = OldRole.objects.create(name=RoleEnum.ADMIN.name)
+        first = OldUserRole.objects.create(user=user, role=role)
+        OldUserRole.objects.create(user=user, role=role)
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.after)
+        self.assertEqual(list(UserRole.objects.values_list("id", flat=True)), [first.id])
+
+
+class QueuedLogHandlerTests(SimpleTestCase):
+    """
+    Records are routed to every destination whose level they reach, in the writer thread.
+    """
+
+    def test_routes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            handler = QueuedLogHandler(
+                {"info.log": {"level": "info", "format": "%(levelname)s %(message)s"}, "error.log": {"level": logging.ERROR}},
+                directory=directory,
+                flush_interval=0.01,
+            )
+            logger = logging.getLogger("tests.queued")
+            logger.addHandler(handler)
+            logger.setLevel(logging.DEBUG)
+            try:
+                logger.debug("skipped")
+                logger.info("hello %s", "there")
+                logger.error("failed")
+            finally:
+                logger.removeHandler(handler)
+                handler.close()
+
+            path = os.path.join(directory, datetime.now().strftime("%Y-%m-%d"))
+            with open(os.path.join(path, "info.log")) as file:
+                self.assertEqual(file.read(), "INFO hello there\nERROR failed\n")
+            with open(os.path.join(path, "error.log")) as file:
+                self.assertEqual(file.read(), "failed\n")
+
+    def test_unknown_level(self):
+        with self.assertRaises(ValueError):
+            QueuedLogHandler({"console": {"level": "LOUD"}})
+
+    # the handlers after it see the record as it was logged
+    def test_record_left_alone(self):
+        handler = QueuedLogHandler({}, flush_interval=0.01)
+        try:
+            raise ValueError("failed")
+        except ValueError:
+            record = logging.LogRecord("tests.queued", logging.ERROR, __file__, 1, "hello %s", ("there",), sys.exc_info())
+        try:
+            prepared = handler.prepare(record)
+        finally:
+            handler.close()
+        self.assertEqual((prepared.msg, prepared.args, prepared.exc_info), ("hello there", None, None))
+        self.assertIn("ValueError: failed", prepared.exc_text)
+        self.assertEqual((record.msg, record.args), ("hello %s", ("there",)))
+        self.assertIs(record.exc_info[0], ValueError)
+
+    def test_dropped(self):
+        handler = QueuedLogHandler({}, max_queue_size=1, flush_interval=0.01)
+        handler.ensure_writer = lambda: None
+        try:
+            for message in ("kept", "dropped", "dropped"):
+                handler.emit(logging.makeLogRecord({"msg": message, "levelname": "INFO", "levelno": logging.INFO}))
+            self.assertEqual(handler.stats()["dropped"], {"INFO": 2})
+            self.assertEqual(handler.get_dropped_records()[0].getMessage(), "Log queue full, dropped 2 records")
+            self.assertEqual(handler.get_dropped_records(), [])
+        finally:
+            handler.close()
+
+
+@override_settings(CORE={**settings.CORE, "EXPORT_CHUNK_SIZE": 2})
+class ExportTests(TestCase):
+    """
+    Exported connections are streamed as ndjson, one node per line, `EXPORT_CHUNK_SIZE` rows at a time.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        role = Role.objects.create(RoleEnum.DEVELOPER.name)
+        # created one by one so each gets its status, unlike the bulk created ones below
+        cls.users = [User.objects.create(username=f"user{index}", email=f"user{index}@example.com") for index in range(5)]
+        UserRole.objects.bulk_create([UserRole(user=user, role=role) for user in cls.users])
+
+    def setUp(self):
+        cache.clear()
+
+    def export(self, data):
+        return self.client.post("/graphql", data, content_type="application/json", headers={"Accept": "application/x-ndjson"})
+
+    def read_lines(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+
+    def test_chunks(self):
+        response = self.export({"query": "{ allUsers { edges { node { username roles { edges { node { name } } } } } } }"})
+        with CaptureQueriesContext(connection) as context:
+            lines = self.read_lines(response)
+
+        self.assertEqual([line["username"] for line in lines], [user.username for user in self.users])
+        self.assertEqual(lines[0]["roles"], {"edges": [{"node": {"name": RoleEnum.DEVELOPER.name}}]})
+        # the roles are prefetched per chunk of at most EXPORT_CHUNK_SIZE users
+        role_queries = [query["sql"] for query in context.captured_queries if "users_userrole" in query["sql"]]
+        self.assertEqual(len(role_queries), 3)
+
+    def test_error_ends_stream(self):
+        # users without a status fail `verified`, they come last so the error hits the third chunk
+        User.objects.bulk_create([User(username=f"zz{index}", email=f"zz{index}@example.com") for index in range(3)])
+        lines = self.read_lines(self.export({"query": "{ allUsers { edges { node { username verified } } } }"}))
+
+        *nodes, error = lines
+        self.assertEqual([node["username"] for node in nodes], [user.username for user in self.users[:4]])
+        self.assertEqual(error["errors"][0]["message"], "User has no status.")
+
+    def test_rejected(self):
+        for data in (
+            {"query": "{ me { username } }"},
+            {"query": "{ allUsers { totalCount } me { username } }"},
+            [{"query": "{ allUsers { edges { node { username } } } }"}],
+        ):
+            response = self.export(data)
+            self.assertEqual(response.status_code, 400, data)
+            self.assertIn("errors", response.json())
+
+
+class TotalCountTests(GraphQLQueryTestCase):
+    """
+    `totalCount` is a single COUNT query, bounded by `COUNT_MAX` & cached per filter.
+    """
+
+    query = "query { allUsers(first: 1) { totalCount totalCountCapped } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create([User(username=f"user{index}", email=f"user{index}@example.com") for index in range(5)])
+
+    def test_count(self):
+        data, queries = self.execute_counted(self.query)
+        self.assertEqual(data["allUsers"], {"totalCount": 5, "totalCountCapped": False})
+        self.assertEqual(len([query for query in queries if "COUNT(" in query["sql"]]), 1)
+
+    def test_capped(self):
+        with override_settings(CORE={**settings.CORE, "COUNT_MAX": 3}):
+            data, _ = self.execute_counted(self.query)
+        self.assertEqual(data["allUsers"], {"totalCount": 3, "totalCountCapped": True})
+
+    def test_cached(self):
+        with override_settings(CORE={**settings.CORE, "COUNT_CACHE_TIMEOUT": 60}):
+            self.execute_counted(self.query)
+            with CaptureQueriesContext(connection) as context:
+                self.assertExecutes(self.query)
+        self.assertFalse([query for query in context.captured_queries if "COUNT(" in query["sql"]])
+
+    def resolve_connection(self, **args):
+        connection = RelayFilterConnectionField.resolve_connection(UserNode._meta.connection, args, User.objects.order_by("username"))
+        return [edge.node.username for edge in connection.edges], connection.page_info
+
+    def test_capped_page(self):
+        with override_settings(CORE={**settings.CORE, "COUNT_MAX": 2}):
+            usernames, page_info = self.resolve_connection()
+            self.assertEqual(len(usernames), 5)
+            self.assertFalse(page_info.has_next_page)
+            usernames, page_info = self.resolve_connection(first=3)
+            self.assertEqual(usernames, ["user0", "user1", "user2"])
+            self.assertTrue(page_info.has_next_page)
+            self.assertFalse(self.resolve_connection(first=5)[1].has_next_page)
+
+    def test_cached_page(self):
+        with override_settings(CORE={**settings.CORE, "COUNT_CACHE_TIMEOUT": 60}):
+            self.assertEqual(count_iterable(User.objects.order_by("username")), (5, False))
+            User.objects.create(username="user5", email="user5@example.com")
+            usernames, page_info = self.resolve_connection(first=10)
+        self.assertEqual(usernames[-1], "user5")
+        self.assertFalse(page_info.has_next_page)
+
+    def test_last(self):
+        usernames, page_info = self.resolve_connection(last=2)
+        self.assertEqual(usernames, ["user3", "user4"])
+        self.assertTrue(page_info.has_previous_page)
+        usernames, page_info = self.resolve_connection(last=2, before=offset_to_cursor(1))
+        self.assertEqual(usernames, ["user0"])
+        self.assertFalse(page_info.has_previous_page)
+
+    def test_offset(self):
+        data = self.assertExecutes("query { allUsers(offset: 3, first: 1) { totalCount edges { node { username } } pageInfo { hasNextPage } } }")
+        self.assertEqual(data["allUsers"]["edges"], [{"node": {"username": "user3"}}])
+        self.assertTrue(data["allUsers"]["pageInfo"]["hasNextPage"])
+        self.assertEqual(data["allUsers"]["totalCount"], 5)
+
+
+class RequestLoadersTests(TestCase):
+    """
+    Rows are kept once per request & their relations are loaded for every row seen at once.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.role = Role.objects.create(RoleEnum.ADMIN.name)
+        cls.users = User.objects.bulk_create([User(username=f"user{index}", email=f"user{index}@example.com") for index in range(3)])
+        UserRole.objects.bulk_create([UserRole(user=user, role=cls.role) for user in cls.users])
+
+    def test_identity_map(self):
+        loaders = RequestLoaders()
+        first = loaders.register(User.objects.only("id").get(pk=self.users[0].pk))
+        second = loaders.register(User.objects.get(pk=self.users[0].pk))
+        self.assertIs(second, first)
+        # the columns the other instance loaded are merged in
+        with self.assertNumQueries(0):
+            self.assertEqual(first.username, "user0")
+
+    def test_batched(self):
+        loaders = RequestLoaders()
+        users = loaders.register_many(User.objects.all())
+        with self.assertNumQueries(1):
+            roles = [loaders.load(user, "roles") for user in users]
+        with self.assertNumQueries(0):
+            self.assertEqual([[role.name for role in user_roles.all()] for user_roles in roles], [[RoleEnum.ADMIN.name]] * 3)
+
+
+class QueryOptimizerTests(GraphQLQueryTestCase):
+    """
+    Only the columns & joins the selection set needs are loaded.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create(username="optimized", email="optimized@example.com", first_name="First", last_name="Last")
+
+    def test_columns(self):
+        data, queries = self.execute_counted("query { allUsers(first: 5) { edges { node { fullName } } } }")
+        self.assertEqual(data["allUsers"]["edges"][0]["node"]["fullName"], "First Last")
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"users_user"."first_name"', queries[0]["sql"])
+        self.assertNotIn('"users_user"."email"', queries[0]["sql"])
+
+    def test_join(self):
+        data, queries = self.execute_counted("query { allUsers(first: 5) { edges { node { username verified } } } }")
+        self.assertEqual(data["allUsers"]["edges"][0]["node"]["verified"], False)
+        self.assertEqual(len(queries), 1)
+        self.assertIn("graphql_auth_userstatus", queries[0]["sql"])
+
+
+@override_settings(CORE={**settings.CORE, "ROLE_CACHE_TIMEOUT": 60})
+class PermissionTests(TestCase):
+    """
+    Role checks look the roles of the user up once per request & share them through the cache.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="admin", email="admin@example.com")
+        UserRole.objects.create(user=cls.user, role=Role.objects.create(RoleEnum.ADMIN.name))
+
+    def setUp(self):
+        cache.clear()
+
+    def test_memoized(self):
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(eval_permission(user, login_required=True, permission_roles=[RoleEnum.ADMIN.name]))
+            self.assertTrue(eval_permission(user, login_required=True, permission_roles=[RoleEnum.ADMIN.name]))
+            with self.assertRaises(Exception):
+                eval_permission(user, login_required=True, permission_roles=[RoleEnum.DEVELOPER.name])
+
+        # another request of the same user is served from the cache
+        with self.assertNumQueries(0):
+            self.assertTrue(has_any_role(User(pk=self.user.pk), [RoleEnum.ADMIN.name]))
+
+    def test_invalidated(self):
+        has_any_role(User.objects.get(pk=self.user.pk), [RoleEnum.ADMIN.name])
+        UserRole.objects.filter(user=self.user).delete()
+        self.assertFalse(has_any_role(User.objects.get(pk=self.user.pk), [RoleEnum.ADMIN.name]))
+
+
+class GraphQLLoggingTests(TestCase):
+    """
+    Errors are logged from the execution result, bodies only for the sampled requests & cut off.
+    """
+
+    def post(self, query):
+        return self.client.post("/graphql", {"query": query}, content_type="application/json")
+
+    def test_errors(self):
+        with self.assertLogs("general", "INFO") as logs:
+            self.post("{ nope }")
+        self.assertEqual(len([line for line in logs.output if "GraphQL Error" in line]), 1)
+        self.assertIn("Cannot query field 'nope'", logs.output[-1])
+
+    def test_sampled_bodies(self):
+        query = "{ allUsers(first: 1) { totalCount } }"
+        with override_settings(CORE={**settings.CORE, "LOG_BODY_SAMPLE_RATE": 0}), self.assertNoLogs("general", "INFO"):
+            self.post(query)
+
+        with override_settings(CORE={**settings.CORE, "LOG_BODY_SAMPLE_RATE": 1, "LOG_BODY_MAX_LENGTH": 10}):
+            with self.assertLogs("general", "INFO") as logs:
+                self.post(query)
+        request_body, response_body = logs.output
+        self.assertIn('Request Body: {"query": ... (', request_body)
+        self.assertIn("GraphQL Data: ", response_body)
+
+
+class ResolverMetricsTests(TestCase):
+    """
+    Fields with a resolver of their own are measured, default resolvers & introspection are not.
+    """
+
+    def post(self, query):
+        return self.client.post("/graphql", {"query": query}, content_type="application/json").json()
+
+    def test_measured(self):
+        stats = resolver_metrics.get("Query.allUsers")
+        calls = stats.calls
+        self.assertNotIn("errors", self.post("{ allUsers(first: 1) { pageInfo { hasNextPage } } }"))
+        self.assertEqual(stats.calls, calls + 1)
+        self.assertNotIn("PageInfo.hasNextPage", resolver_metrics.fields)
+
+    def test_introspection(self):
+        self.assertEqual(self.post("{ __typename allUsers(first: 1) { __typename } }")["data"], {
+            "__typename": "Query",
+            "allUsers": {"__typename": "UserNodeConnection"},
+        })
+
+
+class PersistedQueryTests(TestCase):
+    """
+    Automatic persisted queries: a hash the server does not know yet is answered with
+    PersistedQueryNotFound, the query is then sent once along with its hash.
+    """
+
+    query = "{ allUsers(first: 1) { totalCount } }"
+
+    def setUp(self):
+        cache.clear()
+        document_cache.clear()
+
+    def post(self, query=None, query_hash=None):
+        data = {"extensions": {"persistedQuery": {"version": 1, "sha256Hash": query_hash or get_query_hash(self.query)}}}
+        if query:
+            data["query"] = query
+        return self.client.post("/graphql", data, content_type="application/json").json()
+
+    def test_persisted(self):
+        self.assertEqual(self.post()["errors"][0]["extensions"]["code"], "PERSISTED_QUERY_NOT_FOUND")
+        self.assertEqual(self.post(self.query)["data"], {"allUsers": {"totalCount": 0}})
+        self.assertEqual(self.post()["data"], {"allUsers": {"totalCount": 0}})
+
+    def test_hash_mismatch(self):
+        response = self.post(self.query, query_hash=get_query_hash("{ me { id } }"))
+        self.assertEqual(response["errors"][0]["extensions"]["code"], "PERSISTED_QUERY_HASH_MISMATCH")
+
+
+@override_settings(CORE={**settings.CORE, "RESPONSE_CACHE": True})
+class ResponseCacheTests(TestCase):
+    """
+    Responses of cacheable anonymous queries are served from the cache until a model they were
+    built from changes.
+    """
+
+    query = "{ allUsers(first: 5) { edges { node { username } } } }"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="cached", email="cached@example.com")
+
+    def setUp(self):
+        cache.clear()
+
+    def post(self, query=None, **headers):
+        return self.client.post("/graphql", {"query": query or self.query}, content_type="application/json", headers=headers)
+
+    def usernames(self, response):
+        return [edge["node"]["username"] for edge in response.json()["data"]["allUsers"]["edges"]]
+
+    def test_cached(self):
+        self.post()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.usernames(self.post()), ["cached"])
+
+    def test_invalidated(self):
+        self.post()
+        self.user.username = "renamed"
+        self.user.save()
+        self.assertEqual(self.usernames(self.post()), ["renamed"])
+
+    def test_uncacheable(self):
+        query = "{ allUsers(first: 5) { edges { node { username lastLogin } } } }"
+        self.post(query)
+        with CaptureQueriesContext(connection) as context:
+            self.post(query)
+        self.assertTrue(context.captured_queries)
+
+    def test_authenticated(self):
+        self.post()
+        with CaptureQueriesContext(connection) as context:
+            self.post(Authorization=f"Bearer {get_token(self.user)}")
+        self.assertTrue(context.captured_queries)
+
+
+class KeysetPaginationTests(GraphQLQueryTestCase):
+    """
+    Pages are seeked on the ordering of the connection with keyset cursors.
+    """
+
+    query = """
+        query($first: Int, $after: String, $last: Int, $before: String) {
+            allUsers(first: $first, after: $after, last: $last, before: $before) {
+                pageInfo { hasNextPage hasPreviousPage startCursor endCursor }
+                edges { node { username } }
+            }
+        }
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.bulk_create([User(username=f"user{index}", email=f"user{index}@example.com") for index in range(5)])
+
+    def page(self, **variables):
+        connection = self.assertExecutes(self.query, variables=variables)["allUsers"]
+        return connection["pageInfo"], [edge["node"]["username"] for edge in connection["edges"]]
+
+    def test_forward(self):
+        page_info, usernames = self.page(first=2)
+        self.assertEqual(usernames, ["user0", "user1"])
+        self.assertTrue(page_info["hasNextPage"])
+        self.assertTrue(is_keyset_cursor(page_info["endCursor"]))
+
+        page_info, usernames = self.page(first=2, after=page_info["endCursor"])
+        self.assertEqual(usernames, ["user2", "user3"])
+        page_info, usernames = self.page(first=2, after=page_info["endCursor"])
+        self.assertEqual(usernames, ["user4"])
+        self.assertFalse(page_info["hasNextPage"])
+
+    def test_backward(self):
+        page_info, usernames = self.page(last=2)
+        self.assertEqual(usernames, ["user3", "user4"])
+        self.assertTrue(page_info["hasPreviousPage"])
+
+        _, usernames = self.page(last=2, before=page_info["startCursor"])
+        self.assertEqual(usernames, ["user1", "user2"])
+
+    def test_seek(self):
+        page_info, _ = self.page(first=2)
+        _, queries = self.execute_counted(self.query, variables={"first": 2, "after": page_info["endCursor"]})
+        self.assertNotIn("OFFSET", queries[0]["sql"])
+
+
+class AsyncGraphQLViewTests(TestCase):
+    """
+    The async view executes queries on graphql-core's async executor & mutations synchronously.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username="admin", email="admin@example.com")
+        UserRole.objects.create(user=cls.admin, role=Role.objects.create(RoleEnum.ADMIN.name))
+
+    async def post(self, data, **headers):
+        request = AsyncRequestFactory().post("/graphql", data, content_type="application/json", headers=headers)
+        request.user = AnonymousUser()
+        response = await AsyncGraphQLView.as_view()(request)
+        return json.loads(response.content)
+
+    async def test_query(self):
+        response = await self.post({"query": "{ allUsers(first: 5) { edges { node { username roles { edges { node { name } } } } } } }"})
+        self.assertEqual(response["data"]["allUsers"]["edges"], [
+            {"node": {"username": "admin", "roles": {"edges": [{"node": {"name": RoleEnum.ADMIN.name}}]}}},
+        ])
+
+    async def test_mutation(self):
+        token = await sync_to_async(get_token)(self.admin)
+        query = 'mutation { createRole(input: {name: "DEVELOPER"}) { success role { name } } }'
+        response = await self.post({"query": query}, Authorization=f"Bearer {token}")
+        self.assertEqual(response["data"]["createRole"], {"success": True, "role": {"name": RoleEnum.DEVELOPER.name}})
+        self.assertTrue(await Role.objects.filter(name=RoleEnum.DEVELOPER.name).aexists())
+
+
+class QueryCostTests(TestCase):
+    """
+    Operations over the depth or cost budget are rejected before they execute.
+    """
+
+    def post(self, query):
+        return self.client.post("/graphql", {"query": query}, content_type="application/json").json()
+
+    def test_cost(self):
+        # the connection itself & each of the 100 roles connections cost 1
+        query = "{ allUsers(first: 100) { edges { node { roles(first: 100) { edges { node { name } } } } } } }"
+        with override_settings(CORE={**settings.CORE, "QUERY_MAX_COST": 100}), self.assertNumQueries(0):
+            response = self.post(query)
+        self.assertEqual(response["errors"][0]["extensions"]["code"], "QUERY_COST_EXCEEDED")
+        self.assertNotIn("data", response)
+
+        with override_settings(CORE={**settings.CORE, "QUERY_MAX_COST": 101}):
+            response = self.post(query)
+        self.assertNotIn("errors", response)
+        self.assertEqual(response["extensions"]["cost"]["requested"], 101)
+
+    def test_depth(self):
+        query = "{ allUsers(first: 1) { edges { node { roles(first: 1) { edges { node { users(first: 1) { edges { node { username } } } } } } } } } }"
+        with override_settings(CORE={**settings.CORE, "QUERY_MAX_DEPTH": 5}):
+            response = self.post(query)
+        self.assertEqual(response["errors"][0]["extensions"]["code"], "QUERY_DEPTH_EXCEEDED")
+
+
+class BenchmarkCommandTests(TestCase):
+    """
+    The benchmark seeds, measures & cleans up its own rows only.
+    """
+
+    def benchmark(self, *operations, **options):
+        options = {"users": 5, "iterations": 1, "warmup": 0, "transports": ["schema"], **options}
+        call_command("benchmark", operations=list(operations), stdout=StringIO(), **options)
+
+    def test_report(self):
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            self.benchmark("allUsers", "createRole", output=output.name)
+            report = json.load(output)
+        self.assertEqual(set(report["results"]["schema"]), {"allUsers", "createRole"})
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Role.objects.exists())
+
+    def test_percentile(self):
+        self.assertEqual(percentile([1, 2, 3, 4, 5, 6], 50), 3)
+        self.assertEqual(percentile([1, 2, 3, 4, 5, 6], 95), 6)
+        self.assertEqual(percentile(list(range(1, 101)), 99), 99)
+
+    # nothing loaded for the user is carried over between executions, warmed up or not
+    def test_queries_counted(self):
+        reports = []
+        for warmup in (0, 2):
+            with tempfile.NamedTemporaryFile(suffix=".json") as output:
+                self.benchmark("me", warmup=warmup, output=output.name)
+                reports.append(json.load(output)["results"]["schema"]["me"]["queries"])
+        self.assertEqual(reports[0], reports[1])
+
+    def test_refuses_other_users(self):
+        User.objects.create(username="real", email="real@example.com")
+        with self.assertRaises(CommandError):
+            self.benchmark("allUsers")
+
+    def test_keeps_existing_role(self):
+        user = User.objects.create(username="real", email="real@example.com")
+        UserRole.objects.create(user=user, role=Role.objects.create(RoleEnum.DEVELOPER.name))
+        self.benchmark("createRole", roles=1, force=True)
+        self.assertTrue(UserRole.objects.filter(user=user, role__name=RoleEnum.DEVELOPER.name).exists())
+
+
+class IndexTests(TestCase):
+    """
+    The filter & ordering paths of the schema are indexed & the migrations match the models.
+    """
+
+    def test_migrations(self):
+        call_command("makemigrations", "users", check=True, dry_run=True, stdout=StringIO())
+
+    def test_indexes(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, UserRole._meta.db_table)
+        columns = {tuple(constraint["columns"]) for constraint in constraints.values() if constraint["index"] or constraint["unique"]}
+        # users filtered by role join from the role side, roles of a user from the user side
+        self.assertIn(("role_id", "user_id"), columns)
+        self.assertIn(("user_id", "role_id"), columns)
+        self.assertIn(("created_at", "id"), columns)
+
+    def test_check_indexes(self):
+        output = StringIO()
+        call_command("check_indexes", fail=True, stdout=output)
+        self.assertIn("Every filter & ordering is backed by an index.", output.getvalue())
+
+    # sqlite keeps unique constraints within the table, so the constraint is hidden from the
+    # introspection instead of dropped
+    def test_check_indexes_missing(self):
+        get_constraints = connection.introspection.get_constraints
+
+        def get_constraints_without_unique(cursor, table):
+            constraints = get_constraints(cursor, table)
+            return {name: constraint for name, constraint in constraints.items() if name != "users_userrole_unique_user_role"}
+
+        output = StringIO()
+        with mock.patch.object(connection.introspection, "get_constraints", get_constraints_without_unique):
+            with self.assertRaises(CommandError):
+                call_command("check_indexes", fail=True, stdout=output)
+        self.assertIn("no index on users_userrole (user_id)", output.getvalue())
+
+
+class ReplicaRouterTests(TransactionTestCase):
+    """
+    Reads of query operations go to the replicas, unless the client mutated moments ago, anything
+    else goes to the primary. The default database stands in for a replica, reads routed to the
+    primary are routed to None.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.replicas = override_settings(CORE={**settings.CORE, "REPLICA_DATABASES": ["default"]})
+        self.replicas.enable()
+        self.addCleanup(self.replicas.disable)
+
+    def get_request(self, token="token"):
+        return RequestFactory().post("/graphql", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+    def test_queries(self):
+        self.assertIsNone(self.router.db_for_read(User))
+        with use_replicas(self.get_request()):
+            self.assertEqual(self.router.db_for_read(User), "default")
+            with use_primary():
+                self.assertIsNone(self.router.db_for_read(User))
+            with transaction.atomic():
+                self.assertIsNone(self.router.db_for_read(User))
+        self.assertEqual(self.router.db_for_write(User), "default")
+
+    def test_read_your_writes(self):
+        pin_to_primary(self.get_request())
+        with use_replicas(self.get_request()):
+            self.assertIsNone(self.router.db_for_read(User))
+        with use_replicas(self.get_request("another")):
+            self.assertEqual(self.router.db_for_read(User), "default")
+
+    def test_mutation_pins(self):
+        admin = User.objects.create(username="admin", email="admin@example.com")
+        token = get_token(admin)
+        self.client.post(
+            "/graphql",
+            {"query": 'mutation { createRole(input: {name: "ADMIN"}) { success } }'},
+            content_type="application/json",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        self.assertTrue(is_pinned_to_primary(self.get_request(token)))
+        self.assertFalse(is_pinned_to_primary(self.get_request()))
+
+
+class EncoderTests(TestCase):
+    """
+    Responses are serialized to compact utf-8 json, the same by orjson & the standard library.
+    """
+
+    data = {"id": uuid.UUID(int=1), "price": decimal.Decimal("1.50"), "name": "名前", "nested": [{"date": date(2024, 1, 2)}]}
+
+    def test_encoders(self):
+        expected = {"id": str(uuid.UUID(int=1)), "price": "1.50", "name": "名前", "nested": [{"date": "2024-01-02"}]}
+        for encode in (encode_stdlib, encode_orjson):
+            with self.subTest(encode=encode.__name__):
+                self.assertEqual(json_decode(encode(self.data)), expected)
+                self.assertEqual(json_decode(encode(self.data, pretty=True)), expected)
+                self.assertNotIn(b" ", encode(self.data))
+
+    def test_setting(self):
+        with override_settings(CORE={**settings.CORE, "JSON_ENCODER": "core.encoders.encode_stdlib"}):
+            self.assertEqual(json_encode(self.data), encode_stdlib(self.data))
+
+    def test_response(self):
+        response = self.client.post("/graphql", {"query": "query { __typename }"}, content_type="application/json")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(response.content, json_encode(json_decode(response.content)))
+
+
+class RepeatedQueryTests(TestCase):
+    """
+    In DEBUG, an operation running the same query over & over (e.g. N+1 queries) logs a warning.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create([User(username=f"user{index}", email=f"user{index}@example.com") for index in range(3)])
+
+    def execute(self):
+        # the same root field once per user, each looked up with a query of its own
+        fields = " ".join(
+            f'user{index}: user(id: "{to_global_id("UserNode", user.uuid)}") {{ username }}' for index, user in enumerate(self.users)
+        )
+        response = self.client.post("/graphql", {"query": f"query {{ {fields} }}"}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(DEBUG=True, CORE={**settings.CORE, "REPEATED_QUERY_THRESHOLD": 2})
+    def test_warning(self):
+        with self.assertLogs("general", logging.WARNING) as logs:
+            self.execute()
+        # both queries looking up a user repeat, each warned about once
+        self.assertTrue(logs.output)
+        for output in logs.output:
+            self.assertIn("Query repeated 3 times at ['user2']", output)
+
+    @override_settings(DEBUG=False, CORE={**settings.CORE, "REPEATED_QUERY_THRESHOLD": 2})
+    def test_silent_without_debug(self):
+        with self.assertNoLogs("general", logging.WARNING):
+            self.execute()